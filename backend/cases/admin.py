@@ -9,7 +9,8 @@ from .models import (
     Case, Report, UserCaseView,
     Language, MasterTemplate, MasterTemplateSection,
     CaseTemplate, CaseTemplateSectionContent,
-    AIFeedbackRating # NEW: Import AIFeedbackRating
+    AIFeedbackRating, # NEW: Import AIFeedbackRating
+    FeedbackJob, FeedbackCacheEntry
 )
 
 @admin.register(Language)
@@ -255,3 +256,35 @@ class AIFeedbackRatingAdmin(admin.ModelAdmin):
         return False
 
     # has_delete_permission can be True if admins should be able to delete ratings
+
+
+@admin.register(FeedbackJob)
+class FeedbackJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'report_link', 'requested_by', 'status', 'attempts', 'created_at', 'started_at', 'finished_at')
+    list_filter = ('status',)
+    search_fields = ('report__case__case_identifier', 'requested_by__username', 'error_message')
+    readonly_fields = ('report', 'requested_by', 'attempts', 'worker_id', 'created_at', 'started_at', 'finished_at')
+    list_select_related = ('report__case', 'requested_by')
+
+    def report_link(self, obj):
+        if obj.report:
+            link = reverse("admin:cases_report_change", args=[obj.report.id])
+            return format_html('<a href="{}">Report ID {}</a>', link, obj.report.id)
+        return "-"
+    report_link.short_description = 'Report'
+
+
+@admin.register(FeedbackCacheEntry)
+class FeedbackCacheEntryAdmin(admin.ModelAdmin):
+    list_display = ('cache_key_preview', 'case', 'prompt_version', 'hit_count', 'created_at', 'last_accessed_at')
+    list_filter = ('prompt_version',)
+    search_fields = ('cache_key', 'case__case_identifier')
+    readonly_fields = ('cache_key', 'case', 'prompt_version', 'raw_llm_feedback', 'structured_feedback', 'hit_count', 'created_at', 'last_accessed_at')
+    list_select_related = ('case',)
+
+    def cache_key_preview(self, obj):
+        return obj.cache_key[:12]
+    cache_key_preview.short_description = 'Cache Key'
+
+    def has_add_permission(self, request): # Entries are created by the feedback pipeline
+        return False
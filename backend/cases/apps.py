@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class CasesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'cases'
+
+    def ready(self):
+        # Register signal handlers (cache invalidation on case/template edits)
+        from . import signals  # noqa: F401
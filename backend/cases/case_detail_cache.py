@@ -0,0 +1,90 @@
+# backend/cases/case_detail_cache.py
+import time
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import models
+
+from .models import Case, CaseTemplate
+from .serializers import CaseSerializer
+
+# Configure logger
+logger = logging.getLogger(__name__)
+
+CASE_DETAIL_TTL_SECONDS = getattr(settings, 'CASE_DETAIL_CACHE_TTL_SECONDS', 3600)
+# A request that finds another one building the same payload waits this long before building it too
+BUILD_WAIT_SECONDS = getattr(settings, 'CASE_DETAIL_CACHE_BUILD_WAIT_SECONDS', 2.0)
+BUILD_POLL_INTERVAL_SECONDS = 0.05
+# Expiry of the build lock, in case the process holding it dies
+BUILD_LOCK_SECONDS = 30
+
+# CaseSerializer fields that depend on the requesting user; cached as None and filled in per request
+USER_FIELDS = ('is_viewed_by_user', 'is_reported_by_user')
+
+
+def case_detail_key(case_instance):
+    """
+    Cache key of a case's payload: the case id plus its updated_at. The signals move updated_at
+    whenever anything in the payload changes (expert templates, their section contents and languages,
+    the master template and its sections, the creators), so the version lives in the database and an
+    edit made through one process is seen by every other one.
+    """
+    return f'case_detail:{case_instance.id}:{case_instance.updated_at.isoformat()}'
+
+
+def build_case_detail_payload(case_id):
+    """
+    Serializes a case with CaseSerializer without a request, so the result holds nothing
+    user-specific; the USER_FIELDS are set to None.
+    """
+    case_instance = Case.objects.select_related(
+        'created_by__profile', 'master_template__created_by__profile'
+    ).prefetch_related(
+        'master_template__sections',
+        models.Prefetch('applied_expert_templates', queryset=CaseTemplate.objects.select_related('language')),
+    ).get(pk=case_id)
+    payload = dict(CaseSerializer(case_instance, context={}).data)
+    for field in USER_FIELDS:
+        payload[field] = None
+    return payload
+
+
+def _get_or_build_payload(case_instance):
+    payload_key = case_detail_key(case_instance)
+    payload = cache.get(payload_key)
+    if payload is not None:
+        return payload
+
+    # Stampede protection: one request per payload builds it, concurrent ones wait for its result
+    lock_key = f'{payload_key}:building'
+    if not cache.add(lock_key, True, timeout=BUILD_LOCK_SECONDS):
+        deadline = time.monotonic() + BUILD_WAIT_SECONDS
+        while time.monotonic() < deadline:
+            time.sleep(BUILD_POLL_INTERVAL_SECONDS)
+            payload = cache.get(payload_key)
+            if payload is not None:
+                return payload
+        logger.warning(f"Timed out waiting for the cached detail of case {case_instance.id}; building it")
+    try:
+        payload = build_case_detail_payload(case_instance.id)
+        cache.set(payload_key, payload, timeout=CASE_DETAIL_TTL_SECONDS)
+    finally:
+        cache.delete(lock_key)
+    return payload
+
+
+def get_case_detail(case_instance):
+    """
+    Returns CaseSerializer data for a case, with the user-independent part (the case, its expert
+    templates with their section contents, the master template with its sections) served from the
+    cache. case_instance must carry the user_has_viewed and user_has_reported annotations (see
+    annotate_user_case_flags), which are merged in.
+
+    Payloads are keyed on the case's updated_at (see case_detail_key), so a payload built from data
+    that changed while it was being serialized is stored under the old version and never served.
+    """
+    data = dict(_get_or_build_payload(case_instance))
+    data['is_viewed_by_user'] = bool(case_instance.user_has_viewed)
+    data['is_reported_by_user'] = bool(case_instance.user_has_reported)
+    return data
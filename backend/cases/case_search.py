@@ -0,0 +1,98 @@
+# backend/cases/case_search.py
+from html import escape
+
+from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank
+from django.db import models
+from django.db.models import F, Q, Value
+
+from .models import CASE_SEARCH_CONFIG, Case
+
+# Longest ?q= accepted by the search endpoint
+MAX_SEARCH_QUERY_LENGTH = 200
+
+# Snippet fields: public ones for every user, expert ones only once the user has reported the case
+PUBLIC_SNIPPET_FIELDS = ('title', 'clinical_history')
+EXPERT_SNIPPET_FIELDS = ('diagnosis', 'key_findings', 'discussion')
+
+# ts_headline marks matches with private-use characters, which are swapped for <mark> tags after the
+# rest of the snippet has been HTML-escaped
+_MATCH_START = '\ue000'
+_MATCH_STOP = '\ue001'
+HEADLINE_OPTIONS = {
+    'start_sel': _MATCH_START,
+    'stop_sel': _MATCH_STOP,
+    'max_words': 25,
+    'min_words': 10,
+    'max_fragments': 2,
+    'fragment_delimiter': ' … ',
+}
+
+
+def build_search_query(text):
+    """
+    Parses user search text with websearch syntax: "quoted phrases", OR, and -excluded words.
+    """
+    return SearchQuery(text, search_type='websearch', config=CASE_SEARCH_CONFIG)
+
+
+def search_cases(queryset, query):
+    """
+    Filters cases to those matching query and orders them by rank (then newest published).
+
+    Title and clinical history (search_vector) are searched for every case. The expert answer
+    (expert_search_vector: diagnosis, key findings, discussion) only counts for cases the user has
+    reported, so a search cannot reveal a diagnosis. queryset must carry the user_has_reported
+    annotation (see annotate_user_case_flags). Both vectors have GIN indexes.
+    """
+    expert_visible = Q(user_has_reported=True)
+    expert_rank = models.Case(
+        models.When(expert_visible, then=SearchRank(F('expert_search_vector'), query)),
+        default=Value(0.0),
+        output_field=models.FloatField(),
+    )
+    return (
+        queryset
+        .filter(Q(search_vector=query) | (Q(expert_search_vector=query) & expert_visible))
+        .annotate(search_rank=SearchRank(F('search_vector'), query) + expert_rank)
+        .order_by('-search_rank', '-published_at', '-id')
+    )
+
+
+def _format_snippet(headline):
+    if not headline or _MATCH_START not in headline:
+        return None
+    return escape(headline).replace(_MATCH_START, '<mark>').replace(_MATCH_STOP, '</mark>')
+
+
+def _headlines(case_ids, fields, query):
+    expressions = {
+        f'{field}_headline': SearchHeadline(field, query, config=CASE_SEARCH_CONFIG, **HEADLINE_OPTIONS)
+        for field in fields
+    }
+    return {row['id']: row for row in Case.objects.filter(pk__in=case_ids).values('id', **expressions)}
+
+
+def add_search_snippets(cases, query):
+    """
+    Sets search_snippets on each case of a result page: {field: HTML-escaped fragment with matches
+    in <mark> tags} for every field that matches. Expert fields are only included for cases the
+    user has reported. Headlines are computed for the page only, in at most two queries.
+    """
+    if not cases:
+        return cases
+    public_rows = _headlines([case.id for case in cases], PUBLIC_SNIPPET_FIELDS, query)
+    reported_ids = [case.id for case in cases if getattr(case, 'user_has_reported', False)]
+    expert_rows = _headlines(reported_ids, EXPERT_SNIPPET_FIELDS, query) if reported_ids else {}
+
+    for case in cases:
+        snippets = {}
+        for fields, rows in ((PUBLIC_SNIPPET_FIELDS, public_rows), (EXPERT_SNIPPET_FIELDS, expert_rows)):
+            row = rows.get(case.id)
+            if not row:
+                continue
+            for field in fields:
+                snippet = _format_snippet(row[f'{field}_headline'])
+                if snippet:
+                    snippets[field] = snippet
+        case.search_snippets = snippets
+    return cases
@@ -0,0 +1,171 @@
+# backend/cases/circuit_breaker.py
+import time
+import logging
+
+from django.core.cache import cache
+
+# Configure logger
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+COUNTER_NAMES = ('successes', 'failures', 'rejected', 'opened')
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling a dependency while its circuit breaker is open.
+
+    Attributes:
+        retry_after: Seconds until the breaker lets a probe call through
+    """
+    def __init__(self, name, retry_after):
+        super().__init__(f"Circuit '{name}' is open, retry after {retry_after:.1f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker for an external service, with its state kept in the Django cache so every
+    process sharing the cache (set REDIS_URL in production) sees the same breaker. With the default
+    local-memory cache each process has its own breaker.
+
+    closed:    calls go through; failures within the last window_seconds are counted, and
+               failure_threshold of them open the breaker
+    open:      calls fail fast with CircuitOpenError until recovery_seconds have passed
+    half_open: one probe call is let through; success closes the breaker, failure opens it again,
+               and a probe that never reached the service gives its slot back with release_probe()
+
+    Only failures of the dependency itself (errors, timeouts) should be recorded; invalid requests and
+    content filters are not a sign that the service is down. State updates are read-modify-write on the
+    cache, so concurrent failures may be counted approximately; that only shifts when the breaker opens.
+    """
+    def __init__(self, name, failure_threshold=5, window_seconds=60, recovery_seconds=30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.window_seconds = window_seconds
+        self.recovery_seconds = recovery_seconds
+        self.state_key = f'circuit_breaker:{name}:state'
+        self.probe_key = f'circuit_breaker:{name}:probe'
+
+    def _counter_key(self, counter_name):
+        return f'circuit_breaker:{self.name}:{counter_name}'
+
+    def _increment_counter(self, counter_name):
+        key = self._counter_key(counter_name)
+        # add() is a no-op if the counter exists, so concurrent first increments cannot reset it
+        cache.add(key, 0, timeout=None)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, timeout=None)
+
+    def _load(self):
+        return cache.get(self.state_key) or {'state': CLOSED, 'opened_at': None, 'failures': []}
+
+    def _save(self, state):
+        cache.set(self.state_key, state, timeout=None)
+
+    def _open(self, state, now):
+        state.update({'state': OPEN, 'opened_at': now, 'failures': []})
+        self._save(state)
+        cache.delete(self.probe_key)
+        self._increment_counter('opened')
+        logger.warning(f"Circuit '{self.name}' opened; calls fail fast for {self.recovery_seconds}s")
+
+    def current_state(self):
+        return self._load()['state']
+
+    def before_call(self):
+        """
+        Checks that a call may be made. In the half-open state only the first caller gets through.
+
+        Returns:
+            bool: True if the caller holds the half-open probe slot. The call must then end in
+            record_success or record_failure, or the caller must call release_probe.
+
+        Raises:
+            CircuitOpenError: If the breaker is open, or half-open with a probe already in flight
+        """
+        state = self._load()
+        if state['state'] == CLOSED:
+            return False
+
+        now = time.time()
+        retry_after = state['opened_at'] + self.recovery_seconds - now
+        if state['state'] == OPEN and retry_after > 0:
+            self._increment_counter('rejected')
+            raise CircuitOpenError(self.name, retry_after)
+
+        # Recovery time has passed: let exactly one probe through (the slot expires if the prober dies)
+        if not cache.add(self.probe_key, now, timeout=self.recovery_seconds):
+            self._increment_counter('rejected')
+            raise CircuitOpenError(self.name, self.recovery_seconds)
+        if state['state'] == OPEN:
+            state['state'] = HALF_OPEN
+            self._save(state)
+            logger.info(f"Circuit '{self.name}' half-open, sending a probe call")
+        return True
+
+    def release_probe(self):
+        """
+        Gives up the probe slot taken by before_call when the call did not reach the service (e.g.
+        the rate limiter rejected it), so the next caller probes instead of every call being
+        rejected until the slot expires. Does nothing once the probe has recorded its outcome.
+        """
+        if self._load()['state'] == HALF_OPEN:
+            cache.delete(self.probe_key)
+
+    def record_success(self):
+        self._increment_counter('successes')
+        state = self._load()
+        # Calls that started before the breaker opened do not close it; only the probe does
+        if state['state'] == HALF_OPEN:
+            self._save({'state': CLOSED, 'opened_at': None, 'failures': []})
+            cache.delete(self.probe_key)
+            logger.info(f"Circuit '{self.name}' closed after a successful probe")
+
+    def record_failure(self):
+        self._increment_counter('failures')
+        now = time.time()
+        state = self._load()
+        if state['state'] == HALF_OPEN:
+            self._open(state, now)
+            return
+        if state['state'] == OPEN:
+            return
+
+        state['failures'] = [t for t in state['failures'] if t > now - self.window_seconds] + [now]
+        if len(state['failures']) >= self.failure_threshold:
+            self._open(state, now)
+        else:
+            self._save(state)
+
+    def get_state(self):
+        """
+        Returns the breaker state and its success/failure/rejected/opened counters.
+        """
+        state = self._load()
+        now = time.time()
+        retry_after = None
+        if state['state'] == OPEN:
+            retry_after = round(max(0.0, state['opened_at'] + self.recovery_seconds - now), 1)
+        return {
+            'name': self.name,
+            'state': state['state'],
+            'recent_failures': len([t for t in state['failures'] if t > now - self.window_seconds]),
+            'failure_threshold': self.failure_threshold,
+            'window_seconds': self.window_seconds,
+            'recovery_seconds': self.recovery_seconds,
+            'retry_after': retry_after,
+            **{counter_name: cache.get(self._counter_key(counter_name), 0) for counter_name in COUNTER_NAMES},
+        }
+
+    def reset(self):
+        """
+        Closes the breaker and clears its counters.
+        """
+        cache.delete_many([self.state_key, self.probe_key] + [self._counter_key(name) for name in COUNTER_NAMES])
@@ -0,0 +1,197 @@
+# backend/cases/cohort_comparison.py
+import time
+import logging
+from collections import Counter
+from itertools import islice
+
+import numpy as np
+
+from .models import MasterTemplateSection, Report
+from .expert_bundle import get_expert_bundle
+from .section_similarity import score_texts
+from .utils import generate_report_comparison_summary
+
+# Configure logger
+logger = logging.getLogger(__name__)
+
+# Reports fetched (server-side cursor chunk) and scored together; bounds memory to one n-gram matrix
+# row per report in the batch
+COHORT_BATCH_SIZE = 500
+
+
+class CohortComparisonError(Exception):
+    """
+    Raised when a case's reports cannot be compared (no master or expert template).
+    """
+    def __init__(self, message):
+        super().__init__(message)
+        self.message = message
+
+
+def _enrich_sections(structured_content, master_sections):
+    """
+    Adds section names and orders to a report's stored structured_content, sorted by section order,
+    as ReportSerializer does (without its per-report query).
+    """
+    if not isinstance(structured_content, list):
+        return []
+    enriched_sections = []
+    for item_data in structured_content:
+        enriched_item = dict(item_data)
+        master_section = master_sections.get(item_data.get('master_template_section_id'))
+        if master_section:
+            enriched_item['section_name'] = master_section['name']
+            enriched_item['section_order'] = master_section['order']
+        else:
+            enriched_item['section_name'] = "Unknown/Orphaned Section"
+        enriched_sections.append(enriched_item)
+    return sorted(enriched_sections, key=lambda item: item.get('section_order', float('inf')))
+
+
+def _score_batch(batch_sections, section_vectors):
+    """
+    Scores one batch of reports: for each expert section, the matching section of every report in
+    the batch is vectorized and scored in a single matrix operation.
+
+    Returns:
+        list (aligned with batch_sections) of dicts: master_section_id -> similarity score
+    """
+    batch_similarities = [{} for _ in batch_sections]
+    contents_by_report = [
+        {section.get('master_template_section_id'): section.get('content', "") for section in sections}
+        for sections in batch_sections
+    ]
+    for section_id, expert_vector in section_vectors.items():
+        report_indexes = [index for index, contents in enumerate(contents_by_report) if section_id in contents]
+        if not report_indexes:
+            continue
+        scores = score_texts([contents_by_report[index][section_id] for index in report_indexes], expert_vector)
+        for index, score in zip(report_indexes, scores.tolist()):
+            batch_similarities[index][section_id] = score
+    return batch_similarities
+
+
+def compare_case_cohort(case_instance, include_archived=False):
+    """
+    Runs the programmatic pre-analysis for every report on a case against the case's expert template,
+    e.g. to review how a residency class did. Reports are read in one streamed query and scored in
+    batches; the expert side (section vectors, concept indexes) comes from the cached expert bundle.
+
+    Returns:
+        dict: 'case_id', 'template_id', 'report_count', 'elapsed_ms', 'ms_per_report',
+              'diagnosis_status_counts' ({status: number of reports}),
+              'sections' (per expert section: 'master_template_section_id', 'section_name',
+                          'reports_scored', similarity 'mean'/'median'/'min'/'max',
+                          'identical_count', 'all_concepts_addressed_count',
+                          'missed_key_concepts' [{'concept', 'missed_by'}], most missed first) and
+              'reports' (per report: 'report_id', 'user_id', 'username', 'submitted_at',
+                         'diagnosis_status', 'sections' [{'master_template_section_id', 'section_name',
+                         'similarity_score', 'text_comparison_status', 'key_concepts_status',
+                         'missing_key_concepts'}])
+
+    Raises:
+        CohortComparisonError: If the case has no master template or expert template
+    """
+    started = time.perf_counter()
+    if not case_instance.master_template_id:
+        raise CohortComparisonError("This case does not have an associated master template.")
+    expert_bundle = get_expert_bundle(case_instance)
+    if not expert_bundle:
+        raise CohortComparisonError("No expert template found for this case.")
+
+    master_sections = {
+        section['id']: section
+        for section in MasterTemplateSection.objects.filter(master_template_id=case_instance.master_template_id)
+                                                    .values('id', 'name', 'order')
+    }
+    reports_queryset = Report.objects.filter(case=case_instance)
+    if not include_archived:
+        reports_queryset = reports_queryset.filter(is_archived=False)
+    report_rows = reports_queryset.order_by('user__username', '-submitted_at').values_list(
+        'id', 'user_id', 'user__username', 'submitted_at', 'structured_content'
+    ).iterator(chunk_size=COHORT_BATCH_SIZE)
+
+    case_diagnosis_text = case_instance.diagnosis or ""
+    section_scores = {section_id: [] for section_id in expert_bundle['section_vectors']}
+    identical_counts = Counter()
+    all_addressed_counts = Counter()
+    missed_concepts = {section_id: Counter() for section_id in section_scores}
+    diagnosis_status_counts = Counter()
+    report_results = []
+
+    while True:
+        batch = list(islice(report_rows, COHORT_BATCH_SIZE))
+        if not batch:
+            break
+        batch_sections = [_enrich_sections(row[4], master_sections) for row in batch]
+        batch_similarities = _score_batch(batch_sections, expert_bundle['section_vectors'])
+
+        for (report_id, user_id, username, submitted_at, _), sections, similarities in zip(batch, batch_sections, batch_similarities):
+            summary = generate_report_comparison_summary(
+                user_report_structured_content=sections,
+                expert_section_contents=expert_bundle['section_contents'],
+                case_diagnosis_text=case_diagnosis_text,
+                section_similarities=similarities
+            )
+            diagnosis_status = summary['overall_diagnosis_comparison']['status']
+            diagnosis_status_counts[diagnosis_status] += 1
+
+            report_sections = []
+            for section_comp in summary['section_comparisons']:
+                section_id = section_comp['master_template_section_id']
+                if section_id in section_scores:
+                    section_scores[section_id].append(similarities.get(section_id, 0.0))
+                    if section_comp['text_comparison_status'] in ("Identical", "Nearly Identical"):
+                        identical_counts[section_id] += 1
+                    if section_comp['key_concepts_status'] == "All Addressed":
+                        all_addressed_counts[section_id] += 1
+                    missed_concepts[section_id].update(section_comp['missing_key_concepts'])
+                report_sections.append({
+                    key: section_comp[key] for key in (
+                        'master_template_section_id', 'section_name', 'similarity_score',
+                        'text_comparison_status', 'key_concepts_status', 'missing_key_concepts'
+                    )
+                })
+            report_results.append({
+                'report_id': report_id,
+                'user_id': user_id,
+                'username': username,
+                'submitted_at': submitted_at,
+                'diagnosis_status': diagnosis_status,
+                'sections': report_sections,
+            })
+
+    section_aggregates = []
+    for expert_section in expert_bundle['sections']:
+        section_id = expert_section['master_section_id']
+        scores = np.asarray(section_scores.get(section_id, []), dtype=np.float64)
+        section_aggregates.append({
+            'master_template_section_id': section_id,
+            'section_name': expert_section['master_section_name'],
+            'reports_scored': int(scores.size),
+            'similarity': {
+                'mean': round(float(scores.mean()), 3),
+                'median': round(float(np.median(scores)), 3),
+                'min': round(float(scores.min()), 3),
+                'max': round(float(scores.max()), 3),
+            } if scores.size else None,
+            'identical_count': identical_counts[section_id],
+            'all_concepts_addressed_count': all_addressed_counts[section_id],
+            'missed_key_concepts': [
+                {'concept': concept, 'missed_by': count}
+                for concept, count in missed_concepts.get(section_id, Counter()).most_common()
+            ],
+        })
+
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    logger.info(f"Compared {len(report_results)} reports for case {case_instance.id} in {elapsed_ms:.0f} ms")
+    return {
+        'case_id': case_instance.id,
+        'template_id': expert_bundle['template_id'],
+        'report_count': len(report_results),
+        'elapsed_ms': round(elapsed_ms, 1),
+        'ms_per_report': round(elapsed_ms / len(report_results), 3) if report_results else None,
+        'diagnosis_status_counts': dict(diagnosis_status_counts),
+        'sections': section_aggregates,
+        'reports': report_results,
+    }
@@ -0,0 +1,190 @@
+# backend/cases/concept_index.py
+import re
+
+from .concept_matcher import KeyConceptMatcher, parse_key_concepts
+
+# Bump when normalization changes; stored indexes with another version are rebuilt when used
+CONCEPT_INDEX_VERSION = 2
+
+TOKEN_PATTERN = re.compile(r"[^\W_]+")
+# Negation does not carry across sentences or contrastive conjunctions
+CLAUSE_BOUNDARY_PATTERN = re.compile(r"[.;:!?\n]+|\b(?:but|however|although|though|except|whereas)\b")
+
+NEGATION_CUES = frozenset({
+    'no', 'not', 'without', 'absent', 'absence', 'negative', 'none', 'neither', 'nor', 'never',
+    'excluded', 'unremarkable',
+})
+# Words that negate only when followed by the given word: "free of effusion", but not "free air"
+NEGATION_CUE_PHRASES = frozenset({('free', 'of')})
+# Words that carry no meaning for concept matching ("no evidence of", "is not seen", ...)
+STOPWORDS = frozenset({
+    'a', 'an', 'the', 'of', 'is', 'are', 'was', 'were', 'be', 'been', 'there', 'any', 'evidence',
+    'seen', 'identified', 'present', 'demonstrated', 'visualized', 'visualised', 'noted', 'detected',
+    'to', 'for', 'in', 'on', 'at', 'as', 'by', 'and', 'or', 'with', 'ruled', 'out', 'signs', 'sign',
+})
+# A negation cue before content words negates at most this many of them ("no effusion or pneumothorax")
+NEGATION_WINDOW = 5
+
+
+def light_stem(token):
+    """
+    Reduces inflected forms to a shared stem: plurals (effusions, opacities, masses), -ed and -ing
+    (thickened, thickening). Deliberately light: stems only need to be consistent, and aggressive
+    stemming would merge unrelated medical terms.
+    """
+    if len(token) <= 3 or not token.isalpha():
+        return token
+    if token.endswith('ies') and len(token) > 4:
+        token = token[:-3] + 'y'
+    elif token.endswith('sses'):
+        token = token[:-2]
+    elif token.endswith('es') and not token.endswith(('aes', 'ees', 'oes')):
+        token = token[:-1]
+    elif token.endswith('s') and not token.endswith(('us', 'ss', 'is')):
+        token = token[:-1]
+    if token.endswith('ing') and len(token) > 6:
+        token = token[:-3]
+    elif token.endswith('ed') and len(token) > 5:
+        token = token[:-2]
+    # "masse" (from masses) and "mass", "fracture" and "fractur(ed)" end up the same
+    if token.endswith('e') and len(token) > 4:
+        token = token[:-1]
+    return token
+
+
+def _analyze_clause(words):
+    """
+    Returns (affirmed, negated) stem sets for one clause. A negation cue negates the content words
+    after it (up to NEGATION_WINDOW); a cue with no content words after it ("pneumothorax is not
+    seen", "effusion absent") negates the content words before it.
+    """
+    content = []  # (position, stem) of content words
+    cue_positions = []
+    for position, word in enumerate(words):
+        next_word = words[position + 1] if position + 1 < len(words) else None
+        if word in NEGATION_CUES or (word, next_word) in NEGATION_CUE_PHRASES:
+            cue_positions.append(position)
+        elif word not in STOPWORDS:
+            content.append((position, light_stem(word)))
+
+    negated_positions = set()
+    for cue_position in cue_positions:
+        following = [position for position, _ in content if position > cue_position][:NEGATION_WINDOW]
+        if following:
+            negated_positions.update(following)
+        else:
+            negated_positions.update(position for position, _ in content if position < cue_position)
+
+    affirmed = frozenset(stem for position, stem in content if position not in negated_positions)
+    negated = frozenset(stem for position, stem in content if position in negated_positions)
+    return affirmed, negated
+
+
+def analyze_text(text):
+    """
+    Normalizes free text for concept matching: case-folded, split into clauses and words with
+    punctuation removed, stemmed, and with negated words separated out.
+
+    Returns:
+        list of (affirmed, negated) frozensets of stems, one pair per clause
+    """
+    if not text:
+        return []
+    clauses = []
+    for clause in CLAUSE_BOUNDARY_PATTERN.split(str(text).casefold()):
+        words = TOKEN_PATTERN.findall(clause)
+        if words:
+            clauses.append(_analyze_clause(words))
+    return clauses
+
+
+def normalize_concept(concept):
+    """
+    Returns the stored form of one key concept: {'concept', 'tokens', 'negated'}.
+    'tokens' are the sorted stems a matching clause must contain, 'negated' is True for concepts
+    stating an absence ("no pneumothorax"). Concepts without content words get no tokens.
+    """
+    affirmed, negated = set(), set()
+    for clause_affirmed, clause_negated in analyze_text(concept):
+        affirmed |= clause_affirmed
+        negated |= clause_negated
+    is_negated = bool(negated) and not affirmed
+    return {
+        'concept': concept,
+        'tokens': sorted(negated if is_negated else affirmed | negated),
+        'negated': is_negated,
+    }
+
+
+def build_concept_index(key_concepts_text):
+    """
+    Builds the stored concept index for a section's semicolon-separated key concepts.
+
+    Returns:
+        dict: {'version': CONCEPT_INDEX_VERSION, 'concepts': [normalize_concept(...) per concept]}
+    """
+    return {
+        'version': CONCEPT_INDEX_VERSION,
+        'concepts': [normalize_concept(concept) for concept in parse_key_concepts(key_concepts_text)],
+    }
+
+
+class ConceptIndexMatcher:
+    """
+    Checks which key concepts of a concept index a trainee's text addresses. A concept is addressed
+    when one clause of the text contains all of its stems with the same polarity: "effusions" matches
+    "effusion", "pneumothorax is not seen" matches "no pneumothorax" but "pneumothorax" does not.
+    Concepts without content words (e.g. only stopwords) fall back to a substring match.
+    """
+    def __init__(self, concept_index):
+        entries = concept_index.get('concepts', [])
+        self.concepts = [entry['concept'] for entry in entries]
+        self._requirements = [
+            (frozenset(entry['tokens']), entry['negated']) if entry['tokens'] else None
+            for entry in entries
+        ]
+        self._fallback = KeyConceptMatcher(
+            [entry['concept'] for entry in entries if not entry['tokens']]
+        )
+
+    def missing_concepts(self, text, clauses=None):
+        """
+        Returns the concepts (in expert order, as written by the expert) the text does not address.
+        Pass clauses (analyze_text(text)) to reuse an analysis of the same text.
+        """
+        if clauses is None:
+            clauses = analyze_text(text)
+        fallback_missing = set(self._fallback.missing_concepts(text)) if self._fallback.concepts else set()
+        missing = []
+        for concept, requirement in zip(self.concepts, self._requirements):
+            if requirement is None:
+                addressed = concept not in fallback_missing
+            else:
+                tokens, negated = requirement
+                addressed = any(tokens <= (clause_negated if negated else clause_affirmed)
+                                for clause_affirmed, clause_negated in clauses)
+            if not addressed:
+                missing.append(concept)
+        return missing
+
+
+# Matchers by key_concepts_text; the index is a function of the text (and CONCEPT_INDEX_VERSION)
+_MATCHER_CACHE_SIZE = 1024
+_matchers = {}
+
+
+def get_concept_index_matcher(key_concepts_text, concept_index=None):
+    """
+    Returns the ConceptIndexMatcher for a section's key concepts, built once per process. Uses the
+    index stored on the CaseTemplateSectionContent when it is current; otherwise (not yet backfilled,
+    or built by an older CONCEPT_INDEX_VERSION) normalizes key_concepts_text.
+    """
+    key_concepts_text = key_concepts_text or ""
+    matcher = _matchers.get(key_concepts_text)
+    if matcher is None:
+        if not (concept_index and concept_index.get('version') == CONCEPT_INDEX_VERSION):
+            concept_index = build_concept_index(key_concepts_text)
+        if len(_matchers) >= _MATCHER_CACHE_SIZE:
+            _matchers.clear()
+        matcher = _matchers[key_concepts_text] = ConceptIndexMatcher(concept_index)
+    return matcher
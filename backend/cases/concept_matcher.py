@@ -0,0 +1,94 @@
+# backend/cases/concept_matcher.py
+from collections import deque
+
+# Below this many distinct concepts, one str.__contains__ scan per concept (C speed) beats a
+# single pure-Python pass over the text (see `python manage.py bench_concept_matcher`)
+AUTOMATON_MIN_CONCEPTS = 150
+
+
+class AhoCorasickAutomaton:
+    """
+    Multi-pattern substring search: finds which of many patterns occur in a text in one pass over
+    the text, independent of the number of patterns. Built as a complete DFA (failure links folded
+    into the transitions), so matching does one dict lookup per character.
+    """
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+        transitions = [{}]
+        outputs = [set()]
+        for pattern_index, pattern in enumerate(self.patterns):
+            state = 0
+            for char in pattern:
+                next_state = transitions[state].get(char)
+                if next_state is None:
+                    transitions.append({})
+                    outputs.append(set())
+                    next_state = transitions[state][char] = len(transitions) - 1
+                state = next_state
+            outputs[state].add(pattern_index)
+
+        # Breadth-first: a state's failure target is always shallower, so it is complete by the time it is used
+        failure = [0] * len(transitions)
+        trie_edges = [dict(edges) for edges in transitions]
+        queue = deque(trie_edges[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in trie_edges[state].items():
+                failure[next_state] = transitions[failure[state]].get(char, 0) if state else 0
+                outputs[next_state] |= outputs[failure[next_state]]
+                queue.append(next_state)
+            for char, fallback_state in transitions[failure[state]].items():
+                transitions[state].setdefault(char, fallback_state)
+
+        self._transitions = transitions
+        self._outputs = [frozenset(output) for output in outputs]
+
+    def find(self, text):
+        """
+        Returns the set of indices of the patterns that occur in text.
+        """
+        transitions = self._transitions
+        outputs = self._outputs
+        state = 0
+        found = set()
+        for char in text:
+            state = transitions[state].get(char, 0)
+            if outputs[state]:
+                found |= outputs[state]
+        return found
+
+
+def parse_key_concepts(key_concepts_text):
+    """
+    Splits an expert's semicolon-separated key concepts into a list of trimmed, non-empty concepts.
+    """
+    if not key_concepts_text:
+        return []
+    return [kc.strip() for kc in key_concepts_text.split(';') if kc.strip()]
+
+
+class KeyConceptMatcher:
+    """
+    Checks which of an expert section's key concepts a trainee's text mentions (case-insensitive
+    substring match). Large concept lists are matched with an AhoCorasickAutomaton in one pass.
+    The pre-analysis matches normalized concepts (see concept_index.py) and uses this for concepts
+    without content words.
+    """
+    def __init__(self, concepts, automaton_min_concepts=AUTOMATON_MIN_CONCEPTS):
+        self.concepts = list(concepts)
+        self._patterns = [concept.lower() for concept in self.concepts]
+        distinct_patterns = sorted(set(self._patterns))
+        self._automaton = None
+        if len(distinct_patterns) >= automaton_min_concepts:
+            self._automaton = AhoCorasickAutomaton(distinct_patterns)
+
+    def missing_concepts(self, text):
+        """
+        Returns the concepts (in expert order, as written by the expert) not found in text.
+        """
+        text_lower = (text or "").lower()
+        if self._automaton is None:
+            return [concept for concept, pattern in zip(self.concepts, self._patterns) if pattern not in text_lower]
+        found_patterns = {self._automaton.patterns[index] for index in self._automaton.find(text_lower)}
+        return [concept for concept, pattern in zip(self.concepts, self._patterns) if pattern not in found_patterns]
+
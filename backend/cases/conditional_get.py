@@ -0,0 +1,54 @@
+# backend/cases/conditional_get.py
+import hashlib
+
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+
+def weak_etag(*parts):
+    """
+    Returns a weak ETag ('W/"..."') hashed from parts, e.g. a user id, a path, counts and timestamps.
+    """
+    digest = hashlib.sha256('|'.join(str(part) for part in parts).encode('utf-8')).hexdigest()[:32]
+    return f'W/"{digest}"'
+
+
+def _set_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    # Payloads are per user: browsers must revalidate, shared caches must not store them
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ('Authorization',))
+    return response
+
+
+def conditional_response(request, etag, last_modified, build_response):
+    """
+    Answers a GET whose If-None-Match matches etag with 304 Not Modified, without calling
+    build_response. Otherwise returns build_response() with the ETag and Last-Modified headers set.
+
+    The ETag is the validator: If-Modified-Since alone is not honoured, because deleted rows and
+    nested edits do not move the updated_at maxima that Last-Modified reports.
+    """
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        return _set_validators(not_modified, etag, last_modified)
+    return _set_validators(build_response(), etag, last_modified)
+
+
+class ConditionalListMixin:
+    """
+    Conditional GET for list views. Views implement get_list_validators(queryset), returning the
+    parts of a cheap aggregate over the filtered queryset (counts, updated_at maxima) and the latest
+    modification time. The ETag also covers the user and the full path (filters, page, cursor).
+    """
+
+    def get_list_validators(self, queryset):
+        raise NotImplementedError
+
+    def list(self, request, *args, **kwargs):
+        etag_parts, last_modified = self.get_list_validators(self.filter_queryset(self.get_queryset()))
+        etag = weak_etag(request.user.pk, request.get_full_path(), *etag_parts)
+        build_list = super().list
+        return conditional_response(request, etag, last_modified, lambda: build_list(request, *args, **kwargs))
@@ -0,0 +1,110 @@
+# backend/cases/expert_bundle.py
+import logging
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import models
+
+from .models import CaseTemplate, CaseTemplateSectionContent
+from .serializers import CaseTemplateSectionContentSerializer
+from .llm_feedback_service import PROMPT_VERSION, compile_expert_prompt_parts
+from .section_similarity import build_section_vectors
+
+# Configure logger
+logger = logging.getLogger(__name__)
+
+BUNDLE_TTL_SECONDS = getattr(settings, 'AI_FEEDBACK_EXPERT_BUNDLE_TTL_SECONDS', 24 * 3600)
+
+# The CaseTemplateSectionContent fields used by the pre-analysis and the cache keys, in a picklable form
+ExpertSectionContent = namedtuple('ExpertSectionContent', ['master_section_id', 'content', 'key_concepts_text', 'key_concepts_index'])
+
+
+def get_expert_template_for_case(case_instance):
+    """
+    Returns the expert CaseTemplate used for feedback (prefer English, fallback to any language),
+    with section contents prefetched in section order. Returns None if the case has no expert template.
+    """
+    base_queryset = CaseTemplate.objects.select_related('language') \
+                        .prefetch_related(
+                            models.Prefetch(
+                                'section_contents',
+                                queryset=CaseTemplateSectionContent.objects.select_related('master_section').order_by('master_section__order')
+                            )
+                        )
+
+    expert_template_instance = base_queryset.filter(case=case_instance, language__code='en').first()
+    if not expert_template_instance:
+        expert_template_instance = base_queryset.filter(case=case_instance).first()
+        if expert_template_instance:
+            logger.warning(f"English expert template not found for case {case_instance.id}. Using expert template in language: {expert_template_instance.language.code}")
+    return expert_template_instance
+
+
+def get_case_context_for_llm(case_instance):
+    """
+    Returns the case-level keyword arguments for get_feedback_from_llm.
+    """
+    return {
+        'case_identifier_for_llm': case_instance.case_identifier or f"Case ID {case_instance.id}",
+        'case_patient_age': str(case_instance.patient_age) if case_instance.patient_age else "",
+        'case_patient_sex': case_instance.patient_sex or "",
+        'case_clinical_history': case_instance.clinical_history or "",
+        'case_expert_key_findings': case_instance.key_findings or "",
+        'case_expert_diagnosis': case_instance.diagnosis or "",
+        'case_expert_discussion': case_instance.discussion or "",
+        'case_difficulty': case_instance.get_difficulty_display() or "",
+    }
+
+
+def build_expert_bundle(expert_template, case_instance):
+    """
+    Compiles everything feedback generation derives from an expert template alone.
+
+    Returns:
+        dict: 'template_id', 'language_code',
+              'sections' (CaseTemplateSectionContentSerializer data, in section order),
+              'section_contents' (ExpertSectionContent tuples for the pre-analysis and cache keys),
+              'section_vectors' (n-gram vectors of the section contents, see section_similarity.py) and
+              'prompt_parts' (compile_expert_prompt_parts result: sanitized sections and case
+              context, formatted expert report)
+    """
+    # section_contents is prefetched in section order by get_expert_template_for_case
+    section_content_objects = list(expert_template.section_contents.all())
+    sections = [dict(section) for section in CaseTemplateSectionContentSerializer(section_content_objects, many=True).data]
+    section_contents = tuple(
+        ExpertSectionContent(esc.master_section_id, esc.content, esc.key_concepts_text, esc.key_concepts_index)
+        for esc in section_content_objects
+    )
+    return {
+        'template_id': expert_template.id,
+        'language_code': expert_template.language.code,
+        'sections': sections,
+        'section_contents': section_contents,
+        'section_vectors': build_section_vectors(section_contents),
+        'prompt_parts': compile_expert_prompt_parts(sections, **get_case_context_for_llm(case_instance)),
+    }
+
+
+def get_expert_bundle(case_instance):
+    """
+    Returns the expert bundle (see build_expert_bundle) for the case's feedback template, from the
+    cache when possible. Returns None if the case has no expert template.
+
+    Bundles are keyed on the case's updated_at, which the signals move whenever the case, its expert
+    templates, their section contents or its master template sections change. The version lives in
+    the database, so an edit made through one process is seen by every other one, and a bundle built
+    from data that changed while it was being compiled is stored under the old version and never served.
+    """
+    bundle_key = f'expert_bundle:{case_instance.id}:{PROMPT_VERSION}:{case_instance.updated_at.isoformat()}'
+    bundle = cache.get(bundle_key)
+    if bundle is not None:
+        return bundle
+
+    expert_template_instance = get_expert_template_for_case(case_instance)
+    if not expert_template_instance:
+        return None
+    bundle = build_expert_bundle(expert_template_instance, case_instance)
+    cache.set(bundle_key, bundle, timeout=BUNDLE_TTL_SECONDS)
+    logger.info(f"Compiled expert bundle for case {case_instance.id} from template {expert_template_instance.id}")
+    return bundle
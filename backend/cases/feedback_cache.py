@@ -0,0 +1,186 @@
+# backend/cases/feedback_cache.py
+import re
+import json
+import hashlib
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+from django.utils import timezone
+
+from .models import FeedbackCacheEntry
+from .llm_feedback_service import PROMPT_VERSION
+
+# Configure logger
+logger = logging.getLogger(__name__)
+
+CACHE_ENABLED = getattr(settings, 'AI_FEEDBACK_CACHE_ENABLED', True)
+CACHE_MAX_ENTRIES = getattr(settings, 'AI_FEEDBACK_CACHE_MAX_ENTRIES', 5000)
+CACHE_TTL_SECONDS = getattr(settings, 'AI_FEEDBACK_CACHE_TTL_SECONDS', 30 * 24 * 3600)
+
+HITS_COUNTER_KEY = 'ai_feedback_cache:hits'
+MISSES_COUNTER_KEY = 'ai_feedback_cache:misses'
+
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+
+def normalize_text(text):
+    """
+    Normalizes free text for cache keys: case-folded, trimmed, with runs of whitespace collapsed.
+    """
+    if not text:
+        return ""
+    return WHITESPACE_PATTERN.sub(' ', str(text)).strip().casefold()
+
+
+def compute_feedback_cache_key(user_report_sections, expert_section_contents, case_instance):
+    """
+    Returns a SHA-256 hex digest identifying one LLM feedback request.
+
+    The key covers everything that goes into the prompt: the normalized user sections, the expert
+    section rows (content and key concepts), the case text and the prompt version. Any edit to the
+    expert template or the case therefore produces a different key.
+
+    Args:
+        user_report_sections: Enriched user sections (with 'master_template_section_id', 'section_name', 'content')
+        expert_section_contents: Iterable of CaseTemplateSectionContent objects
+        case_instance: The Case the report belongs to
+    """
+    user_part = sorted(
+        (
+            section.get('master_template_section_id') or 0,
+            normalize_text(section.get('section_name')),
+            normalize_text(section.get('content')),
+        )
+        for section in user_report_sections
+    )
+    expert_part = sorted(
+        (esc.master_section_id, normalize_text(esc.content), normalize_text(esc.key_concepts_text))
+        for esc in expert_section_contents
+    )
+    case_part = [
+        case_instance.id,
+        normalize_text(case_instance.case_identifier),
+        normalize_text(case_instance.difficulty),
+        normalize_text(case_instance.diagnosis),
+        normalize_text(case_instance.key_findings),
+        normalize_text(case_instance.discussion),
+        normalize_text(case_instance.clinical_history),
+        normalize_text(case_instance.patient_age),
+        normalize_text(case_instance.patient_sex),
+    ]
+    payload = json.dumps([PROMPT_VERSION, case_part, expert_part, user_part], separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _increment_counter(key):
+    # add() is a no-op if the counter exists, so concurrent first increments cannot reset it
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, timeout=None)
+
+
+def get_cached_feedback(cache_key, record_miss=True):
+    """
+    Looks up cached feedback by key, honouring the TTL, and records a hit or a miss.
+    Pass record_miss=False for repeat lookups of a request whose miss was already counted.
+
+    Returns:
+        FeedbackCacheEntry or None
+    """
+    if not CACHE_ENABLED:
+        return None
+
+    entry = FeedbackCacheEntry.objects.filter(cache_key=cache_key).first()
+    if entry and entry.created_at < timezone.now() - timedelta(seconds=CACHE_TTL_SECONDS):
+        entry.delete()
+        entry = None
+
+    if not entry:
+        if record_miss:
+            _increment_counter(MISSES_COUNTER_KEY)
+        return None
+
+    _increment_counter(HITS_COUNTER_KEY)
+    FeedbackCacheEntry.objects.filter(pk=entry.pk).update(
+        hit_count=F('hit_count') + 1,
+        last_accessed_at=timezone.now()
+    )
+    logger.info(f"AI feedback cache hit {cache_key[:12]} for case {entry.case_id}")
+    return entry
+
+
+def store_cached_feedback(cache_key, case_instance, raw_llm_feedback, structured_feedback):
+    """
+    Stores generated feedback under the given key and evicts old entries if the cache is over its limits.
+    """
+    if not CACHE_ENABLED:
+        return None
+
+    entry, _ = FeedbackCacheEntry.objects.update_or_create(
+        cache_key=cache_key,
+        defaults={
+            'case': case_instance,
+            'prompt_version': PROMPT_VERSION,
+            'raw_llm_feedback': raw_llm_feedback,
+            'structured_feedback': structured_feedback,
+            'last_accessed_at': timezone.now(),
+        }
+    )
+    evict_feedback_cache()
+    return entry
+
+
+def evict_feedback_cache():
+    """
+    Deletes expired entries, then the least recently used entries beyond CACHE_MAX_ENTRIES.
+
+    Returns:
+        int: Number of entries deleted
+    """
+    expired_cutoff = timezone.now() - timedelta(seconds=CACHE_TTL_SECONDS)
+    deleted, _ = FeedbackCacheEntry.objects.filter(created_at__lt=expired_cutoff).delete()
+
+    overflow = FeedbackCacheEntry.objects.count() - CACHE_MAX_ENTRIES
+    if overflow > 0:
+        lru_ids = list(
+            FeedbackCacheEntry.objects.order_by('last_accessed_at').values_list('id', flat=True)[:overflow]
+        )
+        lru_deleted, _ = FeedbackCacheEntry.objects.filter(id__in=lru_ids).delete()
+        deleted += lru_deleted
+
+    if deleted:
+        logger.info(f"Evicted {deleted} AI feedback cache entries")
+    return deleted
+
+
+def invalidate_case_feedback_cache(case_id):
+    """
+    Drops all cached feedback for a case. Called when the case text or its expert templates change.
+    """
+    deleted, _ = FeedbackCacheEntry.objects.filter(case_id=case_id).delete()
+    if deleted:
+        logger.info(f"Invalidated {deleted} AI feedback cache entries for case {case_id}")
+    return deleted
+
+
+def get_feedback_cache_stats():
+    """
+    Returns hit/miss counters and the current number of cached entries.
+    """
+    hits = cache.get(HITS_COUNTER_KEY, 0)
+    misses = cache.get(MISSES_COUNTER_KEY, 0)
+    total = hits + misses
+    return {
+        'enabled': CACHE_ENABLED,
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / total, 3) if total else None,
+        'entries': FeedbackCacheEntry.objects.count(),
+        'max_entries': CACHE_MAX_ENTRIES,
+        'ttl_seconds': CACHE_TTL_SECONDS,
+    }
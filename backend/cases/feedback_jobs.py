@@ -0,0 +1,234 @@
+# backend/cases/feedback_jobs.py
+import time
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import FeedbackJob, FeedbackJobStatusChoices, Report
+from .feedback_pipeline import FeedbackGenerationError, generate_feedback_for_report
+from .rate_limiter import RateLimitExceeded
+from .circuit_breaker import CircuitOpenError
+
+# Configure logger
+logger = logging.getLogger(__name__)
+
+ACTIVE_JOB_STATUSES = (FeedbackJobStatusChoices.QUEUED, FeedbackJobStatusChoices.RUNNING)
+
+MAX_JOB_ATTEMPTS = getattr(settings, 'AI_FEEDBACK_JOB_MAX_ATTEMPTS', 3)
+STALE_JOB_SECONDS = getattr(settings, 'AI_FEEDBACK_JOB_STALE_SECONDS', 300)
+RETRY_BACKOFF_SECONDS = getattr(settings, 'AI_FEEDBACK_JOB_RETRY_BACKOFF_SECONDS', 10)
+SINGLE_FLIGHT_WAIT_SECONDS = getattr(settings, 'AI_FEEDBACK_SINGLE_FLIGHT_WAIT_SECONDS', 90)
+SINGLE_FLIGHT_POLL_SECONDS = 1.0
+
+
+def _get_or_create_active_job(report, **job_fields):
+    """
+    Returns the report's queued or running job, or creates one with job_fields.
+    The report row is locked while checking, so concurrent requests from any process
+    (double-clicks, client retries) end up with the same job and a single LLM call.
+
+    Returns:
+        tuple: (FeedbackJob, created)
+    """
+    with transaction.atomic():
+        # The lock is held until the transaction commits, after the new job is visible
+        list(Report.objects.select_for_update().filter(pk=report.pk).values_list('pk', flat=True))
+        active_job = FeedbackJob.objects.filter(report=report, status__in=ACTIVE_JOB_STATUSES).order_by('-created_at').first()
+        if active_job:
+            return active_job, False
+        return FeedbackJob.objects.create(report=report, **job_fields), True
+
+
+def enqueue_feedback_job(report, requested_by=None):
+    """
+    Queues AI feedback generation for a report.
+    If the report already has a queued or running job (including a streaming request's), that job
+    is returned instead of a new one.
+
+    Returns:
+        tuple: (FeedbackJob, created)
+    """
+    job, created = _get_or_create_active_job(report, requested_by=requested_by)
+    if created:
+        logger.info(f"Queued AI feedback job {job.id} for report {report.id}")
+    return job, created
+
+
+def start_inline_job(report, worker_id, requested_by=None):
+    """
+    Claims feedback generation for a report on behalf of a process that generates it itself (a
+    streaming request, the generate_feedback command), as a job that is already running (workers
+    only pick up queued jobs). If the report already has an active job, that job is returned with
+    created=False and the caller must not generate feedback for the report.
+
+    Returns:
+        tuple: (FeedbackJob, created)
+    """
+    job, created = _get_or_create_active_job(
+        report, requested_by=requested_by, status=FeedbackJobStatusChoices.RUNNING,
+        started_at=timezone.now(), attempts=1, worker_id=worker_id
+    )
+    if created:
+        logger.info(f"Inline AI feedback job {job.id} for report {report.id} started by {worker_id}")
+    return job, created
+
+
+def touch_job(job):
+    """
+    Resets the start time of a running inline job whose owner is still alive but waiting (e.g. for
+    the rate limit), so requeue_stale_jobs does not hand it to a worker.
+    """
+    job.started_at = timezone.now()
+    FeedbackJob.objects.filter(pk=job.pk, status=FeedbackJobStatusChoices.RUNNING, worker_id=job.worker_id) \
+        .update(started_at=job.started_at)
+
+
+def finish_inline_job(job, error_message=None):
+    """
+    Records the outcome of an inline job: completed, or failed with error_message.
+    """
+    if error_message:
+        _finish_job(job, FeedbackJobStatusChoices.FAILED, error_message)
+    else:
+        _finish_job(job, FeedbackJobStatusChoices.COMPLETED)
+
+
+def release_streaming_job(job):
+    """
+    Hands a streaming job that is still running (the client went away mid-stream) to the workers,
+    so requests waiting on it still get feedback. Does nothing once the job has finished.
+    """
+    if job.status != FeedbackJobStatusChoices.RUNNING:
+        return
+    # Conditional update: the job may have been requeued as stale and claimed by a worker meanwhile
+    released = FeedbackJob.objects.filter(
+        pk=job.pk, status=FeedbackJobStatusChoices.RUNNING, worker_id=job.worker_id
+    ).update(status=FeedbackJobStatusChoices.QUEUED, available_at=timezone.now(), worker_id=None)
+    if released:
+        job.status = FeedbackJobStatusChoices.QUEUED
+        logger.info(f"Streaming AI feedback job {job.id} was interrupted and has been queued for a worker")
+
+
+def wait_for_job(job, timeout_seconds=SINGLE_FLIGHT_WAIT_SECONDS, poll_seconds=SINGLE_FLIGHT_POLL_SECONDS):
+    """
+    Polls a job until it is no longer queued or running, or until timeout_seconds have passed.
+    Returns the refreshed job; check job.is_active for a timeout.
+    """
+    deadline = time.monotonic() + timeout_seconds
+    while True:
+        job.refresh_from_db(fields=['status', 'attempts', 'error_message', 'started_at', 'finished_at'])
+        if not job.is_active or time.monotonic() >= deadline:
+            return job
+        time.sleep(poll_seconds)
+
+
+def claim_next_job(worker_id):
+    """
+    Atomically claims the oldest available queued job and marks it as running.
+    Uses SKIP LOCKED so several worker processes can poll the same table without blocking each other.
+
+    Returns:
+        FeedbackJob or None if the queue is empty
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        job = FeedbackJob.objects.select_for_update(skip_locked=True) \
+            .filter(status=FeedbackJobStatusChoices.QUEUED, available_at__lte=now) \
+            .order_by('available_at', 'id') \
+            .first()
+        if not job:
+            return None
+
+        job.status = FeedbackJobStatusChoices.RUNNING
+        job.started_at = now
+        job.attempts += 1
+        job.worker_id = worker_id
+        job.save(update_fields=['status', 'started_at', 'attempts', 'worker_id'])
+    return job
+
+
+def requeue_stale_jobs(stale_seconds=STALE_JOB_SECONDS):
+    """
+    Puts jobs back on the queue whose worker died while running them.
+
+    Returns:
+        int: Number of jobs requeued
+    """
+    cutoff = timezone.now() - timedelta(seconds=stale_seconds)
+    requeued = FeedbackJob.objects.filter(
+        status=FeedbackJobStatusChoices.RUNNING,
+        started_at__lt=cutoff
+    ).update(status=FeedbackJobStatusChoices.QUEUED, available_at=timezone.now(), worker_id=None)
+    if requeued:
+        logger.warning(f"Requeued {requeued} stale AI feedback job(s) running for more than {stale_seconds}s")
+    return requeued
+
+
+def _finish_job(job, status, error_message=None):
+    job.status = status
+    job.error_message = error_message
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'error_message', 'finished_at'])
+
+
+def _retry_or_fail_job(job, error_message):
+    if job.attempts < MAX_JOB_ATTEMPTS:
+        # Exponential backoff between attempts: 10s, 20s, 40s, ...
+        delay = RETRY_BACKOFF_SECONDS * (2 ** (job.attempts - 1))
+        job.status = FeedbackJobStatusChoices.QUEUED
+        job.error_message = error_message
+        job.available_at = timezone.now() + timedelta(seconds=delay)
+        job.save(update_fields=['status', 'error_message', 'available_at'])
+        logger.warning(f"AI feedback job {job.id} failed (attempt {job.attempts}/{MAX_JOB_ATTEMPTS}), retrying in {delay}s: {error_message}")
+    else:
+        _finish_job(job, FeedbackJobStatusChoices.FAILED, error_message)
+        logger.error(f"AI feedback job {job.id} failed permanently after {job.attempts} attempt(s): {error_message}")
+
+
+def defer_job(job, delay_seconds, reason="the Gemini rate limit"):
+    # Rate limiting (or an open circuit breaker) is not a failure: put the job back without consuming an attempt
+    job.status = FeedbackJobStatusChoices.QUEUED
+    job.attempts = max(0, job.attempts - 1)
+    job.available_at = timezone.now() + timedelta(seconds=delay_seconds)
+    job.save(update_fields=['status', 'attempts', 'available_at'])
+    logger.info(f"AI feedback job {job.id} deferred {delay_seconds:.1f}s by {reason}")
+
+
+def run_feedback_job(job):
+    """
+    Generates and saves AI feedback for a claimed job, then records the outcome on the job.
+    """
+    try:
+        report = Report.objects.select_related('case', 'case__master_template', 'user').get(pk=job.report_id)
+    except Report.DoesNotExist:
+        _finish_job(job, FeedbackJobStatusChoices.FAILED, "Report no longer exists.")
+        return job
+
+    start_time = timezone.now()
+    try:
+        generate_feedback_for_report(report)
+    except RateLimitExceeded as e:
+        defer_job(job, e.retry_after)
+        return job
+    except CircuitOpenError as e:
+        defer_job(job, e.retry_after, reason="the open Gemini circuit breaker")
+        return job
+    except FeedbackGenerationError as e:
+        if e.retryable:
+            _retry_or_fail_job(job, e.message)
+        else:
+            _finish_job(job, FeedbackJobStatusChoices.FAILED, e.message)
+            logger.error(f"AI feedback job {job.id} failed: {e.message}")
+        return job
+    except Exception as e:
+        logger.exception(f"Unexpected error running AI feedback job {job.id}: {e}")
+        _retry_or_fail_job(job, "An unexpected error occurred. Please try again later.")
+        return job
+
+    _finish_job(job, FeedbackJobStatusChoices.COMPLETED)
+    elapsed = (timezone.now() - start_time).total_seconds()
+    logger.info(f"AI feedback job {job.id} for report {report.id} completed in {elapsed:.2f}s")
+    return job
@@ -0,0 +1,501 @@
+# backend/cases/feedback_parser.py
+import re
+import json
+import logging
+
+from .feedback_schema import validate_feedback_response
+
+# Configure logger
+logger = logging.getLogger(__name__)
+
+# Headers of the three parts of the feedback format. They are matched anywhere in a line so that
+# decorated headers ("**1. CRITICAL DISCREPANCIES:**") and several headers on one line still work.
+HEADER_PATTERN = re.compile(
+    r"(?P<critical>1\.\s*CRITICAL\s+DISCREPANCIES:)"
+    r"|(?P<non_critical>2\.\s*NON-CRITICAL\s+DISCREPANCIES:)"
+    r"|(?P<severity>SECTION SEVERITY ASSESSMENT:)",
+    re.IGNORECASE
+)
+# "- You" ends the current discrepancy bullet; it starts a new one only if "You" is a whole word
+BULLET_MARKER_PATTERN = re.compile(r"-\s*You")
+SECTION_MENTION_PATTERN = re.compile(r"(?:in|for)\s+the\s+(\w+)(?:\s+section)?", re.IGNORECASE)
+# Models sometimes wrap JSON output in a Markdown code fence despite response_mime_type
+CODE_FENCE_PATTERN = re.compile(r"^```(?:json)?\s*|\s*```$", re.IGNORECASE)
+NONE_IDENTIFIED_TEXT = "None identified"
+IDENTICAL_SECTION_REASON = "This section is identical to the expert report."
+
+CRITICAL = 'critical'
+NON_CRITICAL = 'non_critical'
+SEVERITY = 'severity'
+
+
+def normalize_severity(severity):
+    """
+    Maps a severity from the LLM to one of our three levels ("Critical", "Moderate", "Consistent").
+    """
+    severity = severity.lower()
+    if severity == "critical":
+        return "Critical"
+    if severity == "moderate":
+        return "Moderate"
+    return "Consistent"
+
+
+class _DiscrepancyList:
+    """
+    Collects the "- You ..." bullets of one discrepancy part, line by line.
+    """
+    def __init__(self):
+        self.none_identified = False
+        self.bullets = []
+        self._current = None
+
+    def feed(self, segment):
+        if NONE_IDENTIFIED_TEXT in segment:
+            self.none_identified = True
+
+        position = 0
+        for marker in BULLET_MARKER_PATTERN.finditer(segment):
+            if self._current is not None:
+                self._current.append(segment[position:marker.start()])
+            self._close_bullet()
+            # "- Your ..." ends the previous bullet without starting a new one
+            if marker.end() == len(segment) or segment[marker.end()].isspace():
+                self._current = []
+            position = marker.end()
+
+        if self._current is not None:
+            self._current.append(segment[position:])
+
+    def _close_bullet(self):
+        if self._current is not None:
+            bullet_content = "\n".join(self._current).strip()
+            if bullet_content:
+                self.bullets.append(bullet_content)
+        self._current = None
+
+    def finish(self):
+        self._close_bullet()
+        return [] if self.none_identified else self.bullets
+
+
+class FeedbackLineParser:
+    """
+    Single-pass, line-oriented state machine over the LLM feedback format:
+
+        1. CRITICAL DISCREPANCIES:      "- You ..." bullets or "None identified."
+        2. NON-CRITICAL DISCREPANCIES:  "- You ..." bullets or "None identified."
+        SECTION SEVERITY ASSESSMENT:    Section:/Severity:/Reason: blocks
+
+    Each line is looked at once; there is no backtracking, so parse time is linear in the length of
+    the response even when it is long or malformed. Lines can be fed as they arrive (see
+    IncrementalFeedbackParser), and complete section assessments are available as soon as the next
+    block starts.
+
+    A Section: block needs a Severity: line and a Reason: line right after it, otherwise it is
+    dropped. The reason runs until the next line starting with "Section:" (or the end of the text).
+    """
+    def __init__(self):
+        self.state = None
+        self.seen_headers = set()
+        self.discrepancies = {CRITICAL: _DiscrepancyList(), NON_CRITICAL: _DiscrepancyList()}
+        # Completed section assessments as (section_name, severity, reason) tuples
+        self.assessments = []
+        self._block = None
+        self._block_stage = None
+
+    @property
+    def has_severity_section(self):
+        return SEVERITY in self.seen_headers
+
+    def feed_line(self, line):
+        position = 0
+        header = HEADER_PATTERN.search(line)
+        while header:
+            if header.lastgroup in self.seen_headers:
+                # Repeated headers are ordinary text
+                header = HEADER_PATTERN.search(line, header.end())
+                continue
+            if header.start() > position:
+                self._feed_segment(line[position:header.start()])
+            self._switch_state(header.lastgroup)
+            position = header.end()
+            header = HEADER_PATTERN.search(line, position)
+
+        if position == 0:
+            self._feed_segment(line)
+        elif position < len(line) and line[position:].strip():
+            self._feed_segment(line[position:])
+
+    def _switch_state(self, new_state):
+        if self.state == SEVERITY:
+            self._close_block()
+        self.seen_headers.add(new_state)
+        self.state = new_state
+
+    def _feed_segment(self, segment):
+        if self.state in self.discrepancies:
+            self.discrepancies[self.state].feed(segment)
+        elif self.state == SEVERITY:
+            self._feed_assessment_line(segment)
+
+    def _feed_assessment_line(self, line):
+        stripped = line.strip()
+        if stripped.startswith("Section:"):
+            self._close_block()
+            section_name = stripped[len("Section:"):].strip()
+            if section_name:
+                self._block = {'name': section_name, 'severity': None, 'reason_lines': []}
+                self._block_stage = 'severity'
+            return
+
+        if self._block is None:
+            return
+        if self._block_stage == 'severity':
+            if stripped.startswith("Severity:"):
+                self._block['severity'] = stripped[len("Severity:"):].strip()
+                self._block_stage = 'reason'
+            else:
+                self._block = None
+        elif self._block_stage == 'reason':
+            if stripped.startswith("Reason:"):
+                self._block['reason_lines'].append(line.lstrip()[len("Reason:"):])
+                self._block_stage = 'in_reason'
+            else:
+                self._block = None
+        else:
+            self._block['reason_lines'].append(line)
+
+    def _close_block(self):
+        if self._block is not None and self._block_stage == 'in_reason':
+            reason = "\n".join(self._block['reason_lines']).strip()
+            self.assessments.append((self._block['name'], self._block['severity'], reason))
+        self._block = None
+        self._block_stage = None
+
+    def finish(self):
+        """
+        Ends the input: closes the last section block. Returns the critical and non-critical bullets.
+        """
+        if self.state == SEVERITY:
+            self._close_block()
+        return self.discrepancies[CRITICAL].finish(), self.discrepancies[NON_CRITICAL].finish()
+
+
+def _discrepancy_entries(bullets, severity_level, identical_section_names):
+    entries = []
+    for bullet_content in bullets:
+        # Extract section name if possible (assuming format like "In the Findings section, you...")
+        section_name = "General"
+        section_match = SECTION_MENTION_PATTERN.search(bullet_content)
+        if section_match:
+            section_name = section_match.group(1).capitalize()
+
+        # Check if this is a programmatically identified identical section
+        is_identical_section = section_name in identical_section_names
+        if is_identical_section:
+            logger.info(f"Overriding '{severity_level}' severity for identical section: {section_name}")
+
+        entries.append({
+            "section_name": section_name,
+            "discrepancy_summary_from_llm": "You " + bullet_content,
+            "severity_level_from_llm": "Consistent" if is_identical_section else severity_level,
+            "severity_justification_from_llm": IDENTICAL_SECTION_REASON if is_identical_section else bullet_content
+        })
+    return entries
+
+
+def _merge_assessments(section_feedback, assessments, identical_section_names):
+    # Create a map to look up existing sections for merging
+    section_feedback_map = {item["section_name"].lower(): item for item in section_feedback}
+
+    for section_name, severity, reason in assessments:
+        # Check if this is one of our programmatically identified identical sections
+        is_identical_section = section_name in identical_section_names
+        if is_identical_section:
+            normalized_severity = "Consistent"
+            reason = reason or IDENTICAL_SECTION_REASON
+            logger.info(f"Programmatically enforcing 'Consistent' severity for identical section: {section_name}")
+        else:
+            normalized_severity = normalize_severity(severity)
+
+        # Check if we already have a feedback entry for this section
+        section_key = section_name.lower()
+        if section_key in section_feedback_map:
+            # Prioritize existing discrepancy feedback but update severity if needed
+            existing_entry = section_feedback_map[section_key]
+
+            # If this is an identical section, always force it to "Consistent"
+            if is_identical_section:
+                existing_entry["severity_level_from_llm"] = "Consistent"
+                existing_entry["severity_justification_from_llm"] = reason
+            # Otherwise only upgrade severity (e.g., from Moderate to Critical), never downgrade
+            elif existing_entry["severity_level_from_llm"] != "Critical" and normalized_severity == "Critical":
+                existing_entry["severity_level_from_llm"] = "Critical"
+                # Update justification if we're upgrading severity
+                existing_entry["severity_justification_from_llm"] = reason
+        else:
+            # Add a new entry if we don't have one yet
+            section_feedback.append({
+                "section_name": section_name,
+                "discrepancy_summary_from_llm": reason,  # Use reason as summary for new entries
+                "severity_level_from_llm": normalized_severity,
+                "severity_justification_from_llm": reason
+            })
+
+
+def _overall_impression(section_feedback, feedback_text):
+    # Set a basic overall impression based on the number of issues found
+    if section_feedback:
+        critical_count = sum(1 for item in section_feedback if item["severity_level_from_llm"] == "Critical")
+        moderate_count = sum(1 for item in section_feedback if item["severity_level_from_llm"] == "Moderate")
+
+        if critical_count > 0:
+            return f"Found {critical_count} critical and {moderate_count} moderate discrepancies that need attention."
+        if moderate_count > 0:
+            return f"Found {moderate_count} moderate discrepancies. Overall alignment is good with minor differences."
+        return "Your report is well-aligned with the expert interpretation."
+
+    # If we couldn't extract any structured feedback, put everything in overall_impression
+    if feedback_text.strip():
+        return "Could not parse detailed structure. Full AI Feedback: \n" + feedback_text
+    return ""
+
+
+def _apply_safety_overrides(section_feedback, identical_section_names):
+    # Check for pneumothorax in critical findings specifically and make sure it's critical
+    for sf in section_feedback:
+        summary = sf.get('discrepancy_summary_from_llm', '').lower()
+        if 'pneumothorax' in summary and sf['severity_level_from_llm'] != 'Critical':
+            logger.warning(f"Found pneumothorax in section {sf['section_name']} but severity is {sf['severity_level_from_llm']}. Upgrading to Critical.")
+            sf['severity_level_from_llm'] = 'Critical'
+            if 'pneumothorax' not in sf['severity_justification_from_llm'].lower():
+                sf['severity_justification_from_llm'] += " Critical due to potential pneumothorax which requires immediate attention."
+
+    # Final check: Ensure all identical sections are consistently marked as "Consistent"
+    if identical_section_names:
+        for sf in section_feedback:
+            section_name = sf.get('section_name')
+            if section_name in identical_section_names and sf['severity_level_from_llm'] != 'Consistent':
+                logger.warning(f"Final check: Section {section_name} was identical but severity was {sf['severity_level_from_llm']}. Correcting to Consistent.")
+                sf['severity_level_from_llm'] = 'Consistent'
+                sf['severity_justification_from_llm'] = IDENTICAL_SECTION_REASON
+
+
+def parse_llm_feedback_text(feedback_text, identical_section_names=None):
+    """
+    Parses the LLM's text output into a more structured format.
+    This handles both the discrepancy list and the section-by-section severity assessment.
+
+    Args:
+        feedback_text: The raw text output from the LLM
+        identical_section_names: Set of section names that were programmatically identified as identical
+    """
+    if not feedback_text or not isinstance(feedback_text, str):
+        logger.error(f"Invalid feedback text received: {type(feedback_text)}")
+        raise ValueError("Invalid feedback text: must be a non-empty string")
+
+    # Initialize identical_section_names to empty set if not provided
+    if identical_section_names is None:
+        identical_section_names = set()
+
+    parsed_feedback = {
+        "overall_impression_alignment": "",
+        "section_feedback": [],
+        "key_learning_points": []
+    }
+
+    logger.debug(f"Parsing LLM feedback text: {feedback_text[:100]}...") # Print first 100 chars
+
+    line_parser = FeedbackLineParser()
+    try:
+        for line in feedback_text.split("\n"):
+            line_parser.feed_line(line)
+        critical_bullets, non_critical_bullets = line_parser.finish()
+
+        section_feedback = parsed_feedback["section_feedback"]
+        section_feedback.extend(_discrepancy_entries(critical_bullets, "Critical", identical_section_names))
+        section_feedback.extend(_discrepancy_entries(non_critical_bullets, "Moderate", identical_section_names))
+
+        if line_parser.has_severity_section:
+            _merge_assessments(section_feedback, line_parser.assessments, identical_section_names)
+            logger.info(f"Extracted {len(line_parser.assessments)} section severity assessments")
+        else:
+            logger.warning("No section-by-section severity assessment found in LLM response")
+    except Exception as e:
+        logger.error(f"Error parsing LLM feedback structure: {str(e)}")
+        # Continue processing even if this part fails
+
+    try:
+        parsed_feedback["overall_impression_alignment"] = _overall_impression(parsed_feedback["section_feedback"], feedback_text)
+    except Exception as e:
+        logger.error(f"Error generating overall impression: {str(e)}")
+        parsed_feedback["overall_impression_alignment"] = "AI feedback was generated but summary extraction encountered an issue."
+
+    # Debug output to verify what we're returning
+    logger.debug(f"- Number of section feedback items: {len(parsed_feedback['section_feedback'])}")
+
+    _apply_safety_overrides(parsed_feedback["section_feedback"], identical_section_names)
+
+    return parsed_feedback
+
+
+def load_feedback_response(feedback_json_text):
+    """
+    Decodes and validates a JSON-mode LLM response (see feedback_schema.FEEDBACK_RESPONSE_SCHEMA).
+    Code fences around the JSON are ignored.
+
+    Raises:
+        ValueError: If the text is not JSON or does not match the schema (json.JSONDecodeError and
+            FeedbackSchemaError are both ValueErrors)
+    """
+    if not feedback_json_text or not isinstance(feedback_json_text, str):
+        raise ValueError("Invalid feedback JSON: must be a non-empty string")
+    return validate_feedback_response(json.loads(CODE_FENCE_PATTERN.sub("", feedback_json_text.strip())))
+
+
+def structured_feedback_from_response(data, identical_section_names=None):
+    """
+    Builds structured feedback from a validated response in the JSON-mode structure (also produced by
+    feedback_text_to_json). Produces the same structure as parse_llm_feedback_text, with the same
+    identical-section and pneumothorax overrides, but without any text parsing: section names come
+    from the response.
+    """
+    if identical_section_names is None:
+        identical_section_names = set()
+
+    section_feedback = []
+    for key, severity_level in (("critical_discrepancies", "Critical"), ("non_critical_discrepancies", "Moderate")):
+        for discrepancy in data[key]:
+            section_name = discrepancy["section_name"].strip() or "General"
+            description = discrepancy["description"].strip()
+            is_identical_section = section_name in identical_section_names
+            section_feedback.append({
+                "section_name": section_name,
+                "discrepancy_summary_from_llm": description,
+                "severity_level_from_llm": "Consistent" if is_identical_section else severity_level,
+                "severity_justification_from_llm": IDENTICAL_SECTION_REASON if is_identical_section else description
+            })
+
+    assessments = [
+        (assessment["section_name"].strip(), assessment["severity"], assessment["reason"].strip())
+        for assessment in data["section_assessments"]
+        if assessment["section_name"].strip()
+    ]
+    _merge_assessments(section_feedback, assessments, identical_section_names)
+
+    structured_feedback = {
+        # The full text is only needed when there is nothing structured to summarise
+        "overall_impression_alignment": _overall_impression(section_feedback, "" if section_feedback else render_feedback_text(data)),
+        "section_feedback": section_feedback,
+        "key_learning_points": []
+    }
+    _apply_safety_overrides(section_feedback, identical_section_names)
+    return structured_feedback
+
+
+def render_feedback_text(data):
+    """
+    Renders a validated JSON-mode response in the text format the prompt asks for in text mode
+    (summary, numbered discrepancy lists, SECTION SEVERITY ASSESSMENT blocks), which is what the
+    frontend displays from raw_llm_feedback.
+    """
+    lines = [data["summary"].strip(), ""]
+    for header, key in (("1. CRITICAL DISCREPANCIES:", "critical_discrepancies"),
+                        ("2. NON-CRITICAL DISCREPANCIES:", "non_critical_discrepancies")):
+        lines.append(header)
+        descriptions = [discrepancy["description"].strip() for discrepancy in data[key]]
+        lines.extend(f"- {description}" for description in descriptions if description)
+        if not any(descriptions):
+            lines.append(f"{NONE_IDENTIFIED_TEXT}.")
+        lines.append("")
+
+    lines.append("SECTION SEVERITY ASSESSMENT:")
+    for assessment in data["section_assessments"]:
+        lines.append(f"Section: {assessment['section_name'].strip()}")
+        lines.append(f"Severity: {assessment['severity']}")
+        lines.append(f"Reason: {assessment['reason'].strip()}")
+        lines.append("")
+    return "\n".join(lines).strip()
+
+
+def feedback_text_to_json(feedback_text):
+    """
+    Converts a response in the text format into the JSON-mode response structure. Used by the fake
+    LLM provider to answer JSON-mode requests from its text scripts.
+    """
+    summary_lines = []
+    for line in feedback_text.split("\n"):
+        if HEADER_PATTERN.search(line):
+            break
+        summary_lines.append(line)
+
+    line_parser = FeedbackLineParser()
+    for line in feedback_text.split("\n"):
+        line_parser.feed_line(line)
+    critical_bullets, non_critical_bullets = line_parser.finish()
+
+    def discrepancies(bullets):
+        entries = []
+        for bullet_content in bullets:
+            section_match = SECTION_MENTION_PATTERN.search(bullet_content)
+            section_name = section_match.group(1).capitalize() if section_match else "General"
+            entries.append({"section_name": section_name, "description": "You " + bullet_content})
+        return entries
+
+    return {
+        "summary": "\n".join(summary_lines).strip(),
+        "critical_discrepancies": discrepancies(critical_bullets),
+        "non_critical_discrepancies": discrepancies(non_critical_bullets),
+        "section_assessments": [
+            {"section_name": section_name, "severity": normalize_severity(severity), "reason": reason}
+            for section_name, severity, reason in line_parser.assessments
+        ],
+    }
+
+
+class IncrementalFeedbackParser:
+    """
+    Extracts section severity assessments from LLM output while it is still streaming.
+
+    Text chunks are passed to feed(), which returns the section assessments completed by that chunk.
+    A section is complete once the next "Section:" block starts; finish() returns the last one.
+    These partial results are only for progress display: the final structure still comes from
+    parse_llm_feedback_text on the full text.
+    """
+    def __init__(self, identical_section_names=None):
+        self.identical_section_names = identical_section_names or set()
+        self.line_parser = FeedbackLineParser()
+        self._partial_line = ""
+        self._emitted = 0
+
+    def _new_sections(self):
+        sections = []
+        for section_name, severity, reason in self.line_parser.assessments[self._emitted:]:
+            sections.append({
+                "section_name": section_name,
+                "severity_level_from_llm": "Consistent" if section_name in self.identical_section_names else normalize_severity(severity),
+                "severity_justification_from_llm": reason
+            })
+        self._emitted = len(self.line_parser.assessments)
+        return sections
+
+    def feed(self, chunk):
+        """
+        Adds a chunk of text and returns a list of newly completed section assessments.
+        """
+        lines = (self._partial_line + chunk).split("\n")
+        self._partial_line = lines.pop()
+        for line in lines:
+            self.line_parser.feed_line(line)
+        return self._new_sections()
+
+    def finish(self):
+        """
+        Returns the final section assessment once the stream has ended, if there is one.
+        """
+        if self._partial_line:
+            self.line_parser.feed_line(self._partial_line)
+            self._partial_line = ""
+        self.line_parser.finish()
+        return self._new_sections()
@@ -0,0 +1,315 @@
+# backend/cases/feedback_pipeline.py
+import logging
+
+from django.db import transaction
+from django.utils import timezone
+
+from .serializers import ReportSerializer
+from .llm_feedback_service import PROMPT_VERSION, OUTPUT_FORMAT, OUTPUT_FORMAT_JSON, OUTPUT_FORMAT_TEXT, get_feedback_from_llm
+from .feedback_parser import (
+    feedback_text_to_json, load_feedback_response, parse_llm_feedback_text, render_feedback_text,
+    structured_feedback_from_response
+)
+from .feedback_reuse import compute_section_hashes, find_reusable_sections, index_feedback_by_section, merge_reused_sections
+from .feedback_cache import compute_feedback_cache_key, get_cached_feedback, store_cached_feedback
+from .expert_bundle import get_case_context_for_llm, get_expert_bundle
+from .rate_limiter import RateLimitExceeded
+from .circuit_breaker import CircuitOpenError
+from .llm_providers import LLMResponseError
+from .pre_analysis import get_or_compute_pre_analysis
+
+# Configure logger
+logger = logging.getLogger(__name__)
+
+# Prefixes used by get_feedback_from_llm for error strings returned instead of feedback
+LLM_ERROR_PREFIXES = ("Sorry, an error occurred", "Sorry, an unexpected error", "AI feedback service", "The AI service")
+
+
+class FeedbackGenerationError(Exception):
+    """
+    Raised when AI feedback cannot be generated for a report.
+
+    Attributes:
+        message: User-facing error message
+        status_code: HTTP status code the API should answer with
+        retryable: True if the failure is transient (LLM/service errors) and the job may be retried
+    """
+    def __init__(self, message, status_code=500, retryable=False):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+        self.retryable = retryable
+
+
+def build_feedback_inputs(user_report):
+    """
+    Collects everything needed for an LLM feedback call for a report: the enriched user sections,
+    the expert sections and prompt parts (from the cached expert bundle), the programmatic
+    pre-analysis and the identical-section lookups.
+
+    Raises:
+        FeedbackGenerationError: If the report, case or expert template cannot support feedback generation
+    """
+    case_instance = user_report.case
+    if not case_instance.master_template:
+        logger.error(f"Case {case_instance.id} has no master template, cannot generate AI feedback")
+        raise FeedbackGenerationError(
+            "This case does not have an associated master template. AI feedback cannot be generated without a structure.",
+            status_code=400
+        )
+
+    # Get user report data
+    user_report_data = ReportSerializer(user_report).data
+    user_report_sections_for_llm = user_report_data.get('structured_content', [])
+
+    if not user_report_sections_for_llm:
+        logger.error(f"User's report {user_report.id} has no content, cannot generate AI feedback")
+        raise FeedbackGenerationError(
+            "User's report content is missing or empty. Cannot generate feedback.",
+            status_code=400
+        )
+
+    # Expert-side data comes from the cached bundle; no queries or string building when it is warm
+    expert_bundle = get_expert_bundle(case_instance)
+    if not expert_bundle:
+        logger.error(f"No expert template found for case {case_instance.id}, cannot generate AI feedback")
+        raise FeedbackGenerationError(
+            "No expert template found for this case. AI feedback cannot be generated.",
+            status_code=400
+        )
+
+    expert_report_sections_for_llm = expert_bundle['sections']
+    expert_section_contents = expert_bundle['section_contents']
+
+    if not expert_report_sections_for_llm:
+        logger.error(f"Expert template {expert_bundle['template_id']} has no content, cannot generate AI feedback")
+        raise FeedbackGenerationError(
+            "Expert report content is missing or empty. Cannot generate feedback.",
+            status_code=400
+        )
+
+    # Programmatic pre-analysis, stored on the report at submission (recomputed if its inputs changed)
+    cache_key = compute_feedback_cache_key(user_report_sections_for_llm, expert_section_contents, case_instance)
+    try:
+        programmatic_pre_analysis = get_or_compute_pre_analysis(
+            user_report, user_report_sections_for_llm, expert_bundle, cache_key
+        )
+    except Exception as e:
+        logger.error(f"Error generating report comparison summary: {str(e)}")
+        raise FeedbackGenerationError("An error occurred during report analysis. Please try again later.")
+
+    # Build a mapping of section IDs to names for use in parsing
+    section_id_to_name_map = {}
+    for section in user_report_sections_for_llm:
+        section_id = section.get('master_template_section_id')
+        section_name = section.get('section_name')
+        if section_id and section_name:
+            section_id_to_name_map[section_id] = section_name
+
+    # Identify identical sections (nearly identical ones need no LLM assessment either)
+    identical_section_ids = set()
+    identical_section_names = set()
+    for section_comp in programmatic_pre_analysis.get('section_comparisons', []):
+        if section_comp.get('text_comparison_status') in ("Identical", "Nearly Identical"):
+            section_id = section_comp.get('master_template_section_id')
+            if section_id:
+                identical_section_ids.add(section_id)
+                if section_id in section_id_to_name_map:
+                    identical_section_names.add(section_id_to_name_map[section_id])
+
+    logger.info(f"Found {len(identical_section_ids)} sections that are identical to expert report")
+
+    return {
+        'user_report_sections': user_report_sections_for_llm,
+        'expert_report_sections': expert_report_sections_for_llm,
+        'expert_prompt_parts': expert_bundle['prompt_parts'],
+        'cache_key': cache_key,
+        'section_hashes': compute_section_hashes(user_report_sections_for_llm, expert_section_contents, case_instance.diagnosis),
+        'programmatic_pre_analysis': programmatic_pre_analysis,
+        'identical_section_ids': identical_section_ids,
+        'identical_section_names': identical_section_names,
+    }
+
+
+def _build_feedback_content(raw_llm_feedback, structured_feedback, feedback_inputs, from_cache=False,
+                            feedback_response=None, reused_sections=None):
+    if feedback_response is None:
+        feedback_response = feedback_text_to_json(raw_llm_feedback)
+    return {
+        "raw_llm_feedback": raw_llm_feedback,
+        "structured_feedback": structured_feedback,
+        "generated_at": timezone.now().isoformat(),
+        "from_cache": from_cache,
+        # Lets bulk regeneration skip reports already generated with the current prompt
+        "prompt_version": PROMPT_VERSION,
+        # Per-section feedback keyed on section hashes, reused when the report is resubmitted
+        "section_index": index_feedback_by_section(
+            feedback_response, feedback_inputs['user_report_sections'], feedback_inputs['section_hashes']
+        ),
+        "reused_sections": sorted(record['section_name'] for record in (reused_sections or {}).values()),
+    }
+
+
+def get_cached_feedback_content(user_report, feedback_inputs=None):
+    """
+    Returns ai_feedback_content for a report from the feedback cache, or None on a miss.
+    Pass feedback_inputs if the caller already built them for this report.
+
+    Raises:
+        FeedbackGenerationError: If the report, case or expert template cannot support feedback generation
+    """
+    if feedback_inputs is None:
+        feedback_inputs = build_feedback_inputs(user_report)
+    cached_entry = get_cached_feedback(feedback_inputs['cache_key'])
+    if not cached_entry:
+        return None
+    return _build_feedback_content(cached_entry.raw_llm_feedback, cached_entry.structured_feedback, feedback_inputs, from_cache=True)
+
+
+def generate_feedback_content(user_report, check_cache=True):
+    """
+    Runs the full feedback pipeline for a report (pre-analysis, cache lookup, LLM call, parsing) and
+    returns the ai_feedback_content dict. Does not save anything and must not be called inside a long transaction.
+
+    Sections unchanged since the user's previous report on the case keep their earlier feedback and
+    are left out of the LLM call. check_cache=False disables both the cache and this reuse.
+
+    Raises:
+        FeedbackGenerationError: If any step fails
+        RateLimitExceeded: If the shared Gemini rate limit has no capacity right now
+        CircuitOpenError: If Gemini has been failing and calls are short-circuited for now
+    """
+    case_instance = user_report.case
+    feedback_inputs = build_feedback_inputs(user_report)
+
+    # Another request may have produced identical feedback since this one was queued
+    if check_cache:
+        cached_entry = get_cached_feedback(feedback_inputs['cache_key'], record_miss=False)
+        if cached_entry:
+            return _build_feedback_content(cached_entry.raw_llm_feedback, cached_entry.structured_feedback, feedback_inputs, from_cache=True)
+
+    reused_sections = {}
+    if check_cache:
+        reused_sections = find_reusable_sections(user_report, feedback_inputs['section_hashes'], feedback_inputs['identical_section_ids'])
+
+    logger.info(f"Starting AI feedback generation for report {user_report.id}")
+    try:
+        ai_feedback_text = get_feedback_from_llm(
+            user_report_sections=feedback_inputs['user_report_sections'],
+            expert_report_sections=feedback_inputs['expert_report_sections'],
+            programmatic_pre_analysis_summary=feedback_inputs['programmatic_pre_analysis'],
+            identical_section_ids=feedback_inputs['identical_section_ids'],
+            output_format=OUTPUT_FORMAT,
+            reused_section_ids=set(reused_sections),
+            expert_prompt_parts=feedback_inputs['expert_prompt_parts'],
+            **get_case_context_for_llm(case_instance)
+        )
+    except (RateLimitExceeded, CircuitOpenError):
+        # Let the caller decide whether to requeue (worker) or reject with Retry-After (request)
+        raise
+    except LLMResponseError as e:
+        logger.error(f"LLM returned no usable feedback for report {user_report.id}: {e.message}")
+        raise FeedbackGenerationError(e.message, retryable=e.retryable)
+    except Exception as e:
+        logger.error(f"Error getting feedback from LLM: {str(e)}")
+        raise FeedbackGenerationError(
+            "An error occurred while generating AI feedback. Please try again later.",
+            retryable=True
+        )
+
+    return finalize_feedback_text(case_instance, feedback_inputs, ai_feedback_text, output_format=OUTPUT_FORMAT,
+                                  reused_sections=reused_sections)
+
+
+def finalize_feedback_text(case_instance, feedback_inputs, ai_feedback_text, output_format=OUTPUT_FORMAT_TEXT,
+                           reused_sections=None):
+    """
+    Turns complete LLM output into ai_feedback_content: checks for LLM error strings, parses the text
+    and stores the result in the feedback cache. Shared by the queued and the streaming paths.
+
+    JSON-mode output that passes schema validation is used as is, and its text rendering is stored as
+    raw_llm_feedback. Output that is not valid JSON or does not match the schema goes through the
+    text parser instead, so an odd response never forces a second LLM call.
+
+    reused_sections (from find_reusable_sections) are merged into the response before it is
+    structured, and the merged feedback is rendered back to text for raw_llm_feedback.
+
+    The result is stored in the feedback cache only if the output validated or parsed into sections.
+    Unstructured output, e.g. cut off at the output token limit, is returned as is but never reused.
+
+    Raises:
+        FeedbackGenerationError: If the LLM returned an error or the text cannot be parsed
+    """
+    # If the LLM response indicates an error, surface the error message to the user
+    if not ai_feedback_text or ai_feedback_text.startswith(LLM_ERROR_PREFIXES):
+        logger.error(f"LLM service returned an error: {ai_feedback_text}")
+        raise FeedbackGenerationError(ai_feedback_text or "No feedback was generated by the AI.", retryable=True)
+
+    # The response in the JSON-mode structure, when the model returned valid JSON or sections are merged
+    feedback_response = None
+    # Whether the LLM output itself validated or parsed into sections, before reused sections are merged
+    cacheable = False
+    if output_format == OUTPUT_FORMAT_JSON:
+        try:
+            feedback_response = load_feedback_response(ai_feedback_text)
+            cacheable = True
+        except ValueError as e:
+            logger.warning(f"LLM JSON feedback failed validation, falling back to the text parser: {str(e)}")
+
+    try:
+        if reused_sections:
+            if feedback_response is None:
+                feedback_response = feedback_text_to_json(ai_feedback_text)
+                cacheable = any(feedback_response[key] for key in ('critical_discrepancies', 'non_critical_discrepancies', 'section_assessments'))
+            merge_reused_sections(feedback_response, reused_sections, feedback_inputs['user_report_sections'])
+
+        if feedback_response is not None:
+            structured_llm_feedback = structured_feedback_from_response(feedback_response, feedback_inputs['identical_section_names'])
+            ai_feedback_text = render_feedback_text(feedback_response)
+        else:
+            structured_llm_feedback = parse_llm_feedback_text(ai_feedback_text, feedback_inputs['identical_section_names'])
+            cacheable = bool(structured_llm_feedback['section_feedback'])
+    except Exception as e:
+        logger.error(f"Error parsing LLM feedback text: {str(e)}")
+        raise FeedbackGenerationError("An error occurred while processing the AI feedback. Please try again later.")
+
+    if cacheable:
+        store_cached_feedback(feedback_inputs['cache_key'], case_instance, ai_feedback_text, structured_llm_feedback)
+    else:
+        logger.warning(f"LLM feedback for case {case_instance.id} has no parseable structure; not caching it")
+
+    return _build_feedback_content(ai_feedback_text, structured_llm_feedback, feedback_inputs,
+                                   feedback_response=feedback_response, reused_sections=reused_sections)
+
+
+def save_feedback_content(user_report, ai_feedback_content):
+    """
+    Stores generated feedback on the report.
+    """
+    user_report.ai_feedback_content = ai_feedback_content
+    user_report.save(update_fields=['ai_feedback_content', 'updated_at'])
+    logger.info(f"Successfully saved AI feedback for report {user_report.id}")
+
+
+def generate_feedback_for_report(user_report):
+    """
+    Generates AI feedback for a report and saves it. Returns the saved ai_feedback_content.
+    """
+    ai_feedback_content = generate_feedback_content(user_report)
+    with transaction.atomic():
+        save_feedback_content(user_report, ai_feedback_content)
+    return ai_feedback_content
+
+
+def precompute_pre_analysis(user_report):
+    """
+    Computes and stores the programmatic pre-analysis of a newly submitted report, so that it can be
+    shown before AI feedback exists and feedback generation does not recompute it. Failures are
+    logged only; the pre-analysis is computed again when feedback is requested.
+    """
+    try:
+        build_feedback_inputs(user_report)
+    except FeedbackGenerationError as e:
+        logger.info(f"No pre-analysis for report {user_report.id}: {e.message}")
+    except Exception:
+        logger.exception(f"Error computing pre-analysis for report {user_report.id}")
@@ -0,0 +1,139 @@
+# backend/cases/feedback_reuse.py
+import json
+import hashlib
+import logging
+
+from .models import Report
+from .feedback_cache import normalize_text
+from .llm_feedback_service import PROMPT_VERSION
+
+# Configure logger
+logger = logging.getLogger(__name__)
+
+# Lists of the feedback response structure (see feedback_schema.FEEDBACK_RESPONSE_SCHEMA) that are split per section
+SECTION_LIST_KEYS = ("critical_discrepancies", "non_critical_discrepancies", "section_assessments")
+
+
+def compute_section_hashes(user_report_sections, expert_section_contents, case_diagnosis=""):
+    """
+    Returns {section_id: SHA-256 hex digest} identifying the feedback for each user section: the
+    normalized user text, the expert text and key concepts for that section, the case diagnosis and
+    the prompt version. A section with the same hash can reuse its earlier feedback.
+
+    Args:
+        user_report_sections: Enriched user sections (with 'master_template_section_id' and 'content')
+        expert_section_contents: Iterable of CaseTemplateSectionContent objects
+        case_diagnosis: The case's diagnosis text
+    """
+    expert_by_section_id = {esc.master_section_id: esc for esc in expert_section_contents}
+    section_hashes = {}
+    for section in user_report_sections:
+        section_id = section.get('master_template_section_id')
+        if not section_id:
+            continue
+        expert_section = expert_by_section_id.get(section_id)
+        payload = json.dumps([
+            PROMPT_VERSION,
+            section_id,
+            normalize_text(section.get('content')),
+            normalize_text(expert_section.content) if expert_section else "",
+            normalize_text(expert_section.key_concepts_text) if expert_section else "",
+            normalize_text(case_diagnosis),
+        ], separators=(',', ':'))
+        section_hashes[section_id] = hashlib.sha256(payload.encode('utf-8')).hexdigest()
+    return section_hashes
+
+
+def _section_ids_by_name(user_report_sections, section_hashes):
+    section_ids = {}
+    for section in user_report_sections:
+        section_id = section.get('master_template_section_id')
+        section_name = section.get('section_name')
+        if section_id in section_hashes and section_name:
+            section_ids[section_name.strip().casefold()] = section_id
+    return section_ids
+
+
+def index_feedback_by_section(feedback_response, user_report_sections, section_hashes):
+    """
+    Splits a feedback response (JSON-mode structure) by report section for reuse by later reports.
+    Entries are matched to sections by name; discrepancies about no particular section ("General")
+    concern the whole report and are not indexed.
+
+    Returns:
+        dict: {str(section_id): {'hash', 'section_name', 'critical_discrepancies',
+               'non_critical_discrepancies', 'section_assessments'}} (string keys, as stored in JSON)
+    """
+    section_ids = _section_ids_by_name(user_report_sections, section_hashes)
+    index = {}
+    for key in SECTION_LIST_KEYS:
+        for entry in feedback_response[key]:
+            section_id = section_ids.get(entry['section_name'].strip().casefold())
+            if section_id is None:
+                continue
+            record = index.get(str(section_id))
+            if record is None:
+                record = {'hash': section_hashes[section_id], 'section_name': entry['section_name'].strip()}
+                record.update({list_key: [] for list_key in SECTION_LIST_KEYS})
+                index[str(section_id)] = record
+            record[key].append(entry)
+    # A section without its own assessment cannot stand on its own in a later report
+    return {section_id: record for section_id, record in index.items() if record['section_assessments']}
+
+
+def find_reusable_sections(user_report, section_hashes, skip_section_ids=None):
+    """
+    Returns {section_id: record} for sections of the report whose text is unchanged since the user's
+    most recent earlier report on the same case (typically the report archived by a case reset),
+    taken from that report's indexed feedback. Only feedback from the current prompt version is used.
+
+    Args:
+        user_report: The report feedback is being generated for
+        section_hashes: From compute_section_hashes for this report
+        skip_section_ids: Sections that need no reuse (e.g. identical to the expert report)
+    """
+    skip_section_ids = skip_section_ids or set()
+    previous_index = (
+        Report.objects
+        .filter(user_id=user_report.user_id, case_id=user_report.case_id,
+                ai_feedback_content__prompt_version=PROMPT_VERSION,
+                ai_feedback_content__has_key='section_index')
+        .exclude(pk=user_report.pk)
+        .order_by('-submitted_at')
+        .values_list('ai_feedback_content__section_index', flat=True)
+        .first()
+    )
+    if not previous_index:
+        return {}
+
+    reusable_sections = {}
+    for section_id, section_hash in section_hashes.items():
+        record = previous_index.get(str(section_id))
+        if section_id not in skip_section_ids and record and record.get('hash') == section_hash:
+            reusable_sections[section_id] = record
+
+    if reusable_sections:
+        logger.info(f"Reusing earlier feedback for {len(reusable_sections)} unchanged section(s) of report {user_report.id}")
+    return reusable_sections
+
+
+def merge_reused_sections(feedback_response, reused_sections, user_report_sections):
+    """
+    Adds the stored entries of reused sections to a feedback response (JSON-mode structure) in place,
+    replacing anything the LLM said about those sections. Section assessments end up in report order.
+    """
+    reused_names = {record['section_name'].casefold() for record in reused_sections.values()}
+    for key in SECTION_LIST_KEYS:
+        entries = [entry for entry in feedback_response[key] if entry['section_name'].strip().casefold() not in reused_names]
+        for record in reused_sections.values():
+            entries.extend(record[key])
+        feedback_response[key] = entries
+
+    section_order = {
+        (section.get('section_name') or '').strip().casefold(): position
+        for position, section in enumerate(user_report_sections)
+    }
+    feedback_response['section_assessments'].sort(
+        key=lambda entry: section_order.get(entry['section_name'].strip().casefold(), len(section_order))
+    )
+    return feedback_response
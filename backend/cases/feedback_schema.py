@@ -0,0 +1,104 @@
+# backend/cases/feedback_schema.py
+SEVERITY_LEVELS = ["Critical", "Moderate", "Consistent"]
+
+_DISCREPANCY_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "section_name": {"type": "string"},
+        "description": {"type": "string"},
+    },
+    "required": ["section_name", "description"],
+}
+
+# Response schema for the JSON output mode. It is sent to Gemini as response_schema (the OpenAPI
+# subset the API accepts: type, properties, required, items, enum) and validates the response here.
+FEEDBACK_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "summary": {"type": "string"},
+        "critical_discrepancies": {"type": "array", "items": _DISCREPANCY_SCHEMA},
+        "non_critical_discrepancies": {"type": "array", "items": _DISCREPANCY_SCHEMA},
+        "section_assessments": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "section_name": {"type": "string"},
+                    "severity": {"type": "string", "enum": SEVERITY_LEVELS},
+                    "reason": {"type": "string"},
+                },
+                "required": ["section_name", "severity", "reason"],
+            },
+        },
+    },
+    "required": ["summary", "critical_discrepancies", "non_critical_discrepancies", "section_assessments"],
+}
+
+_JSON_TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "boolean": bool,
+}
+
+
+class FeedbackSchemaError(ValueError):
+    """
+    Raised when an LLM JSON response does not match FEEDBACK_RESPONSE_SCHEMA.
+    """
+
+
+def compile_schema(schema, path="$"):
+    """
+    Turns a schema dict into a validation function, so the schema is walked once at import time
+    instead of on every response. The function raises FeedbackSchemaError naming the first invalid path.
+
+    Supports the keywords used by FEEDBACK_RESPONSE_SCHEMA: type (object, array, string, boolean),
+    properties, required, items and enum. Unknown object keys are allowed.
+    """
+    expected_type = _JSON_TYPES[schema["type"]]
+    checks = []
+
+    if "enum" in schema:
+        allowed = frozenset(schema["enum"])
+
+        def check_enum(value, value_path):
+            if value not in allowed:
+                raise FeedbackSchemaError(f"{value_path}: {value!r} is not one of {sorted(allowed)}")
+        checks.append(check_enum)
+
+    if schema["type"] == "object":
+        required = tuple(schema.get("required", ()))
+        property_validators = tuple(
+            (name, compile_schema(property_schema, f"{path}.{name}"))
+            for name, property_schema in schema.get("properties", {}).items()
+        )
+
+        def check_object(value, value_path):
+            for name in required:
+                if name not in value:
+                    raise FeedbackSchemaError(f"{value_path}: missing required key '{name}'")
+            for name, validator in property_validators:
+                if name in value:
+                    validator(value[name], f"{value_path}.{name}")
+        checks.append(check_object)
+
+    elif schema["type"] == "array" and "items" in schema:
+        item_validator = compile_schema(schema["items"], f"{path}[]")
+
+        def check_items(value, value_path):
+            for index, item in enumerate(value):
+                item_validator(item, f"{value_path}[{index}]")
+        checks.append(check_items)
+
+    def validate(value, value_path=path):
+        if not isinstance(value, expected_type):
+            raise FeedbackSchemaError(f"{value_path}: expected {schema['type']}, got {type(value).__name__}")
+        for check in checks:
+            check(value, value_path)
+        return value
+
+    return validate
+
+
+validate_feedback_response = compile_schema(FEEDBACK_RESPONSE_SCHEMA)
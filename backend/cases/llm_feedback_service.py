@@ -1,39 +1,40 @@
 # backend/cases/llm_feedback_service.py
-import os
 import re
-import time
 import logging
-import google.generativeai as genai
-from google.api_core.exceptions import GoogleAPIError
-import traceback
-from functools import lru_cache
+
 from django.conf import settings
 
+from .llm_providers import get_llm_provider
+
 # Configure logger
 logger = logging.getLogger(__name__)
 
-# --- Module-level configuration ---
-GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
-IS_GEMINI_CONFIGURED = False
-
 # Compile regex patterns once for reuse
 PROMPT_INJECTION_PATTERN = re.compile(r'(ignore previous instructions|ignore above instructions|stop using template|exit role)', re.IGNORECASE)
 
-# Rate limiting settings
-MAX_CALLS_PER_MINUTE = getattr(settings, 'GEMINI_API_RATE_LIMIT', 10)
-API_CALL_HISTORY = []
-
-if GEMINI_API_KEY:
-    try:
-        genai.configure(api_key=GEMINI_API_KEY)
-        IS_GEMINI_CONFIGURED = True
-        logger.info("Gemini API configured successfully at module load.")
-    except Exception as e:
-        logger.error(f"Error configuring Gemini API at module load: {e}")
-        IS_GEMINI_CONFIGURED = False
-else:
-    logger.warning("GEMINI_API_KEY environment variable not found at module load.")
-# --- End Module-level configuration ---
+# Bump whenever the prompt or the expected response format changes (invalidates cached feedback)
+PROMPT_VERSION = "2025-06-compact-prompt-v6"
+
+# Prompt size controls. Tokens are estimated from characters (about 4 per token for English text),
+# which avoids a count_tokens round trip to the API before every call.
+CHARS_PER_TOKEN = 4
+PROMPT_TOKEN_BUDGET = getattr(settings, 'AI_FEEDBACK_PROMPT_TOKEN_BUDGET', 6000)
+MAX_OUTPUT_TOKENS = getattr(settings, 'AI_FEEDBACK_MAX_OUTPUT_TOKENS', 2048)
+OUTPUT_TOKENS_BASE = 250                # Summary sentence and discrepancy lists
+OUTPUT_TOKENS_PER_SECTION = 120         # Section/Severity/Reason block plus discrepancy bullets
+OUTPUT_TOKENS_PER_IDENTICAL_SECTION = 30
+MIN_TRIMMED_FIELD_CHARS = 300           # Budget trimming never shortens a field below this
+DEDUPE_MIN_FIELD_CHARS = 80             # Shorter case fields are always sent, even if repeated in the expert report
+TRUNCATION_MARKER = "... [truncated to fit prompt budget]"
+PREVIOUSLY_ASSESSED_STUB = "[PREVIOUSLY ASSESSED]"  # Replaces sections whose earlier feedback is reused
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+# Response format requested from the LLM: 'text' (the CRITICAL DISCREPANCIES / SECTION SEVERITY
+# ASSESSMENT format, parsed by feedback_parser) or 'json' (schema-constrained JSON, validated against
+# feedback_schema.FEEDBACK_RESPONSE_SCHEMA). Streaming always uses text, which can be shown as it arrives.
+OUTPUT_FORMAT_TEXT = 'text'
+OUTPUT_FORMAT_JSON = 'json'
+OUTPUT_FORMAT = getattr(settings, 'AI_FEEDBACK_LLM_OUTPUT_FORMAT', OUTPUT_FORMAT_TEXT)
 
 def sanitize_text(text):
     """
@@ -57,51 +58,87 @@ def sanitize_text(text):
         
     return sanitized
 
-def format_report_for_llm(structured_content_list, highlight_different_sections=False, identical_section_ids=None):
+def estimate_tokens(text):
     """
-    Helper to format structured report content into a readable string for the LLM.
-    
+    Estimates the number of tokens in a string (rounded up).
+    """
+    return (len(text or "") + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def estimate_output_token_budget(user_report_sections, identical_section_ids=None, reused_section_ids=None):
+    """
+    Returns max_output_tokens for a feedback call: a fixed allowance for the summary and discrepancy
+    lists plus one per section, capped at MAX_OUTPUT_TOKENS. Identical sections only need a short
+    "Consistent" block, and previously assessed sections are not assessed again.
+    """
+    short_section_ids = (identical_section_ids or set()) | (reused_section_ids or set())
+    budget = OUTPUT_TOKENS_BASE
+    for section in user_report_sections or []:
+        if section.get('master_template_section_id') in short_section_ids:
+            budget += OUTPUT_TOKENS_PER_IDENTICAL_SECTION
+        else:
+            budget += OUTPUT_TOKENS_PER_SECTION
+    return min(budget, MAX_OUTPUT_TOKENS)
+
+def _normalize_for_comparison(text):
+    return WHITESPACE_PATTERN.sub(' ', text or '').strip().casefold()
+
+def _trim_text(text, max_chars):
+    if len(text) <= max_chars:
+        return text
+    return text[:max(0, max_chars - len(TRUNCATION_MARKER))].rstrip() + TRUNCATION_MARKER
+
+def _normalize_sections(sections, identical_section_ids, reused_section_ids=None):
+    """
+    Converts user sections (ReportSerializer) and expert sections (CaseTemplateSectionContentSerializer)
+    into one shape: {'id', 'name', 'order', 'content', 'identical', 'reused'}, sorted by section order.
+    """
+    identical_section_ids = identical_section_ids or set()
+    reused_section_ids = reused_section_ids or set()
+    normalized = []
+    for section in sections or []:
+        section_id = section.get('master_template_section_id', section.get('master_section_id'))
+        order = section.get('section_order', section.get('master_section_order'))
+        normalized.append({
+            'id': section_id,
+            'name': sanitize_text(section.get('section_name') or section.get('master_section_name') or 'Unnamed Section'),
+            'order': order if isinstance(order, (int, float)) else float('inf'),
+            'content': sanitize_text(section.get('content', '')).strip(),
+            'identical': section_id is not None and section_id in identical_section_ids,
+            'reused': section_id is not None and section_id in reused_section_ids,
+        })
+    # sorted() is stable, so sections without an order keep their original relative order
+    return sorted(normalized, key=lambda section: section['order'])
+
+def format_report_for_llm(sections, identical_stub):
+    """
+    Helper to format normalized report sections into a readable string for the LLM.
+    Sections identical to the expert report, and sections whose earlier feedback is reused, are sent
+    as a one-line stub instead of their content.
+
     Args:
-        structured_content_list: List of section content dictionaries
-        highlight_different_sections: If True, will mark sections that differ from expert report
-        identical_section_ids: Set of section IDs that are identical to expert report (used with highlight_different_sections)
+        sections: Sections from _normalize_sections
+        identical_stub: Tag used for identical sections, e.g. "[IDENTICAL TO EXPERT REPORT]"
     """
-    if not structured_content_list:
+    if not sections:
         return "No content provided for this report."
-    
+
     report_text = []
-    try:
-        # Sort by section_order if available, to ensure consistent input to LLM
-        # Ensure section_order is treated as a number for sorting, defaulting if not present
-        sorted_sections = sorted(
-            structured_content_list, 
-            key=lambda x: x.get('section_order', float('inf')) if isinstance(x.get('section_order'), (int, float)) else float('inf')
-        )
-    except TypeError:
-        logger.warning("Could not sort report sections by order (possibly due to mixed types or missing 'section_order'). Using original order.")
-        sorted_sections = structured_content_list
-
-    for section in sorted_sections:
-        section_name = sanitize_text(section.get('section_name', 'Unnamed Section'))
-        content = sanitize_text(section.get('content', '')).strip()
-        section_id = section.get('master_template_section_id')
-        
-        if not content: 
-            content = "N/A" # Represent empty sections clearly
-            
-        # Mark if this section is identical to expert report (for optimization)
-        if highlight_different_sections and identical_section_ids and section_id in identical_section_ids:
-            # If section is identical, mark it for the LLM
-            report_text.append(f"Section: {section_name} [IDENTICAL TO EXPERT REPORT]\nContent: {content}\n")
+    for section in sections:
+        if section['identical']:
+            report_text.append(f"Section: {section['name']} {identical_stub}\n")
+        elif section['reused']:
+            report_text.append(f"Section: {section['name']} {PREVIOUSLY_ASSESSED_STUB}\n")
         else:
-            report_text.append(f"Section: {section_name}\nContent: {content}\n")
-    
-    return "\n".join(report_text) if report_text else "No content available after formatting."
+            # Represent empty sections clearly
+            report_text.append(f"Section: {section['name']}\nContent: {section['content'] or 'N/A'}\n")
+    return "\n".join(report_text)
 
-def format_pre_analysis_for_llm(pre_analysis_summary):
+def format_pre_analysis_for_llm(pre_analysis_summary, reused_section_ids=None):
     """
     Formats the programmatic pre-analysis summary into a readable string for the LLM.
+    Sections found identical to the expert report, or already assessed, get a single line.
     """
+    reused_section_ids = reused_section_ids or set()
     if not pre_analysis_summary:
         return "No pre-analysis performed or summary available."
 
@@ -122,8 +159,16 @@ def format_pre_analysis_for_llm(pre_analysis_summary):
         lines.append("  No specific section comparisons available.")
     else:
         for sc in section_comparisons:
+            if sc.get('text_comparison_status') in ("Identical", "Nearly Identical"):
+                lines.append(f"- Section: {sanitize_text(sc.get('section_name', 'Unknown Section'))} (identical to expert report)")
+                continue
+            if sc.get('master_template_section_id') in reused_section_ids:
+                lines.append(f"- Section: {sanitize_text(sc.get('section_name', 'Unknown Section'))} (previously assessed)")
+                continue
             lines.append(f"- Section: {sanitize_text(sc.get('section_name', 'Unknown Section'))}")
             lines.append(f"  - Text vs. Expert Template: {sanitize_text(sc.get('text_comparison_status', 'Unknown'))}")
+            if sc.get('similarity_score') is not None:
+                lines.append(f"  - Similarity to Expert Text: {sc['similarity_score']:.2f}")
             key_concepts_status = sanitize_text(sc.get('key_concepts_status', 'Not Applicable'))
             lines.append(f"  - Case-Specific Key Concepts (for this section): {key_concepts_status}")
             if sc.get('missing_key_concepts'):
@@ -133,109 +178,31 @@ def format_pre_analysis_for_llm(pre_analysis_summary):
     
     return "\n".join(lines)
 
-def check_rate_limit():
-    """
-    Check if we're within API rate limits.
-    Returns True if we can proceed, False if we need to wait.
-    """
-    global API_CALL_HISTORY
-    current_time = time.time()
-    
-    # Remove timestamps older than 60 seconds
-    API_CALL_HISTORY = [t for t in API_CALL_HISTORY if current_time - t < 60]
-    
-    # If we have capacity, return True
-    if len(API_CALL_HISTORY) < MAX_CALLS_PER_MINUTE:
-        API_CALL_HISTORY.append(current_time)
-        return True
-    
-    # Otherwise, we've hit the rate limit
-    return False
-
-@lru_cache(maxsize=1)
-def get_gemini_model():
-    """
-    Returns a cached instance of the Gemini model to avoid recreation.
-    """
-    try:
-        return genai.GenerativeModel('gemini-1.5-flash-latest')
-    except Exception as e:
-        logger.error(f"Failed to create Gemini model instance: {e}")
-        return None
-
-# UPDATED FUNCTION SIGNATURE
-def get_feedback_from_llm(
-    user_report_sections, # List of dicts
-    expert_report_sections, # List of dicts (from CaseTemplateSectionContent)
-    programmatic_pre_analysis_summary, # Dict from generate_report_comparison_summary
-    case_identifier_for_llm="", 
-    case_patient_age="", 
-    case_patient_sex="", 
-    case_clinical_history="", 
-    case_expert_key_findings="", # From Case.key_findings
-    case_expert_diagnosis="",    # From Case.diagnosis
-    case_expert_discussion="",   # From Case.discussion
-    case_difficulty="",
-    identical_section_ids=None   # NEW: Set of section IDs that are identical to expert report
-    ):
-    global IS_GEMINI_CONFIGURED
-
-    if not IS_GEMINI_CONFIGURED:
-        logger.error("Gemini API was not configured successfully. API key might be missing or invalid.")
-        return "AI feedback service is not configured correctly (API key issue or configuration error)."
-
-    # Check rate limiting
-    if not check_rate_limit():
-        logger.warning(f"API rate limit reached ({MAX_CALLS_PER_MINUTE} calls per minute). Request delayed.")
-        # Add some jitter to prevent synchronized retries
-        time.sleep(3 + (time.time() % 2))
-        # Check again after delay
-        if not check_rate_limit():
-            logger.error("Rate limit still exceeded after delay. Aborting request.")
-            return "AI feedback service is currently experiencing high demand. Please try again in a moment."
-
-    # Format reports, highlighting identical sections to optimize LLM focus
-    user_report_str = format_report_for_llm(
-        user_report_sections, 
-        highlight_different_sections=True, 
-        identical_section_ids=identical_section_ids
-    )
-    expert_report_str = format_report_for_llm(expert_report_sections)
-    pre_analysis_str = format_pre_analysis_for_llm(programmatic_pre_analysis_summary)
-    
-    # Ensure all context strings have a fallback if None or empty and sanitize inputs
-    case_identifier_for_llm = sanitize_text(case_identifier_for_llm or "Not specified")
-    case_patient_age = sanitize_text(case_patient_age or "Not specified")
-    case_patient_sex = sanitize_text(case_patient_sex or "Not specified")
-    case_clinical_history = sanitize_text(case_clinical_history.strip() or "Not specified")
-    case_expert_key_findings = sanitize_text(case_expert_key_findings.strip() or "Not specified by case expert.")
-    case_expert_diagnosis = sanitize_text(case_expert_diagnosis.strip() or "Not specified by case expert.")
-    case_expert_discussion = sanitize_text(case_expert_discussion.strip() or "Not specified by case expert.")
-    case_difficulty = sanitize_text(case_difficulty or "Not specified")
-
-    prompt = f"""
+FEEDBACK_CONTEXT_TEMPLATE = """
 You are an expert pediatric radiology educator providing direct, concise feedback to a trainee on their diagnostic report. Address the trainee directly using "you" and "your".
 
 RELEVANT CASE INFORMATION:
-Case Identifier: "{case_identifier_for_llm}"
-Patient Age: "{case_patient_age}"
-Patient Sex: "{case_patient_sex}"
-Clinical History: "{case_clinical_history}"
+Case Identifier: "{case_identifier}"
+Patient Age: "{patient_age}"
+Patient Sex: "{patient_sex}"
+Clinical History: "{clinical_history}"
 
 EXPERT'S KEY FINDINGS, DIAGNOSIS AND DISCUSSION:
-Key Findings: {case_expert_key_findings}
-Final Diagnosis: {case_expert_diagnosis}
-Discussion: {case_expert_discussion}
+Key Findings: {key_findings}
+Final Diagnosis: {diagnosis}
+Discussion: {discussion}
 
 TRAINEE'S REPORT:
-{user_report_str}
+{user_report}
 
 EXPERT'S REPORT:
-{expert_report_str}
+{expert_report}
 
 AUTOMATED PRE-ANALYSIS SUMMARY:
-{pre_analysis_str}
+{pre_analysis}
+"""
 
+TEXT_FEEDBACK_INSTRUCTIONS = """
 FEEDBACK INSTRUCTIONS:
 
 You will provide two separate feedback components:
@@ -290,7 +257,7 @@ Rules for Part 2:
 - For each section, explain why you assigned that severity in 1-2 sentences maximum
 - Sections with missing critical findings should be marked as "Critical"
 - Focus on radiological impact when assigning severity levels
-- EFFICIENCY NOTE: Sections marked with [IDENTICAL TO EXPERT REPORT] should always be rated as "Consistent" without detailed analysis
+- EFFICIENCY NOTE: Sections marked with [IDENTICAL TO EXPERT REPORT] match the expert report word for word; their content is omitted and they should always be rated as "Consistent" without detailed analysis{reused_sections_rule}
 
 BEFORE SUBMITTING YOUR FEEDBACK:
 1. Review each point for redundancy - eliminate any repeated information
@@ -301,98 +268,364 @@ BEFORE SUBMITTING YOUR FEEDBACK:
 6. Format the section assessment exactly as specified above for proper parsing
 """
 
-    logger.info(f"Preparing prompt for Gemini LLM (Case ID: '{case_identifier_for_llm}')")
-    logger.debug(f"Prompt length: {len(prompt)} characters")
+# Used instead of TEXT_FEEDBACK_INSTRUCTIONS in JSON output mode; the response structure itself is
+# enforced by feedback_schema.FEEDBACK_RESPONSE_SCHEMA, so only the content rules are described here
+JSON_FEEDBACK_INSTRUCTIONS = """
+FEEDBACK INSTRUCTIONS:
+
+Respond with a single JSON object with these fields:
+- "summary": a very brief sentence (15 words max) saying if the trainee got the right diagnosis or not, and what it was.
+- "critical_discrepancies": findings that would affect patient care or represent a significant diagnostic error (missed, incorrectly identified or inappropriately emphasized findings, misidentified organs/structures, misclassified pathology). If the trainee completely missed the diagnosis, this is always a critical discrepancy.
+- "non_critical_discrepancies": findings that differ but would not significantly impact immediate patient care.
+- "section_assessments": one entry for EVERY section of the trainee's report, with the exact section name, a severity and a 1-2 sentence reason.
+
+Rules for the discrepancy lists:
+- Each entry has "section_name" (the report section it concerns, or "General") and "description"
+- Begin each description with "You..." to address the trainee directly
+- For critical discrepancies, add ONE brief sentence (15 words max) explaining why this is radiologically important
+- Do NOT comment on style differences, only substantive content differences
+- Use an empty list if a category has no discrepancies
+- Maximum 3-5 entries per list, prioritize the most important discrepancies
+- Pay special attention to contradictions within the trainee's report itself
+
+Rules for the section assessments:
+- "Critical" = Major discrepancy that could impact patient care; sections with missing critical findings are "Critical"
+- "Moderate" = Notable difference but would not affect immediate care
+- "Consistent" = Section aligns well with expert assessment
+- Any section mentioning pneumothorax must be "Critical"
+- Sections marked with [IDENTICAL TO EXPERT REPORT] match the expert report word for word; their content is omitted and they should always be rated as "Consistent" without detailed analysis{reused_sections_rule}
+"""
+
+# Added to the section rules only when earlier feedback is reused, so other prompts are unchanged
+REUSED_SECTIONS_RULE = (
+    "\n- Sections marked with " + PREVIOUSLY_ASSESSED_STUB + " were assessed in an earlier version of this report "
+    "and have not changed; their content is omitted. Do NOT assess them or list discrepancies for them"
+)
+
+FEEDBACK_PROMPT_TEMPLATE = FEEDBACK_CONTEXT_TEMPLATE + TEXT_FEEDBACK_INSTRUCTIONS
+JSON_FEEDBACK_PROMPT_TEMPLATE = FEEDBACK_CONTEXT_TEMPLATE + JSON_FEEDBACK_INSTRUCTIONS
+
+def _dedupe_case_context(case_fields, expert_sections):
+    """
+    Replaces case fields that only repeat text already in the prompt with a short reference:
+    a field identical to an earlier one, or (if long) contained in the expert report.
+    The diagnosis is always sent in full.
+    """
+    expert_text = _normalize_for_comparison(" ".join(section['content'] for section in expert_sections))
+    seen = {}
+    for field_name, label in (('clinical_history', 'Clinical History'), ('key_findings', 'Key Findings'),
+                              ('diagnosis', 'Final Diagnosis'), ('discussion', 'Discussion')):
+        normalized = _normalize_for_comparison(case_fields[field_name])
+        if not normalized:
+            continue
+        if field_name != 'diagnosis':
+            if normalized in seen:
+                case_fields[field_name] = f"(same as {seen[normalized]})"
+                continue
+            if len(normalized) >= DEDUPE_MIN_FIELD_CHARS and normalized in expert_text:
+                case_fields[field_name] = "(included in the expert's report below)"
+                continue
+        seen.setdefault(normalized, label)
+
+def _trim_to_budget(render, case_fields, user_sections, expert_sections, token_budget):
+    """
+    Shortens the longest, least important text until the rendered prompt fits the token budget.
+    Trim order: expert discussion, expert report sections, key findings, clinical history, trainee sections.
+    Returns True if any text was shortened.
+    """
+    overflow_chars = (estimate_tokens(render()) - token_budget) * CHARS_PER_TOKEN
+    if overflow_chars <= 0:
+        return False
+
+    trim_targets = [(case_fields, 'discussion')]
+    trim_targets += [(section, 'content') for section in sorted(expert_sections, key=lambda s: -len(s['content']))]
+    trim_targets += [(case_fields, 'key_findings'), (case_fields, 'clinical_history')]
+    trim_targets += [(section, 'content') for section in sorted(user_sections, key=lambda s: -len(s['content']))]
+
+    for container, key in trim_targets:
+        if overflow_chars <= 0:
+            break
+        text = container[key]
+        if len(text) <= MIN_TRIMMED_FIELD_CHARS:
+            continue
+        new_length = max(MIN_TRIMMED_FIELD_CHARS, len(text) - overflow_chars - len(TRUNCATION_MARKER))
+        container[key] = _trim_text(text, new_length)
+        overflow_chars -= len(text) - len(container[key])
+
+    if overflow_chars > 0:
+        logger.warning(f"Prompt still exceeds the {token_budget} token budget after trimming")
+    return True
+
+def _sanitize_case_fields(case_identifier_for_llm="", case_patient_age="", case_patient_sex="",
+                          case_clinical_history="", case_expert_key_findings="", case_expert_diagnosis="",
+                          case_expert_discussion="", case_difficulty=""):
+    # Ensure all context strings have a fallback if None or empty and sanitize inputs
+    return {
+        'case_identifier': sanitize_text(case_identifier_for_llm or "Not specified"),
+        'patient_age': sanitize_text(case_patient_age or "Not specified"),
+        'patient_sex': sanitize_text(case_patient_sex or "Not specified"),
+        'clinical_history': sanitize_text((case_clinical_history or "").strip()),
+        'key_findings': sanitize_text((case_expert_key_findings or "").strip()),
+        'diagnosis': sanitize_text((case_expert_diagnosis or "").strip()),
+        'discussion': sanitize_text((case_expert_discussion or "").strip()),
+    }
+
+def compile_expert_prompt_parts(expert_report_sections, **case_context):
+    """
+    Does the expert-side prompt work that does not depend on the trainee's report, so it can be
+    cached per expert template (see expert_bundle.py) and passed back to build_feedback_prompt.
+
+    Args:
+        expert_report_sections: Expert sections (CaseTemplateSectionContentSerializer data)
+        **case_context: The case keyword arguments of get_feedback_from_llm
+
+    Returns:
+        dict: 'sections' (sanitized sections from _normalize_sections), 'case_fields' (sanitized
+              and deduplicated case context) and 'expert_report' (the formatted expert report,
+              valid while no section is stubbed or trimmed)
+    """
+    expert_sections = _normalize_sections(expert_report_sections, None)
+    case_fields = _sanitize_case_fields(**case_context)
+    _dedupe_case_context(case_fields, expert_sections)
+    return {
+        'sections': expert_sections,
+        'case_fields': case_fields,
+        'expert_report': format_report_for_llm(expert_sections, "[IDENTICAL TO TRAINEE'S REPORT]"),
+    }
+
+def build_feedback_prompt(
+    user_report_sections, # List of dicts
+    expert_report_sections, # List of dicts (from CaseTemplateSectionContent)
+    programmatic_pre_analysis_summary, # Dict from generate_report_comparison_summary
+    case_identifier_for_llm="", 
+    case_patient_age="", 
+    case_patient_sex="", 
+    case_clinical_history="", 
+    case_expert_key_findings="", # From Case.key_findings
+    case_expert_diagnosis="",    # From Case.diagnosis
+    case_expert_discussion="",   # From Case.discussion
+    case_difficulty="",
+    identical_section_ids=None,  # NEW: Set of section IDs that are identical to expert report
+    token_budget=None,
+    output_format=OUTPUT_FORMAT_TEXT,
+    reused_section_ids=None,
+    expert_prompt_parts=None
+    ):
+    """
+    Builds the feedback prompt sent to the LLM. Takes the same arguments as get_feedback_from_llm.
+    output_format selects the response instructions (OUTPUT_FORMAT_TEXT or OUTPUT_FORMAT_JSON).
+    Sections in reused_section_ids already have feedback from an earlier report; they are stubbed
+    out and the LLM is told not to assess them.
+
+    expert_prompt_parts (from compile_expert_prompt_parts, usually cached) replaces the expert
+    sections and case arguments, skipping their sanitizing, deduplication and formatting.
+
+    The prompt is compacted before sending: sections identical to the expert report are sent as a
+    one-line stub on both sides, case fields repeated elsewhere in the prompt are referenced instead
+    of repeated, and the longest text is trimmed if the prompt exceeds token_budget
+    (PROMPT_TOKEN_BUDGET by default).
+    """
+    token_budget = token_budget or PROMPT_TOKEN_BUDGET
+    prompt_template = JSON_FEEDBACK_PROMPT_TEMPLATE if output_format == OUTPUT_FORMAT_JSON else FEEDBACK_PROMPT_TEMPLATE
+    user_sections = _normalize_sections(user_report_sections, identical_section_ids, reused_section_ids)
+    if expert_prompt_parts is None:
+        expert_prompt_parts = compile_expert_prompt_parts(
+            expert_report_sections,
+            case_identifier_for_llm=case_identifier_for_llm,
+            case_patient_age=case_patient_age,
+            case_patient_sex=case_patient_sex,
+            case_clinical_history=case_clinical_history,
+            case_expert_key_findings=case_expert_key_findings,
+            case_expert_diagnosis=case_expert_diagnosis,
+            case_expert_discussion=case_expert_discussion,
+        )
+    # Copies, since stubbing and trimming below must not change cached parts
+    identical_section_ids = identical_section_ids or set()
+    reused_section_ids = reused_section_ids or set()
+    expert_sections = [
+        dict(section,
+             identical=section['id'] is not None and section['id'] in identical_section_ids,
+             reused=section['id'] is not None and section['id'] in reused_section_ids)
+        for section in expert_prompt_parts['sections']
+    ]
+    case_fields = dict(expert_prompt_parts['case_fields'])
+    # The pre-formatted expert report is valid until a section is stubbed or trimmed
+    expert_report = None
+    if not any(section['identical'] or section['reused'] for section in expert_sections):
+        expert_report = expert_prompt_parts['expert_report']
+    pre_analysis_str = format_pre_analysis_for_llm(programmatic_pre_analysis_summary, reused_section_ids)
+
+    def render():
+        return prompt_template.format(
+            case_identifier=case_fields['case_identifier'],
+            patient_age=case_fields['patient_age'],
+            patient_sex=case_fields['patient_sex'],
+            clinical_history=case_fields['clinical_history'] or "Not specified",
+            key_findings=case_fields['key_findings'] or "Not specified by case expert.",
+            diagnosis=case_fields['diagnosis'] or "Not specified by case expert.",
+            discussion=case_fields['discussion'] or "Not specified by case expert.",
+            user_report=format_report_for_llm(user_sections, "[IDENTICAL TO EXPERT REPORT]"),
+            expert_report=expert_report or format_report_for_llm(expert_sections, "[IDENTICAL TO TRAINEE'S REPORT]"),
+            pre_analysis=pre_analysis_str,
+            reused_sections_rule=REUSED_SECTIONS_RULE if reused_section_ids else "",
+        )
+
+    if _trim_to_budget(render, case_fields, user_sections, expert_sections, token_budget):
+        expert_report = None
+    prompt = render()
+
+    logger.info(f"Preparing prompt for LLM (Case ID: '{case_fields['case_identifier']}')")
+    logger.debug(f"Prompt length: {len(prompt)} characters, ~{estimate_tokens(prompt)} tokens (budget {token_budget})")
     # logger.debug(f"Full prompt: {prompt}") # Uncomment for full prompt debugging if needed
 
-    start_time = time.time()
+    return prompt
+
+def _check_llm_available(provider):
+    """
+    Checks the provider's configuration and circuit breaker, then takes a token from its shared rate limiter.
+
+    Returns:
+        tuple: (error message or None, holds_probe) where holds_probe is True if the circuit breaker
+        let this call through as its half-open probe; the caller then releases the probe when the
+        call is over (see _release_probe_after)
+
+    Raises:
+        CircuitOpenError: If the provider has been failing and its circuit breaker is open
+        RateLimitExceeded: With a retry_after hint instead of sleeping; callers requeue or reject
+    """
+    if not provider.is_configured():
+        logger.error(f"LLM provider '{provider.name}' is not configured. API key might be missing or invalid.")
+        return "AI feedback service is not configured correctly (API key issue or configuration error).", False
+
+    # Fail fast while the service is known to be down, without using up rate limit tokens
+    holds_probe = provider.circuit_breaker is not None and provider.circuit_breaker.before_call()
+
+    if provider.rate_limiter is not None:
+        try:
+            provider.rate_limiter.acquire()
+        except Exception:
+            # The probe never reached the service; leaving its slot taken would keep the breaker half-open
+            if holds_probe:
+                provider.circuit_breaker.release_probe()
+            raise
+    return None, holds_probe
+
+def _release_probe_after(provider, chunks):
+    # release_probe is a no-op once the probe recorded its outcome; it only frees the slot of a call
+    # that ended without reaching the service (model not loaded, non-transient error, client gone)
     try:
-        # Get cached model instance
-        model = get_gemini_model()
-        if not model:
-            return "AI feedback service encountered an error with the model configuration."
-        
-        # Set safety settings to allow medical content
-        safety_settings = [
-            {"category": "HARM_CATEGORY_DANGEROUS", "threshold": "BLOCK_ONLY_HIGH"},
-            {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_ONLY_HIGH"},
-            {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_ONLY_HIGH"},
-            {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_ONLY_HIGH"},
-            {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_ONLY_HIGH"}
-        ]
-        
-        # Generate content with safety settings
-        response = model.generate_content(prompt, safety_settings=safety_settings)
-        
-        feedback_text = ""
-        if response.parts:
-            for part in response.parts:
-                if hasattr(part, 'text') and part.text:
-                    feedback_text += part.text
-        elif hasattr(response, 'text') and response.text: # Fallback for simpler response structures
-            feedback_text = response.text
-        
-        # Check for blocked content or other non-STOP finish reasons
-        if not feedback_text and hasattr(response, 'candidates') and response.candidates:
-            candidate = response.candidates[0]
-            if hasattr(candidate, 'finish_reason') and candidate.finish_reason != 'STOP':
-                logger.warning(f"LLM content generation issue. Reason: {candidate.finish_reason}")
-                if hasattr(candidate, 'safety_ratings'): 
-                    logger.warning(f"Safety Ratings: {candidate.safety_ratings}")
-                
-                if candidate.finish_reason == 'SAFETY':
-                    feedback_text = "AI feedback could not be generated for this content due to safety filters. Please review the reports for any sensitive or inappropriate material."
-                elif candidate.finish_reason == 'MAX_TOKENS':
-                    feedback_text = "AI feedback generation was stopped because the maximum output length was reached. The feedback might be incomplete."
-                elif candidate.finish_reason in ['RECITATION', 'OTHER']:
-                    feedback_text = "AI feedback could not be generated due to content quality or other filters."
-                else:
-                    feedback_text = f"AI feedback generation stopped for an unspecified reason: {candidate.finish_reason}."
-            elif not feedback_text: # If finish_reason was STOP but still no text
-                 feedback_text = "No feedback was generated by the AI (empty response received despite successful completion)."
-        elif not feedback_text: # If no parts and no text attribute
-            feedback_text = "No feedback was generated by the AI (empty or unexpected response structure)."
-
-        # Log performance metrics
-        elapsed_time = time.time() - start_time
-        logger.info(f"LLM response received in {elapsed_time:.2f} seconds (Case ID: '{case_identifier_for_llm}')")
-        logger.debug(f"Response length: {len(feedback_text)} characters")
-            
-        return feedback_text.strip()
-
-    except GoogleAPIError as e:
-        elapsed_time = time.time() - start_time
-        logger.error(f"Google API Error calling Gemini API after {elapsed_time:.2f}s: {e}")
-        error_type = type(e).__name__
-        
-        # Provide more specific error messages based on error type
-        if "quota" in str(e).lower() or "rate" in str(e).lower():
-            return "The AI service has reached its quota limit. Please try again later or contact support."
-        elif "invalid" in str(e).lower() and "key" in str(e).lower():
-            return "The AI service is misconfigured (API key issue). Please contact support."
-        elif "timeout" in str(e).lower() or "deadline" in str(e).lower():
-            return "The AI service took too long to respond. Please try again or contact support if this persists."
-        else:
-            # Generic error but don't expose internal details to end users
-            logger.error(f"Detailed error: {traceback.format_exc()}")
-            return f"Sorry, an error occurred with the AI service ({error_type}). Please try again later."
-    
-    except Exception as e:
-        elapsed_time = time.time() - start_time
-        logger.error(f"Unexpected error calling Gemini API after {elapsed_time:.2f}s: {e}")
-        logger.error(f"Detailed error: {traceback.format_exc()}")
-        
-        # Don't expose internal error details to end users
-        error_type = type(e).__name__
-        return f"Sorry, an unexpected error ({error_type}) occurred. Please try again later or contact support if this persists."
+        yield from chunks
+    finally:
+        provider.circuit_breaker.release_probe()
+
+# UPDATED FUNCTION SIGNATURE
+def get_feedback_from_llm(
+    user_report_sections, # List of dicts
+    expert_report_sections, # List of dicts (from CaseTemplateSectionContent)
+    programmatic_pre_analysis_summary, # Dict from generate_report_comparison_summary
+    case_identifier_for_llm="", 
+    case_patient_age="", 
+    case_patient_sex="", 
+    case_clinical_history="", 
+    case_expert_key_findings="", # From Case.key_findings
+    case_expert_diagnosis="",    # From Case.diagnosis
+    case_expert_discussion="",   # From Case.discussion
+    case_difficulty="",
+    identical_section_ids=None,  # NEW: Set of section IDs that are identical to expert report
+    output_format=None,          # OUTPUT_FORMAT_TEXT or OUTPUT_FORMAT_JSON, defaults to settings.AI_FEEDBACK_LLM_OUTPUT_FORMAT
+    reused_section_ids=None,     # Set of section IDs whose feedback is reused from an earlier report
+    expert_prompt_parts=None     # Cached compile_expert_prompt_parts result for the expert template
+    ):
+    output_format = output_format or OUTPUT_FORMAT
+    provider = get_llm_provider()
+    unavailable_message, holds_probe = _check_llm_available(provider)
+    if unavailable_message:
+        return unavailable_message
+
+    try:
+        prompt = build_feedback_prompt(
+            user_report_sections, expert_report_sections, programmatic_pre_analysis_summary,
+            case_identifier_for_llm=case_identifier_for_llm,
+            case_patient_age=case_patient_age,
+            case_patient_sex=case_patient_sex,
+            case_clinical_history=case_clinical_history,
+            case_expert_key_findings=case_expert_key_findings,
+            case_expert_diagnosis=case_expert_diagnosis,
+            case_expert_discussion=case_expert_discussion,
+            case_difficulty=case_difficulty,
+            identical_section_ids=identical_section_ids,
+            output_format=output_format,
+            reused_section_ids=reused_section_ids,
+            expert_prompt_parts=expert_prompt_parts
+        )
+
+        return provider.generate(prompt, {
+            'case_identifier_for_llm': case_identifier_for_llm,
+            'user_report_sections': user_report_sections,
+            'identical_section_ids': identical_section_ids,
+            'reused_section_ids': reused_section_ids,
+            'max_output_tokens': estimate_output_token_budget(user_report_sections, identical_section_ids, reused_section_ids),
+            'response_format': output_format,
+        })
+    finally:
+        if holds_probe:
+            # No-op if the call recorded its outcome (see _release_probe_after)
+            provider.circuit_breaker.release_probe()
+
+def stream_feedback_from_llm(
+    user_report_sections,
+    expert_report_sections,
+    programmatic_pre_analysis_summary,
+    identical_section_ids=None,
+    expert_prompt_parts=None,
+    **case_context
+    ):
+    """
+    Streaming variant of get_feedback_from_llm. Availability and rate limit checks run immediately,
+    so callers can reject the request before starting a response; the returned iterator then yields
+    text chunks as the LLM produces them.
+
+    If the provider is not configured, the iterator yields a single error message (same strings as
+    get_feedback_from_llm). If the stream fails or ends without text, iterating raises
+    llm_providers.LLMResponseError.
+
+    Raises:
+        CircuitOpenError: If the provider's circuit breaker is open
+        RateLimitExceeded: If the provider's shared rate limit has no capacity right now
+    """
+    provider = get_llm_provider()
+    unavailable_message, holds_probe = _check_llm_available(provider)
+    if unavailable_message:
+        return iter([unavailable_message])
+
+    try:
+        prompt = build_feedback_prompt(
+            user_report_sections, expert_report_sections, programmatic_pre_analysis_summary,
+            identical_section_ids=identical_section_ids,
+            expert_prompt_parts=expert_prompt_parts,
+            **case_context
+        )
+    except Exception:
+        if holds_probe:
+            provider.circuit_breaker.release_probe()
+        raise
+
+    chunks = provider.stream(prompt, {
+        'case_identifier_for_llm': case_context.get('case_identifier_for_llm', ''),
+        'user_report_sections': user_report_sections,
+        'identical_section_ids': identical_section_ids,
+        'max_output_tokens': estimate_output_token_budget(user_report_sections, identical_section_ids),
+    })
+    return _release_probe_after(provider, chunks) if holds_probe else chunks
+
 
 # Example Usage (for testing this service directly if needed):
-# (Keep this section for your own testing if desired, but ensure IS_GEMINI_CONFIGURED is handled)
+# (Keep this section for your own testing if desired, but ensure the LLM provider is configured)
 if __name__ == '__main__':
     logger.info("Testing LLM feedback service directly...")
     
     # Simplified test without re-loading .env here, assuming it's loaded if run via manage.py or configured externally
-    if IS_GEMINI_CONFIGURED:
+    if get_llm_provider().is_configured():
         sample_user_report_sections = [
             {"section_name": "Findings", "content": "Lungs are clear. Heart size appears normal.", "section_order": 1, "master_template_section_id": 1},
             {"section_name": "Impression", "content": "Normal chest x-ray.", "section_order": 2, "master_template_section_id": 2}
@@ -438,5 +671,5 @@ if __name__ == '__main__':
         logger.info("Generated feedback for test case")
         logger.debug(f"Feedback length: {len(feedback)} characters")
     else:
-        logger.warning("Skipping standalone LLM test as Gemini API is not configured.")
+        logger.warning("Skipping standalone LLM test as the LLM provider is not configured.")
 
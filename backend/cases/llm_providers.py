@@ -0,0 +1,515 @@
+# backend/cases/llm_providers.py
+import os
+import json
+import time
+import random
+import hashlib
+import logging
+import importlib
+import threading
+import traceback
+from types import SimpleNamespace
+from functools import lru_cache
+
+from django.conf import settings
+
+from .rate_limiter import TokenBucketRateLimiter
+from .circuit_breaker import CLOSED, CircuitBreaker
+from .feedback_schema import FEEDBACK_RESPONSE_SCHEMA
+from .feedback_parser import feedback_text_to_json
+
+# Configure logger
+logger = logging.getLogger(__name__)
+
+# Rate limiting settings (shared token bucket stored in the database, see rate_limiter.py)
+MAX_CALLS_PER_MINUTE = getattr(settings, 'GEMINI_API_RATE_LIMIT', 10)
+GEMINI_RATE_LIMITER = TokenBucketRateLimiter(
+    'gemini',
+    rate_per_minute=MAX_CALLS_PER_MINUTE,
+    capacity=getattr(settings, 'GEMINI_API_BURST', MAX_CALLS_PER_MINUTE)
+)
+
+# Circuit breaker around Gemini calls (state in the Django cache, see circuit_breaker.py)
+GEMINI_CIRCUIT_BREAKER = CircuitBreaker(
+    'gemini',
+    failure_threshold=getattr(settings, 'AI_FEEDBACK_LLM_BREAKER_FAILURE_THRESHOLD', 5),
+    window_seconds=getattr(settings, 'AI_FEEDBACK_LLM_BREAKER_WINDOW_SECONDS', 60),
+    recovery_seconds=getattr(settings, 'AI_FEEDBACK_LLM_BREAKER_RECOVERY_SECONDS', 30)
+)
+
+# Retry policy for Gemini calls: each attempt has its own deadline, and all attempts of one call
+# (including the backoff sleeps) stay within the overall deadline
+CALL_TIMEOUT_SECONDS = getattr(settings, 'AI_FEEDBACK_LLM_CALL_TIMEOUT_SECONDS', 30)
+CALL_DEADLINE_SECONDS = getattr(settings, 'AI_FEEDBACK_LLM_DEADLINE_SECONDS', 60)
+MAX_RETRIES = getattr(settings, 'AI_FEEDBACK_LLM_MAX_RETRIES', 2)
+RETRY_BASE_DELAY_SECONDS = getattr(settings, 'AI_FEEDBACK_LLM_RETRY_BASE_DELAY_SECONDS', 1.0)
+RETRY_MAX_DELAY_SECONDS = getattr(settings, 'AI_FEEDBACK_LLM_RETRY_MAX_DELAY_SECONDS', 8.0)
+
+# Errors that mean the service is struggling rather than that the request is bad: these are retried
+# and count towards opening the circuit breaker (google.api_core.exceptions classes, resolved on first use)
+TRANSIENT_GEMINI_ERROR_NAMES = (
+    'DeadlineExceeded',
+    'ServiceUnavailable',
+    'InternalServerError',
+    'BadGateway',
+    'GatewayTimeout',
+    'TooManyRequests',
+    'ResourceExhausted',
+)
+
+# The Gemini SDK (google.generativeai and its grpc/protobuf dependencies) takes most of a second to
+# import, so it is only loaded by the first Gemini call, not by every manage.py command or worker boot
+_gemini_sdk = None
+_gemini_sdk_lock = threading.Lock()
+
+
+def load_gemini_sdk():
+    """
+    Imports the Gemini SDK once per process (thread-safe) and returns a namespace with
+    genai (google.generativeai), exceptions (google.api_core.exceptions) and transient_errors
+    (the TRANSIENT_GEMINI_ERROR_NAMES classes plus TimeoutError and ConnectionError).
+
+    Raises:
+        ImportError: If the SDK is not installed
+    """
+    global _gemini_sdk
+    if _gemini_sdk is None:
+        with _gemini_sdk_lock:
+            if _gemini_sdk is None:
+                started = time.perf_counter()
+                genai = importlib.import_module('google.generativeai')
+                google_exceptions = importlib.import_module('google.api_core.exceptions')
+                _gemini_sdk = SimpleNamespace(
+                    genai=genai,
+                    exceptions=google_exceptions,
+                    transient_errors=tuple(getattr(google_exceptions, name) for name in TRANSIENT_GEMINI_ERROR_NAMES)
+                                     + (TimeoutError, ConnectionError),
+                )
+                logger.info(f"Gemini SDK loaded in {time.perf_counter() - started:.2f}s")
+    return _gemini_sdk
+
+# Safety settings to allow medical content
+SAFETY_SETTINGS = [
+    {"category": "HARM_CATEGORY_DANGEROUS", "threshold": "BLOCK_ONLY_HIGH"},
+    {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_ONLY_HIGH"},
+    {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_ONLY_HIGH"},
+    {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_ONLY_HIGH"},
+    {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_ONLY_HIGH"}
+]
+
+class LLMResponseError(Exception):
+    """
+    Raised by providers when a call completed without usable feedback (blocked by safety filters,
+    cut off at the output limit, empty), or a stream failed part-way. The outcome is reported to the
+    user instead of being parsed, cached and reused as feedback.
+
+    Attributes:
+        message: User-facing error message
+        retryable: True if calling again may produce feedback
+    """
+    def __init__(self, message, retryable=False):
+        super().__init__(message)
+        self.message = message
+        self.retryable = retryable
+
+
+# Placeholder in fake LLM scripts, replaced by one Section/Severity/Reason block per report section
+SECTION_ASSESSMENTS_PLACEHOLDER = "{section_assessments}"
+
+DEFAULT_FAKE_SCRIPT = [
+    "You identified the main abnormality but missed supporting findings.\n"
+    "\n"
+    "1. CRITICAL DISCREPANCIES:\n"
+    "None identified.\n"
+    "\n"
+    "2. NON-CRITICAL DISCREPANCIES:\n"
+    "- You did not describe all of the secondary findings noted by the expert.\n"
+    "\n"
+    "SECTION SEVERITY ASSESSMENT:\n"
+    + SECTION_ASSESSMENTS_PLACEHOLDER,
+]
+
+
+class LLMProvider:
+    """
+    Base class for the backends that turn a feedback prompt into LLM text.
+
+    Providers return the generated text, or one of the user-facing error strings recognised by
+    feedback_pipeline.LLM_ERROR_PREFIXES when the service call fails. A call that completes without
+    usable feedback raises LLMResponseError, as does a stream that fails after yielding text.
+    The request context passed alongside the prompt holds the structured inputs the prompt was built
+    from (user_report_sections, identical_section_ids, reused_section_ids, case_identifier_for_llm), the
+    max_output_tokens limit for the call and the response_format ('text' or 'json'); real providers
+    only use the inputs for logging. In 'json' format the response must be a JSON document matching
+    feedback_schema.FEEDBACK_RESPONSE_SCHEMA.
+    """
+    name = None
+    # TokenBucketRateLimiter applied before each call, or None for providers without quota
+    rate_limiter = None
+    # CircuitBreaker checked before each call, or None for providers that cannot fail
+    circuit_breaker = None
+
+    def is_configured(self):
+        return True
+
+    def generate(self, prompt, request_context):
+        raise NotImplementedError
+
+    def stream(self, prompt, request_context):
+        """
+        Yields the generated text in chunks. Defaults to a single chunk from generate().
+        """
+        yield self.generate(prompt, request_context)
+
+
+class GeminiProvider(LLMProvider):
+    name = 'gemini'
+    rate_limiter = GEMINI_RATE_LIMITER
+    circuit_breaker = GEMINI_CIRCUIT_BREAKER
+
+    def __init__(self, model_name=None, api_key=None):
+        self.model_name = model_name or getattr(settings, 'AI_FEEDBACK_LLM_MODEL', 'gemini-1.5-flash-latest')
+        self.api_key = api_key or os.environ.get("GEMINI_API_KEY")
+        # The SDK is configured on the first call (see _configure_client), not here
+        self.configured = bool(self.api_key)
+        self._client_configured = False
+        self._client_lock = threading.Lock()
+
+        if not self.api_key:
+            logger.warning("GEMINI_API_KEY environment variable not found.")
+
+    def is_configured(self):
+        return self.configured
+
+    def _configure_client(self):
+        """
+        Loads the SDK and configures it with the API key, once per provider (thread-safe).
+        Marks the provider as not configured if that fails.
+        """
+        if self._client_configured:
+            return
+        with self._client_lock:
+            if self._client_configured:
+                return
+            try:
+                load_gemini_sdk().genai.configure(api_key=self.api_key)
+            except Exception as e:
+                self.configured = False
+                logger.error(f"Error configuring Gemini API: {e}")
+                raise
+            self._client_configured = True
+            logger.info("Gemini API configured successfully.")
+
+    def get_model(self):
+        """
+        Returns a cached instance of the Gemini model to avoid recreation, or None if the SDK
+        cannot be loaded or configured.
+        """
+        try:
+            self._configure_client()
+        except Exception:
+            return None
+        return _get_gemini_model(self.model_name)
+
+    def _generation_config(self, request_context):
+        generation_config = {}
+        max_output_tokens = request_context.get('max_output_tokens')
+        if max_output_tokens:
+            generation_config['max_output_tokens'] = max_output_tokens
+        if request_context.get('response_format') == 'json':
+            # Constrained decoding: Gemini only emits JSON matching the schema
+            generation_config['response_mime_type'] = 'application/json'
+            generation_config['response_schema'] = FEEDBACK_RESPONSE_SCHEMA
+        return generation_config or None
+
+    def _request_options(self, timeout):
+        # Retries are done by generate_with_retries, so the client library must not retry on its own
+        return {'timeout': max(1.0, timeout), 'retry': None}
+
+    def _retry_delay(self, attempt):
+        # Full jitter: spreads retries from many workers instead of retrying in lockstep
+        return random.uniform(0, min(RETRY_MAX_DELAY_SECONDS, RETRY_BASE_DELAY_SECONDS * (2 ** attempt)))
+
+    def _may_retry(self):
+        # A retry is another Gemini call, so it needs the circuit to stay closed and a rate limit token
+        if self.circuit_breaker.current_state() != CLOSED:
+            return False
+        return self.rate_limiter.try_acquire()[0]
+
+    def generate_with_retries(self, model, prompt, request_context):
+        """
+        Calls the model, retrying transient errors (TRANSIENT_GEMINI_ERROR_NAMES) up to MAX_RETRIES times
+        with jittered exponential backoff. Each attempt is recorded on the circuit breaker.
+
+        Raises:
+            The last exception if the call still fails, the retries run out or the deadline passes
+        """
+        case_identifier_for_llm = request_context.get('case_identifier_for_llm', '')
+        deadline = time.monotonic() + CALL_DEADLINE_SECONDS
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            try:
+                response = model.generate_content(
+                    prompt,
+                    safety_settings=SAFETY_SETTINGS,
+                    generation_config=self._generation_config(request_context),
+                    request_options=self._request_options(min(CALL_TIMEOUT_SECONDS, remaining))
+                )
+            except load_gemini_sdk().transient_errors as e:
+                self.circuit_breaker.record_failure()
+                delay = self._retry_delay(attempt)
+                attempt += 1
+                if attempt > MAX_RETRIES or time.monotonic() + delay >= deadline or not self._may_retry():
+                    raise
+                logger.warning(f"Transient Gemini error ({type(e).__name__}), retry {attempt}/{MAX_RETRIES} in {delay:.1f}s (Case ID: '{case_identifier_for_llm}')")
+                time.sleep(delay)
+                continue
+            self.circuit_breaker.record_success()
+            return response
+
+    def describe_error(self, e, elapsed_time):
+        """
+        Logs an exception raised by a Gemini call and returns the user-facing error message for it.
+        """
+        error_type = type(e).__name__
+        if _gemini_sdk is not None and isinstance(e, _gemini_sdk.exceptions.GoogleAPIError):
+            logger.error(f"Google API Error calling Gemini API after {elapsed_time:.2f}s: {e}")
+
+            # Provide more specific error messages based on error type
+            if "quota" in str(e).lower() or "rate" in str(e).lower():
+                return "The AI service has reached its quota limit. Please try again later or contact support."
+            elif "invalid" in str(e).lower() and "key" in str(e).lower():
+                return "The AI service is misconfigured (API key issue). Please contact support."
+            elif "timeout" in str(e).lower() or "deadline" in str(e).lower():
+                return "The AI service took too long to respond. Please try again or contact support if this persists."
+            else:
+                # Generic error but don't expose internal details to end users
+                logger.error(f"Detailed error: {traceback.format_exc()}")
+                return f"Sorry, an error occurred with the AI service ({error_type}). Please try again later."
+
+        logger.error(f"Unexpected error calling Gemini API after {elapsed_time:.2f}s: {e}")
+        logger.error(f"Detailed error: {traceback.format_exc()}")
+
+        # Don't expose internal error details to end users
+        return f"Sorry, an unexpected error ({error_type}) occurred. Please try again later or contact support if this persists."
+
+    def generate(self, prompt, request_context):
+        case_identifier_for_llm = request_context.get('case_identifier_for_llm', '')
+        start_time = time.time()
+        try:
+            # Get cached model instance
+            model = self.get_model()
+            if not model:
+                return "AI feedback service encountered an error with the model configuration."
+
+            # Generate content with safety settings
+            response = self.generate_with_retries(model, prompt, request_context)
+
+            feedback_text = ""
+            if response.parts:
+                for part in response.parts:
+                    if hasattr(part, 'text') and part.text:
+                        feedback_text += part.text
+            elif hasattr(response, 'text') and response.text: # Fallback for simpler response structures
+                feedback_text = response.text
+
+            # Check for blocked content or other non-STOP finish reasons
+            if not feedback_text and hasattr(response, 'candidates') and response.candidates:
+                candidate = response.candidates[0]
+                if hasattr(candidate, 'finish_reason') and candidate.finish_reason != 'STOP':
+                    logger.warning(f"LLM content generation issue. Reason: {candidate.finish_reason}")
+                    if hasattr(candidate, 'safety_ratings'):
+                        logger.warning(f"Safety Ratings: {candidate.safety_ratings}")
+
+                    if candidate.finish_reason == 'SAFETY':
+                        raise LLMResponseError("AI feedback could not be generated for this content due to safety filters. Please review the reports for any sensitive or inappropriate material.")
+                    elif candidate.finish_reason == 'MAX_TOKENS':
+                        raise LLMResponseError("AI feedback generation was stopped because the maximum output length was reached. Please try again later.")
+                    elif candidate.finish_reason in ['RECITATION', 'OTHER']:
+                        raise LLMResponseError("AI feedback could not be generated due to content quality or other filters.")
+                    else:
+                        raise LLMResponseError(f"AI feedback generation stopped for an unspecified reason: {candidate.finish_reason}.", retryable=True)
+                elif not feedback_text: # If finish_reason was STOP but still no text
+                    raise LLMResponseError("No feedback was generated by the AI (empty response received despite successful completion).", retryable=True)
+            elif not feedback_text: # If no parts and no text attribute
+                raise LLMResponseError("No feedback was generated by the AI (empty or unexpected response structure).", retryable=True)
+
+            # Log performance metrics
+            elapsed_time = time.time() - start_time
+            logger.info(f"LLM response received in {elapsed_time:.2f} seconds (Case ID: '{case_identifier_for_llm}')")
+            logger.debug(f"Response length: {len(feedback_text)} characters")
+
+            return feedback_text.strip()
+
+        except LLMResponseError:
+            raise
+        except Exception as e:
+            return self.describe_error(e, time.time() - start_time)
+
+    def stream(self, prompt, request_context):
+        case_identifier_for_llm = request_context.get('case_identifier_for_llm', '')
+        start_time = time.time()
+        first_chunk_time = None
+        total_length = 0
+        try:
+            model = self.get_model()
+            if not model:
+                yield "AI feedback service encountered an error with the model configuration."
+                return
+
+            # Not retried: text already sent to the client cannot be taken back
+            response = model.generate_content(
+                prompt,
+                safety_settings=SAFETY_SETTINGS,
+                generation_config=self._generation_config(request_context),
+                stream=True,
+                request_options=self._request_options(CALL_TIMEOUT_SECONDS)
+            )
+            for chunk in response:
+                chunk_text = ""
+                try:
+                    chunk_text = chunk.text
+                except ValueError:
+                    # Raised by the SDK for chunks without text parts (e.g., safety-blocked candidates)
+                    logger.warning(f"LLM stream chunk without text (Case ID: '{case_identifier_for_llm}')")
+                if chunk_text:
+                    if first_chunk_time is None:
+                        first_chunk_time = time.time() - start_time
+                    total_length += len(chunk_text)
+                    yield chunk_text
+
+            self.circuit_breaker.record_success()
+            elapsed_time = time.time() - start_time
+            logger.info(f"LLM stream finished in {elapsed_time:.2f}s, first chunk after {first_chunk_time or 0:.2f}s (Case ID: '{case_identifier_for_llm}')")
+            logger.debug(f"Response length: {total_length} characters")
+        except Exception as e:
+            if _gemini_sdk is not None and isinstance(e, _gemini_sdk.transient_errors):
+                self.circuit_breaker.record_failure()
+            # Text already yielded is incomplete, so the error must not be appended to it as more text
+            raise LLMResponseError(self.describe_error(e, time.time() - start_time), retryable=True) from e
+
+        if not total_length:
+            raise LLMResponseError("No feedback was generated by the AI (empty response received despite successful completion).", retryable=True)
+
+
+@lru_cache(maxsize=4)
+def _get_gemini_model(model_name):
+    try:
+        return load_gemini_sdk().genai.GenerativeModel(model_name)
+    except Exception as e:
+        logger.error(f"Failed to create Gemini model instance: {e}")
+        return None
+
+
+class FakeLLMProvider(LLMProvider):
+    """
+    Offline stand-in for load testing and local development. Returns scripted feedback in the
+    "CRITICAL DISCREPANCIES / SECTION SEVERITY ASSESSMENT" format (converted to the JSON response
+    structure for 'json' requests) after a simulated latency, without network access or rate limiting.
+
+    Responses are deterministic: the script entry and the latency jitter are chosen from a hash of
+    the prompt, so the same report always gets the same feedback.
+
+    Args:
+        latency: Base delay in seconds before the response
+        latency_jitter: Extra delay of up to this many seconds, derived from the prompt hash
+        script_path: Optional JSON file with a list of response templates. A template may contain
+            "{section_assessments}", which is replaced by one Section/Severity/Reason block per
+            report section (identical sections are rated Consistent, the others Moderate; sections
+            whose earlier feedback is reused are left out).
+    """
+    name = 'fake'
+
+    def __init__(self, latency=None, latency_jitter=None, script_path=None):
+        self.latency = latency if latency is not None else getattr(settings, 'AI_FEEDBACK_FAKE_LLM_LATENCY', 1.0)
+        self.latency_jitter = latency_jitter if latency_jitter is not None else getattr(settings, 'AI_FEEDBACK_FAKE_LLM_LATENCY_JITTER', 0.0)
+        script_path = script_path or getattr(settings, 'AI_FEEDBACK_FAKE_LLM_SCRIPT', None)
+        self.script = self._load_script(script_path) if script_path else DEFAULT_FAKE_SCRIPT
+
+    def _load_script(self, script_path):
+        with open(script_path, encoding='utf-8') as script_file:
+            script = json.load(script_file)
+        if not isinstance(script, list) or not script or not all(isinstance(entry, str) for entry in script):
+            raise ValueError(f"Fake LLM script {script_path} must be a non-empty JSON list of strings")
+        return script
+
+    def _section_assessments(self, request_context):
+        identical_section_ids = request_context.get('identical_section_ids') or set()
+        reused_section_ids = request_context.get('reused_section_ids') or set()
+        blocks = []
+        for section in request_context.get('user_report_sections') or []:
+            if section.get('master_template_section_id') in reused_section_ids:
+                continue
+            section_name = section.get('section_name', 'Unnamed Section')
+            if section.get('master_template_section_id') in identical_section_ids:
+                severity, reason = "Consistent", "This section matches the expert report."
+            else:
+                severity, reason = "Moderate", "This section differs from the expert report in minor details."
+            blocks.append(f"Section: {section_name}\nSeverity: {severity}\nReason: {reason}")
+        return "\n\n".join(blocks)
+
+    def _respond(self, prompt, request_context):
+        seed = int(hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:16], 16)
+        delay = self.latency + random.Random(seed).uniform(0, self.latency_jitter)
+        template = self.script[seed % len(self.script)]
+        text = template.replace(SECTION_ASSESSMENTS_PLACEHOLDER, self._section_assessments(request_context)).strip()
+        if request_context.get('response_format') == 'json':
+            text = json.dumps(feedback_text_to_json(text), indent=2)
+        return delay, text
+
+    def generate(self, prompt, request_context):
+        delay, text = self._respond(prompt, request_context)
+        time.sleep(delay)
+        return text
+
+    def stream(self, prompt, request_context):
+        delay, text = self._respond(prompt, request_context)
+        # Spread the simulated latency over the lines so clients see incremental output
+        lines = text.splitlines(keepends=True)
+        for line in lines:
+            time.sleep(delay / len(lines))
+            yield line
+
+
+LLM_PROVIDERS = {
+    GeminiProvider.name: GeminiProvider,
+    FakeLLMProvider.name: FakeLLMProvider,
+}
+
+_active_provider = None
+
+
+def get_llm_provider():
+    """
+    Returns the provider selected by settings.AI_FEEDBACK_LLM_PROVIDER (created once per process).
+    """
+    global _active_provider
+    if _active_provider is None:
+        provider_name = getattr(settings, 'AI_FEEDBACK_LLM_PROVIDER', GeminiProvider.name)
+        _active_provider = create_llm_provider(provider_name)
+    return _active_provider
+
+
+def create_llm_provider(provider_name, **kwargs):
+    """
+    Instantiates a provider by name.
+
+    Raises:
+        ValueError: If the name is not one of LLM_PROVIDERS
+    """
+    provider_class = LLM_PROVIDERS.get(provider_name)
+    if provider_class is None:
+        raise ValueError(f"Unknown LLM provider '{provider_name}'. Choose one of: {', '.join(sorted(LLM_PROVIDERS))}")
+    return provider_class(**kwargs)
+
+
+def set_llm_provider(provider):
+    """
+    Replaces the process-wide provider, e.g. for management commands that switch to the fake backend.
+    Accepts a provider name or an LLMProvider instance; returns the provider now in use.
+    """
+    global _active_provider
+    _active_provider = create_llm_provider(provider) if isinstance(provider, str) else provider
+    logger.info(f"Using LLM provider '{_active_provider.name}'")
+    return _active_provider
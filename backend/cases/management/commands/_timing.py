@@ -0,0 +1,70 @@
+# backend/cases/management/commands/_timing.py
+# Shared helpers for the benchmark/bulk management commands (underscore prefix: not a command itself).
+import os
+import sys
+import time
+import subprocess
+
+
+def percentile(sorted_values, pct):
+    """
+    Returns the pct-th percentile (0-100) of an already sorted list, interpolating linearly between
+    the two closest ranks.
+    """
+    if not sorted_values:
+        return 0.0
+    rank = (len(sorted_values) - 1) * pct / 100.0
+    lower = int(rank)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (rank - lower)
+
+
+def format_latency_summary(latencies_seconds, unit='ms'):
+    """
+    Formats count, mean and p50/p90/p95/p99/max of a list of latencies (in seconds).
+    """
+    if not latencies_seconds:
+        return "no samples"
+    scale = 1000.0 if unit == 'ms' else 1000000.0 if unit == 'us' else 1.0
+    values = sorted(v * scale for v in latencies_seconds)
+    mean = sum(values) / len(values)
+    return (
+        f"n={len(values)} mean={mean:.2f}{unit} "
+        f"p50={percentile(values, 50):.2f}{unit} p90={percentile(values, 90):.2f}{unit} "
+        f"p95={percentile(values, 95):.2f}{unit} p99={percentile(values, 99):.2f}{unit} "
+        f"max={values[-1]:.2f}{unit}"
+    )
+
+
+def parse_importtime(output):
+    """
+    Parses the stderr of `python -X importtime` into (module, self_us, cumulative_us, depth) tuples,
+    in the order the imports finished. depth 0 marks imports not nested in another import.
+    """
+    imports = []
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        if not self_us.strip().isdigit():
+            continue  # Column header line
+        module = name.strip()
+        depth = (len(name) - len(name.lstrip(' ')) - 1) // 2
+        imports.append((module, int(self_us), int(cumulative_us), depth))
+    return imports
+
+
+def run_with_importtime(args, env=None):
+    """
+    Runs `python -X importtime <args>` in a fresh interpreter and returns its parsed imports
+    (see parse_importtime) and the wall time of the whole process in seconds.
+
+    Raises:
+        subprocess.CalledProcessError: If the process fails
+    """
+    started = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', *args],
+        env=env or os.environ.copy(), capture_output=True, text=True, check=True
+    )
+    return parse_importtime(completed.stderr), time.perf_counter() - started
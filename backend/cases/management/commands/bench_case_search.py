@@ -0,0 +1,132 @@
+# backend/cases/management/commands/bench_case_search.py
+import random
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from cases.case_search import build_search_query, search_cases
+from cases.models import Case, CaseStatusChoices
+from cases.views import UserCaseViewSet, annotate_user_case_flags
+from ._timing import format_latency_summary
+
+SEED_BATCH_SIZE = 5000
+PAGE_SIZE = 10
+# Filler vocabulary for the synthetic case text
+FILLER_WORDS = (
+    "patient presents with fever cough vomiting abdominal pain irritability lethargy history of prematurity "
+    "prior surgery swelling tenderness bilateral left right upper lower lobe opacity effusion consolidation "
+    "fracture lesion mass enhancement cystic solid heterogeneous homogeneous calcification edema ventricle "
+    "cortex bowel loops liver spleen kidney bladder femur tibia humerus skull sinus airway trachea heart "
+    "mediastinum thymus normal abnormal mild moderate severe acute chronic follow up recommended ultrasound "
+    "radiograph computed tomography magnetic resonance contrast noted seen without evidence suggestive"
+).split()
+# Rare terms planted in a fraction of the cases, as a trainee would search for them
+PLANTED_TERMS = ("intussusception", "medulloblastoma", "osteomyelitis", "pyloric stenosis")
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks full-text case search (GIN-indexed search vectors, GET /api/cases/cases/search/) "
+        "against icontains across the case text fields. Seeds synthetic published cases inside a "
+        "transaction that is rolled back afterwards (unless --keep). PostgreSQL only."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cases', type=int, default=100000,
+                            help="Published cases to seed (default: 100000).")
+        parser.add_argument('--planted-ratio', type=float, default=0.005,
+                            help="Share of cases whose text mentions each planted term (default: 0.005).")
+        parser.add_argument('--terms', default=','.join(PLANTED_TERMS + ("effusion",)),
+                            help="Comma-separated search texts (default: the planted terms plus one filler word).")
+        parser.add_argument('--iterations', type=int, default=5,
+                            help="Searches per term and mode (default: 5).")
+        parser.add_argument('--keep', action='store_true',
+                            help="Commit the seeded cases instead of rolling them back.")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError("Case search uses PostgreSQL full-text search; run this against PostgreSQL.")
+        terms = [term.strip() for term in options['terms'].split(',') if term.strip()]
+
+        with transaction.atomic():
+            user = User.objects.create(username=f'bench-search-{int(time.time())}')
+            self._seed(options['cases'], options['planted_ratio'])
+            with connection.cursor() as cursor:
+                cursor.execute(f'ANALYZE {Case._meta.db_table}')
+
+            published = Case.objects.filter(status=CaseStatusChoices.PUBLISHED)
+            search_view = UserCaseViewSet.as_view({'get': 'search'})
+            factory = APIRequestFactory(SERVER_NAME=(settings.ALLOWED_HOSTS or ['localhost'])[0].lstrip('.'))
+
+            for term in terms:
+                query = build_search_query(term)
+                fts_queryset = search_cases(annotate_user_case_flags(published, user), query)
+                icontains_queryset = published.filter(
+                    Q(clinical_history__icontains=term) | Q(diagnosis__icontains=term)
+                    | Q(key_findings__icontains=term) | Q(discussion__icontains=term)
+                ).order_by('-published_at', '-id')
+                self.stdout.write(
+                    f"{term!r}: {fts_queryset.count()} full-text matches (title, history; no expert text "
+                    f"for this user), {icontains_queryset.count()} icontains matches (all text fields)"
+                )
+
+                def first_page(queryset):
+                    # What a paginated list does: the total, then the first page
+                    queryset.count()
+                    list(queryset[:PAGE_SIZE])
+
+                def endpoint():
+                    request = factory.get('/api/cases/cases/search/', {'q': term})
+                    force_authenticate(request, user=user)
+                    response = search_view(request)
+                    response.render()
+                    if response.status_code != 200:
+                        raise CommandError(f"Search for {term!r}: HTTP {response.status_code}")
+
+                for mode, run in (
+                    ('full-text', lambda: first_page(fts_queryset)),
+                    ('endpoint', endpoint),
+                    ('icontains', lambda: first_page(icontains_queryset)),
+                ):
+                    latencies = []
+                    for _ in range(max(1, options['iterations'])):
+                        started = time.perf_counter()
+                        run()
+                        latencies.append(time.perf_counter() - started)
+                    self.stdout.write(f"  {mode:<10} {format_latency_summary(latencies)}")
+
+            if not options['keep']:
+                transaction.set_rollback(True)
+                self.stdout.write("Seeded cases rolled back.")
+
+    def _text(self, rng, words, planted_ratio):
+        tokens = rng.choices(FILLER_WORDS, k=words)
+        for term in PLANTED_TERMS:
+            if rng.random() < planted_ratio:
+                tokens.insert(rng.randrange(len(tokens) + 1), term)
+        return ' '.join(tokens)
+
+    def _seed(self, case_count, planted_ratio):
+        started = time.perf_counter()
+        rng = random.Random(42)
+        run_id = int(time.time())
+        now = timezone.now()
+        for batch_start in range(0, case_count, SEED_BATCH_SIZE):
+            Case.objects.bulk_create([
+                Case(
+                    title=f'Bench case {index}', case_identifier=f'SEARCH-{run_id}-{index}',
+                    status=CaseStatusChoices.PUBLISHED, published_at=now - timezone.timedelta(seconds=index),
+                    clinical_history=self._text(rng, 40, planted_ratio),
+                    key_findings=self._text(rng, 30, planted_ratio),
+                    diagnosis=self._text(rng, 4, planted_ratio),
+                    discussion=self._text(rng, 120, planted_ratio),
+                )
+                for index in range(batch_start, min(case_count, batch_start + SEED_BATCH_SIZE))
+            ])
+        self.stdout.write(f"Seeded {case_count} cases in {time.perf_counter() - started:.1f}s")
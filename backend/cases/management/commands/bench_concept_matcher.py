@@ -0,0 +1,63 @@
+# backend/cases/management/commands/bench_concept_matcher.py
+import time
+import random
+import string
+
+from django.core.management.base import BaseCommand, CommandError
+
+from cases.concept_matcher import AUTOMATON_MIN_CONCEPTS, KeyConceptMatcher
+from ._timing import format_latency_summary
+
+# Word pool for the synthetic report text; concepts are random letter strings, some copied from the text
+TEXT_WORDS = (
+    "right left lower upper lobe consolidation effusion pleural pneumothorax cardiomegaly normal heart "
+    "size mediastinum airspace opacity bronchial wall thickening hilar lymphadenopathy no acute fracture"
+).split()
+
+
+class Command(BaseCommand):
+    help = (
+        "Microbenchmark for key-concept matching: compares one substring scan per concept with the "
+        "Aho-Corasick automaton for growing numbers of concepts per section, on synthetic report text."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concepts', default='5,20,50,100,150,200,400,800',
+                            help="Comma-separated concept counts per section (default: 5,20,50,100,150,200,400,800).")
+        parser.add_argument('--text-words', type=int, default=300,
+                            help="Words of user text per section (default: 300, about 2,500 characters).")
+        parser.add_argument('--iterations', type=int, default=300,
+                            help="Matches per strategy and concept count (default: 300).")
+        parser.add_argument('--seed', type=int, default=1,
+                            help="Random seed for the synthetic text and concepts (default: 1).")
+
+    def handle(self, *args, **options):
+        try:
+            concept_counts = [int(count) for count in options['concepts'].split(',') if count.strip()]
+        except ValueError:
+            raise CommandError("--concepts must be a comma-separated list of integers.")
+
+        rng = random.Random(options['seed'])
+        iterations = max(1, options['iterations'])
+        text = " ".join(rng.choice(TEXT_WORDS) for _ in range(options['text_words']))
+        self.stdout.write(f"{len(text)} characters of text, {iterations} iterations, automaton used from {AUTOMATON_MIN_CONCEPTS} concepts")
+
+        for concept_count in concept_counts:
+            # Mostly absent concepts, with a tenth taken from the text so both branches are exercised
+            concepts = [
+                " ".join(rng.sample(TEXT_WORDS, 2)) if index % 10 == 0
+                else "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(5, 15)))
+                for index in range(concept_count)
+            ]
+            scan_matcher = KeyConceptMatcher(concepts, automaton_min_concepts=float('inf'))
+            automaton_matcher = KeyConceptMatcher(concepts, automaton_min_concepts=0)
+            if scan_matcher.missing_concepts(text) != automaton_matcher.missing_concepts(text):
+                raise CommandError(f"Strategies disagree for {concept_count} concepts.")
+
+            for label, matcher in (('scan', scan_matcher), ('automaton', automaton_matcher)):
+                latencies = []
+                for _ in range(iterations):
+                    started = time.perf_counter()
+                    matcher.missing_concepts(text)
+                    latencies.append(time.perf_counter() - started)
+                self.stdout.write(f"{concept_count:>5} concepts  {label:<9}  {format_latency_summary(latencies, unit='us')}")
@@ -0,0 +1,57 @@
+# backend/cases/management/commands/bench_feedback_parser.py
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from cases.feedback_parser import parse_llm_feedback_text
+from ._timing import format_latency_summary
+
+DEFAULT_CORPUS_DIR = Path(__file__).resolve().parents[2] / 'test_data' / 'llm_feedback_corpus'
+
+
+class Command(BaseCommand):
+    help = (
+        "Microbenchmark for parse_llm_feedback_text: parses every recorded LLM response in the corpus "
+        "repeatedly and prints the parse time per response."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--corpus', default=str(DEFAULT_CORPUS_DIR),
+                            help="Directory of recorded responses (*.txt) (default: the test corpus).")
+        parser.add_argument('--iterations', type=int, default=200,
+                            help="Parses per response (default: 200).")
+        parser.add_argument('--warmup', type=int, default=10,
+                            help="Untimed parses per response before measuring (default: 10).")
+
+    def handle(self, *args, **options):
+        corpus_dir = Path(options['corpus'])
+        response_paths = sorted(corpus_dir.glob('*.txt'))
+        if not response_paths:
+            raise CommandError(f"No *.txt responses found in {corpus_dir}.")
+
+        iterations = max(1, options['iterations'])
+        all_latencies = []
+        self.stdout.write(f"Parsing {len(response_paths)} responses x {iterations} iterations from {corpus_dir}")
+
+        for response_path in response_paths:
+            with open(response_path, encoding='utf-8', newline='') as response_file:
+                response_text = response_file.read()
+
+            for _ in range(options['warmup']):
+                parse_llm_feedback_text(response_text)
+
+            latencies = []
+            for _ in range(iterations):
+                started = time.perf_counter()
+                parse_llm_feedback_text(response_text)
+                latencies.append(time.perf_counter() - started)
+            all_latencies.extend(latencies)
+
+            self.stdout.write(
+                f"{response_path.stem:<36} {len(response_text):>7} chars  {format_latency_summary(latencies, unit='us')}"
+            )
+
+        total_time = sum(all_latencies)
+        self.stdout.write(f"All responses: {format_latency_summary(all_latencies, unit='us')}")
+        self.stdout.write(self.style.SUCCESS(f"Throughput: {len(all_latencies) / total_time:.0f} parses/s"))
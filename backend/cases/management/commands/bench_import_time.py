@@ -0,0 +1,58 @@
+# backend/cases/management/commands/bench_import_time.py
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ._timing import run_with_importtime
+
+MANAGE_PY = Path(__file__).resolve().parents[3] / 'manage.py'
+
+# Total import time allowed for `manage.py check` in a fresh interpreter
+DEFAULT_BUDGET_MS = 1000
+
+# Modules that must only be imported when feedback is generated, never at startup
+DEFERRED_MODULES = ('google.generativeai', 'google.api_core', 'grpc')
+
+
+def find_deferred_imports(imports):
+    """
+    Returns the DEFERRED_MODULES (or their submodules) found in parsed -X importtime output.
+    """
+    return sorted({
+        module for module, _, _, _ in imports
+        if any(module == deferred or module.startswith(deferred + '.') for deferred in DEFERRED_MODULES)
+    })
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures process startup: runs a manage.py command under `python -X importtime` in a fresh "
+        "interpreter, prints the slowest imports and fails if the total import time exceeds the budget "
+        "or the Gemini SDK is imported at startup."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('manage_args', nargs='*', default=['check'],
+                            help="manage.py command to measure (default: check).")
+        parser.add_argument('--budget-ms', type=float, default=DEFAULT_BUDGET_MS,
+                            help=f"Allowed total import time in milliseconds (default: {DEFAULT_BUDGET_MS}).")
+        parser.add_argument('--top', type=int, default=15,
+                            help="Number of slowest top-level imports to list (default: 15).")
+
+    def handle(self, *args, **options):
+        manage_args = options['manage_args'] or ['check']
+        self.stdout.write(f"Measuring imports of `manage.py {' '.join(manage_args)}`")
+        imports, wall_seconds = run_with_importtime([str(MANAGE_PY), *manage_args])
+
+        top_level = [entry for entry in imports if entry[3] == 0]
+        total_ms = sum(cumulative_us for _, _, cumulative_us, _ in top_level) / 1000.0
+        for module, _, cumulative_us, _ in sorted(top_level, key=lambda entry: -entry[2])[:options['top']]:
+            self.stdout.write(f"{cumulative_us / 1000.0:>9.1f} ms  {module}")
+        self.stdout.write(f"{len(imports)} modules imported in {total_ms:.1f} ms (process wall time {wall_seconds * 1000:.0f} ms)")
+
+        deferred_imports = find_deferred_imports(imports)
+        if deferred_imports:
+            raise CommandError(f"Imported at startup but should be deferred: {', '.join(deferred_imports[:5])}")
+        if total_ms > options['budget_ms']:
+            raise CommandError(f"Import time {total_ms:.1f} ms exceeds the budget of {options['budget_ms']:.0f} ms")
+        self.stdout.write(self.style.SUCCESS(f"Within the {options['budget_ms']:.0f} ms import budget"))
@@ -0,0 +1,106 @@
+# backend/cases/management/commands/bench_pagination.py
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from cases.models import Case, CaseStatusChoices, Report
+from cases.pagination import PublishedCasePagination, SubmittedReportPagination
+from cases.views import MyReportsListView, UserCaseViewSet
+from ._timing import format_latency_summary
+
+SEED_BATCH_SIZE = 10000
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks the published case list and my-reports endpoints by page depth, comparing keyset "
+        "(cursor) pages with page-number pages. Seeds synthetic cases and reports inside a transaction "
+        "that is rolled back afterwards (unless --keep)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cases', type=int, default=100000,
+                            help="Published cases to seed (default: 100000).")
+        parser.add_argument('--reports', type=int, default=1000000,
+                            help="Reports to seed, spread over --users users (default: 1000000).")
+        parser.add_argument('--users', type=int, default=20,
+                            help="Users owning the seeded reports; the first one is paged (default: 20).")
+        parser.add_argument('--depths', default='1,10,100,1000,5000',
+                            help="Comma-separated page numbers to measure (default: 1,10,100,1000,5000).")
+        parser.add_argument('--iterations', type=int, default=5,
+                            help="Requests per endpoint, mode and depth (default: 5).")
+        parser.add_argument('--keep', action='store_true',
+                            help="Commit the seeded rows instead of rolling them back.")
+
+    def handle(self, *args, **options):
+        try:
+            depths = [int(depth) for depth in options['depths'].split(',') if depth.strip()]
+        except ValueError:
+            raise CommandError("--depths must be a comma-separated list of integers.")
+        if options['users'] < 1 or options['cases'] < 1:
+            raise CommandError("--users and --cases must be at least 1.")
+
+        with transaction.atomic():
+            users = self._seed(options['cases'], options['reports'], options['users'])
+            # Requests are built for a configured host so that absolute next/previous links can be rendered
+            factory = APIRequestFactory(SERVER_NAME=(settings.ALLOWED_HOSTS or ['localhost'])[0].lstrip('.'))
+            endpoints = (
+                ('cases', UserCaseViewSet.as_view({'get': 'list'}), '/api/cases/cases/', PublishedCasePagination(),
+                 Case.objects.filter(status=CaseStatusChoices.PUBLISHED)),
+                ('my-reports', MyReportsListView.as_view(), '/api/cases/my-reports/', SubmittedReportPagination(),
+                 Report.objects.filter(user=users[0], is_archived=False)),
+            )
+            for label, view, path, paginator, queryset in endpoints:
+                total_rows = queryset.count()
+                self.stdout.write(f"{label}: {total_rows} rows for the paged user")
+                for depth in depths:
+                    offset = (depth - 1) * paginator.page_size
+                    if offset >= total_rows:
+                        continue
+                    # The row just before the page, as the previous page's next link would point at it
+                    cursor_params = {}
+                    if offset:
+                        last_row = queryset.order_by(*paginator.ordering)[offset - 1]
+                        cursor_params = {paginator.cursor_query_param: paginator.encode_cursor(last_row, reverse=False)}
+                    for mode, params in (('keyset', cursor_params), ('page', {paginator.page_query_param: depth})):
+                        latencies = []
+                        for _ in range(max(1, options['iterations'])):
+                            request = factory.get(path, params)
+                            force_authenticate(request, user=users[0])
+                            started = time.perf_counter()
+                            response = view(request)
+                            response.render()
+                            latencies.append(time.perf_counter() - started)
+                            if response.status_code != 200:
+                                raise CommandError(f"{label} {mode} page {depth}: HTTP {response.status_code}")
+                        self.stdout.write(f"  page {depth:>6}  {mode:<6}  {format_latency_summary(latencies)}")
+
+            if not options['keep']:
+                transaction.set_rollback(True)
+                self.stdout.write("Seeded rows rolled back.")
+
+    def _seed(self, case_count, report_count, user_count):
+        started = time.perf_counter()
+        run_id = int(time.time())
+        users = User.objects.bulk_create([User(username=f'bench-{run_id}-{index}') for index in range(user_count)])
+        now = timezone.now()
+        cases = []
+        for batch_start in range(0, case_count, SEED_BATCH_SIZE):
+            cases += Case.objects.bulk_create([
+                Case(title=f'Bench case {index}', case_identifier=f'BENCH-{run_id}-{index}', clinical_history='',
+                     status=CaseStatusChoices.PUBLISHED, published_at=now - timedelta(seconds=index))
+                for index in range(batch_start, min(case_count, batch_start + SEED_BATCH_SIZE))
+            ])
+        for batch_start in range(0, report_count, SEED_BATCH_SIZE):
+            Report.objects.bulk_create([
+                Report(user=users[index % user_count], case=cases[index % case_count], structured_content=[])
+                for index in range(batch_start, min(report_count, batch_start + SEED_BATCH_SIZE))
+            ])
+        self.stdout.write(f"Seeded {case_count} cases and {report_count} reports in {time.perf_counter() - started:.1f}s")
+        return users
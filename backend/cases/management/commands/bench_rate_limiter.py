@@ -0,0 +1,83 @@
+# backend/cases/management/commands/bench_rate_limiter.py
+import time
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from cases.models import RateLimitBucket
+from cases.rate_limiter import TokenBucketRateLimiter
+from ._timing import format_latency_summary
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks the shared token-bucket rate limiter by driving many concurrent callers against a "
+        "throwaway bucket and checks that the number of granted calls never exceeds the configured rate."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--callers', type=int, default=32, help="Number of concurrent caller threads (default: 32).")
+        parser.add_argument('--duration', type=float, default=10.0, help="Benchmark duration in seconds (default: 10).")
+        parser.add_argument('--rate', type=float, default=60.0, help="Bucket rate in calls per minute (default: 60).")
+        parser.add_argument('--capacity', type=float, default=None, help="Bucket capacity (default: same as --rate).")
+
+    def handle(self, *args, **options):
+        bucket_name = f"bench-{int(time.time())}"
+        limiter = TokenBucketRateLimiter(bucket_name, rate_per_minute=options['rate'], capacity=options['capacity'])
+        duration = options['duration']
+
+        lock = threading.Lock()
+        latencies = []
+        granted_count = 0
+        rejected_count = 0
+        errors = []
+
+        def caller(stop_at):
+            nonlocal granted_count, rejected_count
+            try:
+                while time.monotonic() < stop_at:
+                    started = time.perf_counter()
+                    granted, retry_after = limiter.try_acquire()
+                    elapsed = time.perf_counter() - started
+                    with lock:
+                        latencies.append(elapsed)
+                        if granted:
+                            granted_count += 1
+                        else:
+                            rejected_count += 1
+                    if not granted:
+                        # Well-behaved callers back off for the hinted time (capped to keep the load up)
+                        time.sleep(min(retry_after, 0.05))
+            except Exception as e:
+                with lock:
+                    errors.append(e)
+            finally:
+                connection.close()
+
+        self.stdout.write(
+            f"Driving {options['callers']} callers for {duration:.0f}s against bucket '{bucket_name}' "
+            f"(rate={options['rate']:.0f}/min, capacity={limiter.capacity:.0f})..."
+        )
+        stop_at = time.monotonic() + duration
+        threads = [threading.Thread(target=caller, args=(stop_at,)) for _ in range(options['callers'])]
+        wall_start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall_time = time.perf_counter() - wall_start
+
+        RateLimitBucket.objects.filter(name=bucket_name).delete()
+
+        allowed_max = limiter.capacity + limiter.rate_per_second * wall_time
+        self.stdout.write(f"Attempts: {granted_count + rejected_count} ({(granted_count + rejected_count) / wall_time:.0f}/s)")
+        self.stdout.write(f"Granted:  {granted_count} (upper bound for {wall_time:.1f}s: {allowed_max:.1f})")
+        self.stdout.write(f"Rejected: {rejected_count}")
+        self.stdout.write(f"try_acquire latency: {format_latency_summary(latencies)}")
+        if errors:
+            self.stdout.write(self.style.ERROR(f"{len(errors)} caller(s) failed, first error: {errors[0]!r}"))
+        if granted_count > allowed_max + 1e-6:
+            self.stdout.write(self.style.ERROR("FAIL: more calls were granted than the bucket allows."))
+        else:
+            self.stdout.write(self.style.SUCCESS("OK: granted calls stayed within the configured rate."))
@@ -0,0 +1,55 @@
+# backend/cases/management/commands/compare_cohort.py
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+
+from cases.models import Case
+from cases.cohort_comparison import CohortComparisonError, compare_case_cohort
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares every current report on a case with the expert template in one batch (the same "
+        "pre-analysis as AI feedback, without LLM calls) and prints per-section aggregates, or the full "
+        "result as JSON. Same data as GET /api/cases/admin/cases/<id>/cohort-comparison/."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('case_id', type=int, help="ID of the case to compare.")
+        parser.add_argument('--include-archived', action='store_true',
+                            help="Also compare archived reports.")
+        parser.add_argument('--json', action='store_true',
+                            help="Print the full result, including per-report rows, as JSON.")
+        parser.add_argument('--top-missing', type=int, default=5,
+                            help="Most-missed key concepts to list per section (default: 5).")
+
+    def handle(self, *args, **options):
+        case_instance = Case.objects.filter(pk=options['case_id']).first()
+        if not case_instance:
+            raise CommandError(f"Case {options['case_id']} does not exist.")
+        try:
+            result = compare_case_cohort(case_instance, include_archived=options['include_archived'])
+        except CohortComparisonError as e:
+            raise CommandError(e.message)
+
+        if options['json']:
+            self.stdout.write(json.dumps(result, cls=DjangoJSONEncoder, indent=2))
+            return
+
+        self.stdout.write(
+            f"Case {result['case_id']}: {result['report_count']} report(s) compared in {result['elapsed_ms']:.1f} ms"
+            + (f" ({result['ms_per_report']:.3f} ms per report)" if result['report_count'] else "")
+        )
+        for status_name, count in sorted(result['diagnosis_status_counts'].items(), key=lambda item: -item[1]):
+            self.stdout.write(f"  Diagnosis: {status_name}: {count}")
+        for section in result['sections']:
+            similarity = section['similarity']
+            self.stdout.write(
+                f"{section['section_name']}: {section['reports_scored']} scored"
+                + (f", similarity mean {similarity['mean']:.2f} median {similarity['median']:.2f} "
+                   f"min {similarity['min']:.2f} max {similarity['max']:.2f}" if similarity else "")
+                + f", {section['identical_count']} identical, {section['all_concepts_addressed_count']} with all key concepts"
+            )
+            for missed in section['missed_key_concepts'][:options['top_missing']]:
+                self.stdout.write(f"    missed by {missed['missed_by']}: {missed['concept']}")
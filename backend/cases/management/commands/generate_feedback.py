@@ -0,0 +1,206 @@
+# backend/cases/management/commands/generate_feedback.py
+import os
+import time
+import socket
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, time as datetime_time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from cases.models import Report, SubspecialtyChoices
+from cases.feedback_jobs import defer_job, finish_inline_job, start_inline_job, touch_job
+from cases.feedback_pipeline import FeedbackGenerationError, generate_feedback_content, save_feedback_content
+from cases.llm_feedback_service import PROMPT_VERSION
+from cases.llm_providers import set_llm_provider
+from cases.rate_limiter import RateLimitExceeded
+from cases.circuit_breaker import CircuitOpenError
+from ._timing import format_latency_summary
+
+
+class Command(BaseCommand):
+    help = (
+        "Generates (or regenerates) AI feedback for existing reports, selected by case, subspecialty or "
+        "submission date. Work is spread over a bounded thread pool that waits on the shared Gemini rate "
+        "limit. Reports already generated with the current prompt version are skipped, so an interrupted "
+        "run can simply be started again. Each report is claimed as a running feedback job, so reports "
+        "that a worker or a streaming request is already generating are skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--case', type=int, action='append', dest='case_ids', default=[],
+                            help="Only reports for this case ID (repeatable).")
+        parser.add_argument('--subspecialty', choices=SubspecialtyChoices.values, default=None,
+                            help="Only reports for cases in this subspecialty.")
+        parser.add_argument('--submitted-after', default=None,
+                            help="Only reports submitted on or after this date (YYYY-MM-DD).")
+        parser.add_argument('--submitted-before', default=None,
+                            help="Only reports submitted before this date (YYYY-MM-DD).")
+        parser.add_argument('--include-archived', action='store_true',
+                            help="Also process archived reports.")
+        parser.add_argument('--force', action='store_true',
+                            help="Regenerate feedback even if it is up to date, bypassing the feedback cache. "
+                                 "Combine with --checkpoint to make a forced run resumable.")
+        parser.add_argument('--checkpoint', default=None,
+                            help="File recording finished report IDs; reports listed in it are skipped on the next run.")
+        parser.add_argument('--concurrency', type=int, default=4,
+                            help="Number of worker threads (default: 4).")
+        parser.add_argument('--limit', type=int, default=0,
+                            help="Process at most this many reports (default: 0, no limit).")
+        parser.add_argument('--max-rate-limit-wait', type=float, default=300.0,
+                            help="Give up on a report after waiting this many seconds for the rate limit or an open "
+                                 "circuit breaker (default: 300).")
+        parser.add_argument('--fake-llm', action='store_true',
+                            help="Use the offline fake LLM provider (for benchmarking the pipeline).")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Only print how many reports would be processed.")
+
+    def _parse_date(self, value, option_name):
+        try:
+            parsed = datetime.strptime(value, '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError(f"{option_name} must be a date in YYYY-MM-DD format, got '{value}'.")
+        return timezone.make_aware(datetime.combine(parsed, datetime_time.min))
+
+    def _select_reports(self, options):
+        reports = Report.objects.all()
+        if options['case_ids']:
+            reports = reports.filter(case_id__in=options['case_ids'])
+        if options['subspecialty']:
+            reports = reports.filter(case__subspecialty=options['subspecialty'])
+        if options['submitted_after']:
+            reports = reports.filter(submitted_at__gte=self._parse_date(options['submitted_after'], '--submitted-after'))
+        if options['submitted_before']:
+            reports = reports.filter(submitted_at__lt=self._parse_date(options['submitted_before'], '--submitted-before'))
+        if not options['include_archived']:
+            reports = reports.filter(is_archived=False)
+        if not options['force']:
+            # Resume point: feedback produced with the current prompt is already done
+            reports = reports.filter(
+                Q(ai_feedback_content__prompt_version__isnull=True) |
+                ~Q(ai_feedback_content__prompt_version=PROMPT_VERSION)
+            )
+        return reports.order_by('id')
+
+    def _load_checkpoint(self, checkpoint_path):
+        if not checkpoint_path or not os.path.exists(checkpoint_path):
+            return set()
+        with open(checkpoint_path, encoding='utf-8') as checkpoint_file:
+            return {int(line) for line in checkpoint_file if line.strip().isdigit()}
+
+    def _generate_one(self, report_id, force, max_rate_limit_wait, worker_id):
+        """
+        Generates and saves feedback for one report, waiting out rate limiting.
+        Returns (outcome, elapsed_seconds, message) where outcome is 'generated', 'cached', 'skipped' or 'failed'.
+        """
+        close_old_connections()
+        started = time.perf_counter()
+        waited = 0.0
+        try:
+            report = Report.objects.select_related('case', 'case__master_template', 'user').get(pk=report_id)
+            # Single-flight with the workers and streaming requests, which claim reports the same way
+            job, created = start_inline_job(report, worker_id=worker_id)
+            if not created:
+                return 'skipped', time.perf_counter() - started, f"AI feedback job {job.id} is already generating it"
+        except Report.DoesNotExist:
+            return 'failed', time.perf_counter() - started, "report no longer exists"
+
+        try:
+            while True:
+                try:
+                    content = generate_feedback_content(report, check_cache=not force)
+                    break
+                except (RateLimitExceeded, CircuitOpenError) as e:
+                    if waited >= max_rate_limit_wait:
+                        reason = "the rate limit" if isinstance(e, RateLimitExceeded) else "Gemini to recover"
+                        defer_job(job, e.retry_after, reason=reason)
+                        return 'failed', time.perf_counter() - started, \
+                            f"gave up after waiting {waited:.0f}s for {reason}; queued for the feedback workers"
+                    # Jitter keeps the threads from waking up in lockstep
+                    delay = e.retry_after + random.uniform(0, 0.5)
+                    time.sleep(delay)
+                    waited += delay
+                    touch_job(job)
+
+            with transaction.atomic():
+                save_feedback_content(report, content)
+            finish_inline_job(job)
+            outcome = 'cached' if content.get('from_cache') else 'generated'
+            return outcome, time.perf_counter() - started, None
+        except FeedbackGenerationError as e:
+            finish_inline_job(job, e.message)
+            return 'failed', time.perf_counter() - started, e.message
+        except Exception as e:
+            finish_inline_job(job, "An unexpected error occurred. Please try again later.")
+            return 'failed', time.perf_counter() - started, f"unexpected error: {e!r}"
+        finally:
+            close_old_connections()
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1:
+            raise CommandError("--concurrency must be at least 1.")
+        if options['fake_llm']:
+            set_llm_provider('fake')
+            self.stdout.write(self.style.WARNING("Fake LLM mode enabled: no Gemini calls will be made."))
+
+        report_ids = list(self._select_reports(options).values_list('id', flat=True))
+        done_ids = self._load_checkpoint(options['checkpoint'])
+        if done_ids:
+            report_ids = [report_id for report_id in report_ids if report_id not in done_ids]
+            self.stdout.write(f"Skipping {len(done_ids)} report(s) listed in checkpoint {options['checkpoint']}.")
+        if options['limit']:
+            report_ids = report_ids[:options['limit']]
+
+        self.stdout.write(f"{len(report_ids)} report(s) to process (prompt version {PROMPT_VERSION}).")
+        if options['dry_run'] or not report_ids:
+            return
+
+        checkpoint_file = open(options['checkpoint'], 'a', encoding='utf-8') if options['checkpoint'] else None
+        checkpoint_lock = threading.Lock()
+        counts = {'generated': 0, 'cached': 0, 'skipped': 0, 'failed': 0}
+        worker_id = f"bulk:{socket.gethostname()}:{os.getpid()}"
+        latencies = []
+        wall_start = time.perf_counter()
+
+        executor = ThreadPoolExecutor(max_workers=options['concurrency'])
+        futures = {
+            executor.submit(self._generate_one, report_id, options['force'], options['max_rate_limit_wait'], worker_id): report_id
+            for report_id in report_ids
+        }
+        try:
+            for index, future in enumerate(as_completed(futures), start=1):
+                report_id = futures[future]
+                outcome, elapsed, message = future.result()
+                counts[outcome] += 1
+                if outcome == 'failed':
+                    self.stdout.write(self.style.ERROR(f"[{index}/{len(report_ids)}] Report {report_id}: failed ({message})"))
+                    continue
+                if outcome == 'skipped':
+                    self.stdout.write(self.style.WARNING(f"[{index}/{len(report_ids)}] Report {report_id}: skipped ({message})"))
+                    continue
+
+                latencies.append(elapsed)
+                if checkpoint_file:
+                    with checkpoint_lock:
+                        checkpoint_file.write(f"{report_id}\n")
+                        checkpoint_file.flush()
+                self.stdout.write(f"[{index}/{len(report_ids)}] Report {report_id}: {outcome} in {elapsed:.2f}s")
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING("Interrupted: finishing in-flight reports, re-run the command to resume."))
+            executor.shutdown(wait=True, cancel_futures=True)
+        finally:
+            executor.shutdown(wait=True)
+            if checkpoint_file:
+                checkpoint_file.close()
+
+        wall_time = time.perf_counter() - wall_start
+        completed = counts['generated'] + counts['cached']
+        self.stdout.write(
+            f"Done in {wall_time:.1f}s: {counts['generated']} generated, {counts['cached']} from cache, "
+            f"{counts['skipped']} skipped, {counts['failed']} failed ({completed / wall_time:.2f} reports/s)."
+        )
+        self.stdout.write(f"Per-report latency: {format_latency_summary(latencies, unit='s')}")
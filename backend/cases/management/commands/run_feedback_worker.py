@@ -0,0 +1,66 @@
+# backend/cases/management/commands/run_feedback_worker.py
+import os
+import socket
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from cases.llm_providers import set_llm_provider
+from cases.feedback_jobs import claim_next_job, requeue_stale_jobs, run_feedback_job
+
+
+class Command(BaseCommand):
+    help = "Runs a worker that processes queued AI feedback jobs. Start several processes to scale out."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--poll-interval', type=float, default=2.0,
+                            help="Seconds to sleep when the queue is empty (default: 2).")
+        parser.add_argument('--max-jobs', type=int, default=0,
+                            help="Exit after processing this many jobs (default: 0, run forever).")
+        parser.add_argument('--once', action='store_true',
+                            help="Drain the queue and exit instead of polling.")
+        parser.add_argument('--worker-id', default=None,
+                            help="Identifier recorded on claimed jobs (default: hostname:pid).")
+        parser.add_argument('--fake-llm', action='store_true',
+                            help="Use the offline fake LLM provider instead of the configured one (for load testing).")
+
+    def handle(self, *args, **options):
+        worker_id = options['worker_id'] or f"{socket.gethostname()}:{os.getpid()}"
+        poll_interval = options['poll_interval']
+        max_jobs = options['max_jobs']
+
+        if options['fake_llm']:
+            set_llm_provider('fake')
+            self.stdout.write(self.style.WARNING("Fake LLM mode enabled: no Gemini calls will be made."))
+
+        self.stdout.write(f"AI feedback worker {worker_id} started.")
+        processed = 0
+        last_stale_check = 0.0
+
+        try:
+            while True:
+                close_old_connections()
+
+                # Recover jobs orphaned by crashed workers about once a minute
+                if time.monotonic() - last_stale_check > 60:
+                    requeue_stale_jobs()
+                    last_stale_check = time.monotonic()
+
+                job = claim_next_job(worker_id)
+                if job is None:
+                    if options['once']:
+                        break
+                    time.sleep(poll_interval)
+                    continue
+
+                run_feedback_job(job)
+                processed += 1
+                self.stdout.write(f"Job {job.id} (report {job.report_id}): {job.status}")
+
+                if max_jobs and processed >= max_jobs:
+                    break
+        except KeyboardInterrupt:
+            self.stdout.write("Interrupted, shutting down.")
+
+        self.stdout.write(self.style.SUCCESS(f"AI feedback worker {worker_id} processed {processed} job(s)."))
@@ -0,0 +1,39 @@
+# Generated by Django 5.2 on 2026-10-17 03:27
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cases', '0007_alter_report_unique_together_report_is_archived'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedbackJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], default='queued', max_length=20)),
+                ('attempts', models.PositiveIntegerField(default=0, help_text='Number of times a worker has picked up this job.')),
+                ('error_message', models.TextField(blank=True, help_text='User-facing error message if the job failed.', null=True)),
+                ('worker_id', models.CharField(blank=True, help_text='Identifier of the worker that last claimed this job.', max_length=100, null=True)),
+                ('available_at', models.DateTimeField(default=django.utils.timezone.now, help_text='The job is not picked up by workers before this time (used for retry backoff).')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('report', models.ForeignKey(help_text='The report this AI feedback job generates feedback for.', on_delete=django.db.models.deletion.CASCADE, related_name='feedback_jobs', to='cases.report')),
+                ('requested_by', models.ForeignKey(blank=True, help_text='The user who requested the AI feedback.', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='feedback_jobs_requested', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'AI Feedback Job',
+                'verbose_name_plural': 'AI Feedback Jobs',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'available_at'], name='feedbackjob_status_avail_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2 on 2026-10-17 03:29
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cases', '0008_feedbackjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedbackCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cache_key', models.CharField(help_text='SHA-256 of the normalized report, expert template, case text and prompt version.', max_length=64, unique=True)),
+                ('prompt_version', models.CharField(max_length=50)),
+                ('raw_llm_feedback', models.TextField()),
+                ('structured_feedback', models.JSONField(default=dict)),
+                ('hit_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_accessed_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('case', models.ForeignKey(help_text='The case this cached feedback was generated for (used for invalidation).', on_delete=django.db.models.deletion.CASCADE, related_name='feedback_cache_entries', to='cases.case')),
+            ],
+            options={
+                'verbose_name': 'Cached AI Feedback',
+                'verbose_name_plural': 'Cached AI Feedback',
+                'ordering': ['-last_accessed_at'],
+            },
+        ),
+    ]
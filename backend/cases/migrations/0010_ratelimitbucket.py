@@ -0,0 +1,26 @@
+# Generated by Django 5.2 on 2026-10-17 03:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cases', '0009_feedbackcacheentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RateLimitBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(help_text="Identifier of the rate-limited resource (e.g., 'gemini').", max_length=100, unique=True)),
+                ('tokens', models.FloatField(help_text='Tokens currently available in the bucket.')),
+                ('last_refill', models.FloatField(help_text='Unix timestamp of the last refill calculation.')),
+            ],
+            options={
+                'verbose_name': 'Rate Limit Bucket',
+                'verbose_name_plural': 'Rate Limit Buckets',
+            },
+        ),
+    ]
@@ -0,0 +1,115 @@
+# Generated by Django 5.2 on 2026-10-17 04:07
+
+import re
+
+from django.db import migrations, models
+
+
+# Frozen copy of cases.concept_index as of CONCEPT_INDEX_VERSION 1, so later changes to the
+# normalizer do not change what this migration writes. Indexes of an older version are rebuilt
+# when used, so this backfill never needs to follow the current normalizer.
+CONCEPT_INDEX_VERSION = 1
+
+TOKEN_PATTERN = re.compile(r"[^\W_]+")
+CLAUSE_BOUNDARY_PATTERN = re.compile(r"[.;:!?\n]+|\b(?:but|however|although|though|except|whereas)\b")
+
+NEGATION_CUES = frozenset({
+    'no', 'not', 'without', 'absent', 'absence', 'negative', 'free', 'none', 'neither', 'nor',
+    'never', 'resolved', 'excluded', 'unremarkable',
+})
+STOPWORDS = frozenset({
+    'a', 'an', 'the', 'of', 'is', 'are', 'was', 'were', 'be', 'been', 'there', 'any', 'evidence',
+    'seen', 'identified', 'present', 'demonstrated', 'visualized', 'visualised', 'noted', 'detected',
+    'to', 'for', 'in', 'on', 'at', 'as', 'by', 'and', 'or', 'with', 'ruled', 'out', 'signs', 'sign',
+})
+NEGATION_WINDOW = 5
+
+
+def light_stem(token):
+    if len(token) <= 3 or not token.isalpha():
+        return token
+    if token.endswith('ies') and len(token) > 4:
+        token = token[:-3] + 'y'
+    elif token.endswith('sses'):
+        token = token[:-2]
+    elif token.endswith('es') and not token.endswith(('aes', 'ees', 'oes')):
+        token = token[:-1]
+    elif token.endswith('s') and not token.endswith(('us', 'ss', 'is')):
+        token = token[:-1]
+    if token.endswith('ing') and len(token) > 6:
+        token = token[:-3]
+    elif token.endswith('ed') and len(token) > 5:
+        token = token[:-2]
+    if token.endswith('e') and len(token) > 4:
+        token = token[:-1]
+    return token
+
+
+def analyze_clause(words):
+    content = []
+    cue_positions = []
+    for position, word in enumerate(words):
+        if word in NEGATION_CUES:
+            cue_positions.append(position)
+        elif word not in STOPWORDS:
+            content.append((position, light_stem(word)))
+
+    negated_positions = set()
+    for cue_position in cue_positions:
+        following = [position for position, _ in content if position > cue_position][:NEGATION_WINDOW]
+        if following:
+            negated_positions.update(following)
+        else:
+            negated_positions.update(position for position, _ in content if position < cue_position)
+
+    affirmed = frozenset(stem for position, stem in content if position not in negated_positions)
+    negated = frozenset(stem for position, stem in content if position in negated_positions)
+    return affirmed, negated
+
+
+def normalize_concept(concept):
+    affirmed, negated = set(), set()
+    for clause in CLAUSE_BOUNDARY_PATTERN.split(concept.casefold()):
+        words = TOKEN_PATTERN.findall(clause)
+        if words:
+            clause_affirmed, clause_negated = analyze_clause(words)
+            affirmed |= clause_affirmed
+            negated |= clause_negated
+    is_negated = bool(negated) and not affirmed
+    return {
+        'concept': concept,
+        'tokens': sorted(negated if is_negated else affirmed | negated),
+        'negated': is_negated,
+    }
+
+
+def build_concept_index(key_concepts_text):
+    concepts = [kc.strip() for kc in (key_concepts_text or '').split(';') if kc.strip()]
+    return {
+        'version': CONCEPT_INDEX_VERSION,
+        'concepts': [normalize_concept(concept) for concept in concepts],
+    }
+
+
+def build_key_concepts_indexes(apps, schema_editor):
+    CaseTemplateSectionContent = apps.get_model('cases', 'CaseTemplateSectionContent')
+    section_contents = list(CaseTemplateSectionContent.objects.only('id', 'key_concepts_text'))
+    for section_content in section_contents:
+        section_content.key_concepts_index = build_concept_index(section_content.key_concepts_text)
+    CaseTemplateSectionContent.objects.bulk_update(section_contents, ['key_concepts_index'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cases', '0010_ratelimitbucket'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='casetemplatesectioncontent',
+            name='key_concepts_index',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Normalized forms of key_concepts_text used by the pre-analysis, computed on save (see concept_index.py).'),
+        ),
+        migrations.RunPython(build_key_concepts_indexes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-17 04:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cases', '0011_casetemplatesectioncontent_key_concepts_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='report',
+            name='pre_analysis',
+            field=models.JSONField(blank=True, default=dict, help_text='Programmatic comparison with the expert template, stored at submission (see pre_analysis.py).'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2 on 2026-10-17 04:24
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cases', '0012_report_pre_analysis'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='case',
+            index=models.Index(fields=['status', '-published_at', '-id'], name='case_status_published_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='report',
+            index=models.Index(condition=models.Q(('is_archived', False)), fields=['user', '-submitted_at', '-id'], name='report_user_submitted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='report',
+            index=models.Index(fields=['user', 'case'], name='report_user_case_idx'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2 on 2026-10-17 05:02
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cases', '0015_case_search_vectors'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='language',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
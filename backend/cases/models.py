@@ -2,10 +2,17 @@
 
 from django.db import models
 from django.conf import settings # To get the User model
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.utils.translation import gettext_lazy as _
 from django.utils import timezone
 import uuid # For potentially unique parts of case_identifier
 
+from .concept_index import build_concept_index
+
+# Text search configuration of the case search vectors (see cases/case_search.py)
+CASE_SEARCH_CONFIG = 'english'
+
 # --- Choices (can be at the top) ---
 
 class ModalityChoices(models.TextChoices):
@@ -53,6 +60,12 @@ class PatientSexChoices(models.TextChoices):
     OTHER = 'Other', _('Other')
     UNKNOWN = 'Unknown', _('Unknown')
 
+class FeedbackJobStatusChoices(models.TextChoices):
+    QUEUED = 'queued', _('Queued')
+    RUNNING = 'running', _('Running')
+    COMPLETED = 'completed', _('Completed')
+    FAILED = 'failed', _('Failed')
+
 
 # --- Models ---
 
@@ -60,6 +73,7 @@ class Language(models.Model):
     code = models.CharField(max_length=5, unique=True, help_text="Language code (e.g., 'en', 'es')")
     name = models.CharField(max_length=100, help_text="Full language name (e.g., 'English')")
     is_active = models.BooleanField(default=True, help_text="Is this language available for templates?")
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"{self.name} ({self.code})"
@@ -204,11 +218,44 @@ class Case(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     published_at = models.DateTimeField(null=True, blank=True, help_text="Date when the case becomes publicly visible.")
 
+    # Weighted full-text search vectors, kept up to date by the database (stored generated columns).
+    # The expert answer is kept apart so that search can leave it out for users who have not
+    # reported the case yet.
+    search_vector = models.GeneratedField(
+        expression=(
+            SearchVector('title', weight='A', config=CASE_SEARCH_CONFIG)
+            + SearchVector('clinical_history', weight='B', config=CASE_SEARCH_CONFIG)
+        ),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
+    expert_search_vector = models.GeneratedField(
+        expression=(
+            SearchVector('diagnosis', weight='A', config=CASE_SEARCH_CONFIG)
+            + SearchVector('key_findings', weight='B', config=CASE_SEARCH_CONFIG)
+            + SearchVector('discussion', weight='C', config=CASE_SEARCH_CONFIG)
+        ),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
+
     def __str__(self):
         return self.case_identifier if self.case_identifier else f"Case {self.id} (No Identifier) - {self.title}"
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination of the published case list (PublishedCasePagination)
+            models.Index(fields=['status', '-published_at', '-id'], name='case_status_published_idx'),
+            # Admin case list: newest first, optionally filtered by status, subspecialty or modality
+            models.Index(fields=['-created_at', '-id'], name='case_created_idx'),
+            models.Index(fields=['status', '-created_at'], name='case_status_created_idx'),
+            models.Index(fields=['subspecialty', '-created_at'], name='case_subspecialty_created_idx'),
+            models.Index(fields=['modality', '-created_at'], name='case_modality_created_idx'),
+            # Full-text case search
+            GinIndex(fields=['search_vector'], name='case_search_vector_gin'),
+            GinIndex(fields=['expert_search_vector'], name='case_expert_search_gin'),
+        ]
 
     def save(self, *args, **kwargs):
         if self.status == CaseStatusChoices.PUBLISHED and not self.published_at:
@@ -305,10 +352,23 @@ class CaseTemplateSectionContent(models.Model):
         null=True, 
         help_text="Admin-defined, case-specific key concepts for this section of this expert template (semicolon-separated phrases)."
     )
+    key_concepts_index = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        help_text="Normalized forms of key_concepts_text used by the pre-analysis, computed on save (see concept_index.py)."
+    )
 
     def __str__(self):
         return f"Content for '{self.master_section.name}' in {self.case_template}"
 
+    def save(self, *args, **kwargs):
+        self.key_concepts_index = build_concept_index(self.key_concepts_text)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'key_concepts_text' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'key_concepts_index'}
+        super().save(*args, **kwargs)
+
     class Meta:
         ordering = ['case_template', 'master_section__order']
         unique_together = ('case_template', 'master_section')
@@ -328,6 +388,11 @@ class Report(models.Model):
         blank=True,
         help_text="Stores the AI-generated feedback content for this report."
     )
+    pre_analysis = models.JSONField(
+        default=dict,
+        blank=True,
+        help_text="Programmatic comparison with the expert template, stored at submission (see pre_analysis.py)."
+    )
     is_archived = models.BooleanField(
         default=False,
         help_text="Flag to mark this report as archived. Archived reports are kept for history but not shown as the current report."
@@ -340,9 +405,97 @@ class Report(models.Model):
 
     class Meta:
         ordering = ['-submitted_at']
+        indexes = [
+            # Keyset pagination of a user's current reports (SubmittedReportPagination)
+            models.Index(fields=['user', '-submitted_at', '-id'], condition=models.Q(is_archived=False),
+                         name='report_user_submitted_idx'),
+            # A user's reports on a case (the case list's user_has_reported flag, case resets)
+            models.Index(fields=['user', 'case'], name='report_user_case_idx'),
+        ]
         # Removed the unique_together constraint to allow multiple reports per user/case
         # With the is_archived flag we can track which one is the current active report
 
+class FeedbackJob(models.Model):
+    report = models.ForeignKey(
+        Report,
+        on_delete=models.CASCADE,
+        related_name='feedback_jobs',
+        help_text="The report this AI feedback job generates feedback for."
+    )
+    requested_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True, blank=True,
+        related_name='feedback_jobs_requested',
+        help_text="The user who requested the AI feedback."
+    )
+    status = models.CharField(
+        max_length=20,
+        choices=FeedbackJobStatusChoices.choices,
+        default=FeedbackJobStatusChoices.QUEUED
+    )
+    attempts = models.PositiveIntegerField(default=0, help_text="Number of times a worker has picked up this job.")
+    error_message = models.TextField(blank=True, null=True, help_text="User-facing error message if the job failed.")
+    worker_id = models.CharField(max_length=100, blank=True, null=True, help_text="Identifier of the worker that last claimed this job.")
+    available_at = models.DateTimeField(default=timezone.now, help_text="The job is not picked up by workers before this time (used for retry backoff).")
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    @property
+    def is_active(self):
+        return self.status in (FeedbackJobStatusChoices.QUEUED, FeedbackJobStatusChoices.RUNNING)
+
+    def __str__(self):
+        return f"Feedback job {self.id} for Report ID {self.report_id} ({self.status})"
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'available_at'], name='feedbackjob_status_avail_idx'),
+        ]
+        verbose_name = "AI Feedback Job"
+        verbose_name_plural = "AI Feedback Jobs"
+
+class FeedbackCacheEntry(models.Model):
+    cache_key = models.CharField(
+        max_length=64,
+        unique=True,
+        help_text="SHA-256 of the normalized report, expert template, case text and prompt version."
+    )
+    case = models.ForeignKey(
+        Case,
+        on_delete=models.CASCADE,
+        related_name='feedback_cache_entries',
+        help_text="The case this cached feedback was generated for (used for invalidation)."
+    )
+    prompt_version = models.CharField(max_length=50)
+    raw_llm_feedback = models.TextField()
+    structured_feedback = models.JSONField(default=dict)
+    hit_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_accessed_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f"Cached feedback {self.cache_key[:12]} for Case ID {self.case_id} ({self.hit_count} hits)"
+
+    class Meta:
+        ordering = ['-last_accessed_at']
+        verbose_name = "Cached AI Feedback"
+        verbose_name_plural = "Cached AI Feedback"
+
+class RateLimitBucket(models.Model):
+    name = models.CharField(max_length=100, unique=True, help_text="Identifier of the rate-limited resource (e.g., 'gemini').")
+    tokens = models.FloatField(help_text="Tokens currently available in the bucket.")
+    last_refill = models.FloatField(help_text="Unix timestamp of the last refill calculation.")
+
+    def __str__(self):
+        return f"Rate limit bucket '{self.name}' ({self.tokens:.2f} tokens)"
+
+    class Meta:
+        verbose_name = "Rate Limit Bucket"
+        verbose_name_plural = "Rate Limit Buckets"
+
 class UserCaseView(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     case = models.ForeignKey(Case, on_delete=models.CASCADE)
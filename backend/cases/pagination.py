@@ -0,0 +1,143 @@
+# backend/cases/pagination.py
+import base64
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset (cursor) pagination over a unique descending ordering such as ('-published_at', '-id').
+    Each page is a WHERE on the ordering columns plus LIMIT, so with a matching index its cost does
+    not grow with the page depth, there is no COUNT(*), and rows added while a user pages do not
+    shift later pages. Responses have 'next', 'previous' and 'results' (no 'count').
+
+    Requests with a ?page= parameter are paginated by page number instead (with 'count'), as before.
+    """
+    ordering = ('-id',)
+    page_size = getattr(settings, 'REST_FRAMEWORK', {}).get('PAGE_SIZE', 10)
+    cursor_query_param = 'cursor'
+    page_query_param = 'page'
+
+    def __init__(self):
+        self._page_number_paginator = None
+
+    # --- Cursor encoding ---
+
+    def _field_names(self):
+        return [field.lstrip('-') for field in self.ordering]
+
+    def encode_cursor(self, instance, reverse):
+        values = [getattr(instance, name) for name in self._field_names()]
+        payload = json.dumps({'r': reverse, 'v': [value.isoformat() if hasattr(value, 'isoformat') else value for value in values]})
+        return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+    def decode_cursor(self, request, model):
+        """
+        Returns (reverse, values) from the request's cursor parameter, or None on the first page.
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            names = self._field_names()
+            if len(payload['v']) != len(names):
+                raise ValueError("cursor does not match the ordering")
+            values = [model._meta.get_field(name).to_python(value) for name, value in zip(names, payload['v'])]
+            return bool(payload['r']), values
+        except (ValueError, TypeError, KeyError, UnicodeError, ValidationError):
+            raise NotFound("Invalid cursor.")
+
+    def _after(self, values, reverse):
+        """
+        Q for rows strictly after the cursor row in the ordering (before it when reverse):
+        (a < x) OR (a = x AND b < y) OR ... for descending fields. The leading a <= x is implied but
+        added, so the database can start the index scan at the cursor instead of filtering from the top.
+        """
+        condition = None
+        equal_prefix = Q()
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip('-')
+            descending = field.startswith('-') != reverse
+            clause = equal_prefix & Q(**{f"{name}__{'lt' if descending else 'gt'}": value})
+            condition = clause if condition is None else condition | clause
+            equal_prefix &= Q(**{name: value})
+        first_field, first_value = self.ordering[0], values[0]
+        first_descending = first_field.startswith('-') != reverse
+        return Q(**{f"{first_field.lstrip('-')}__{'lte' if first_descending else 'gte'}": first_value}) & condition
+
+    # --- BasePagination ---
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        if self.page_query_param in request.query_params:
+            self._page_number_paginator = PageNumberPagination()
+            self._page_number_paginator.page_size = self.page_size
+            return self._page_number_paginator.paginate_queryset(queryset.order_by(*self.ordering), request, view)
+
+        cursor = self.decode_cursor(request, queryset.model)
+        reverse = bool(cursor and cursor[0])
+        if cursor:
+            queryset = queryset.filter(self._after(cursor[1], reverse))
+        ordering = [field[1:] if field.startswith('-') else f'-{field}' for field in self.ordering] if reverse else self.ordering
+        rows = list(queryset.order_by(*ordering)[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        # Paging backwards from a cursor always leaves the cursor row's page after this one
+        has_next = has_more if not reverse else bool(rows)
+        has_previous = has_more if reverse else cursor is not None
+        self.next_cursor = self.encode_cursor(rows[-1], reverse=False) if has_next and rows else None
+        self.previous_cursor = self.encode_cursor(rows[0], reverse=True) if has_previous and rows else None
+        return rows
+
+    def _link(self, cursor):
+        if cursor is None:
+            return None
+        url = remove_query_param(self.request.build_absolute_uri(), self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_next_link(self):
+        return self._link(self.next_cursor)
+
+    def get_previous_link(self):
+        return self._link(self.previous_cursor)
+
+    def get_paginated_response(self, data):
+        if self._page_number_paginator:
+            return self._page_number_paginator.get_paginated_response(data)
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class PublishedCasePagination(KeysetPagination):
+    """Published case list, newest first. Published cases always have published_at (see Case.save)."""
+    ordering = ('-published_at', '-id')
+
+
+class SubmittedReportPagination(KeysetPagination):
+    """A user's reports, newest first."""
+    ordering = ('-submitted_at', '-id')
@@ -0,0 +1,71 @@
+# backend/cases/pre_analysis.py
+import logging
+
+from django.utils import timezone
+
+from .concept_index import CONCEPT_INDEX_VERSION
+from .models import Report
+from .utils import generate_report_comparison_summary
+
+# Configure logger
+logger = logging.getLogger(__name__)
+
+# Bump when the stored record layout changes; records with another version are recomputed
+PRE_ANALYSIS_SCHEMA_VERSION = 1
+
+
+def _stored_input_key(input_key):
+    """
+    Returns the key a record is stored under: the feedback cache key plus the version of the key
+    concept normalization, which changes the summary without changing the feedback cache key.
+    """
+    return f"{input_key}:concepts-v{CONCEPT_INDEX_VERSION}"
+
+
+def get_stored_pre_analysis(report, input_key):
+    """
+    Returns the pre-analysis summary stored on the report, or None if there is none or it was
+    computed from other inputs. input_key is the feedback cache key of the report's current inputs
+    (see compute_feedback_cache_key), which changes with the report, expert template, case text and
+    PROMPT_VERSION; records from another CONCEPT_INDEX_VERSION are recomputed too.
+    """
+    record = report.pre_analysis or {}
+    if (record.get('schema_version') != PRE_ANALYSIS_SCHEMA_VERSION
+            or record.get('input_key') != _stored_input_key(input_key)):
+        return None
+    return record.get('summary')
+
+
+def store_pre_analysis(report, summary, input_key, expert_template_id):
+    """
+    Saves a pre-analysis summary on the report. Written with a queryset update so that the report's
+    updated_at and save signals are left alone.
+    """
+    report.pre_analysis = {
+        'schema_version': PRE_ANALYSIS_SCHEMA_VERSION,
+        'input_key': _stored_input_key(input_key),
+        'expert_template_id': expert_template_id,
+        'computed_at': timezone.now().isoformat(),
+        'summary': summary,
+    }
+    Report.objects.filter(pk=report.pk).update(pre_analysis=report.pre_analysis)
+
+
+def get_or_compute_pre_analysis(report, user_report_sections, expert_bundle, input_key):
+    """
+    Returns the report's pre-analysis summary (see generate_report_comparison_summary): the stored one
+    if it is current, otherwise computed from the expert bundle and stored on the report.
+    """
+    summary = get_stored_pre_analysis(report, input_key)
+    if summary is not None:
+        return summary
+
+    summary = generate_report_comparison_summary(
+        user_report_structured_content=user_report_sections,
+        expert_section_contents=expert_bundle['section_contents'],
+        case_diagnosis_text=report.case.diagnosis or "",
+        expert_section_vectors=expert_bundle['section_vectors']
+    )
+    store_pre_analysis(report, summary, input_key, expert_bundle['template_id'])
+    logger.info(f"Stored pre-analysis for report {report.id}")
+    return summary
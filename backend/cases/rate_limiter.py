@@ -0,0 +1,100 @@
+# backend/cases/rate_limiter.py
+import time
+import logging
+
+from django.db import transaction
+
+from .models import RateLimitBucket
+
+# Configure logger
+logger = logging.getLogger(__name__)
+
+
+class RateLimitExceeded(Exception):
+    """
+    Raised when a rate-limited call is rejected.
+
+    Attributes:
+        retry_after: Seconds until a token will be available
+    """
+    def __init__(self, retry_after):
+        super().__init__(f"Rate limit exceeded, retry after {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+class TokenBucketRateLimiter:
+    """
+    Token bucket whose state lives in a RateLimitBucket row, so the limit holds across
+    gunicorn workers, feedback workers and hosts sharing the database.
+
+    Each acquisition locks the bucket row (SELECT ... FOR UPDATE) for a single short UPDATE.
+    Do not call it inside a long-running transaction, or the row stays locked until that transaction ends.
+    """
+    def __init__(self, name, rate_per_minute, capacity=None):
+        self.name = name
+        self.rate_per_second = rate_per_minute / 60.0
+        self.capacity = float(capacity if capacity is not None else rate_per_minute)
+
+    def _refill(self, bucket, now):
+        # Clamp negative elapsed time caused by clock skew between hosts
+        elapsed = max(0.0, now - bucket.last_refill)
+        bucket.tokens = min(self.capacity, bucket.tokens + elapsed * self.rate_per_second)
+        bucket.last_refill = max(bucket.last_refill, now)
+
+    def try_acquire(self, tokens=1):
+        """
+        Takes tokens from the bucket if available.
+
+        Returns:
+            tuple: (granted, retry_after) where retry_after is the wait in seconds before enough tokens are available
+        """
+        RateLimitBucket.objects.get_or_create(
+            name=self.name,
+            defaults={'tokens': self.capacity, 'last_refill': time.time()}
+        )
+        with transaction.atomic():
+            bucket = RateLimitBucket.objects.select_for_update().get(name=self.name)
+            self._refill(bucket, time.time())
+            granted = bucket.tokens >= tokens
+            if granted:
+                bucket.tokens -= tokens
+            bucket.save(update_fields=['tokens', 'last_refill'])
+
+        if granted:
+            return True, 0.0
+        return False, (tokens - bucket.tokens) / self.rate_per_second
+
+    def acquire(self, tokens=1, max_wait=0.0):
+        """
+        Takes tokens from the bucket, waiting up to max_wait seconds for them to become available.
+        With the default max_wait=0 the call never sleeps, which is what request threads should use.
+
+        Raises:
+            RateLimitExceeded: If the tokens are not available within max_wait
+        """
+        deadline = time.monotonic() + max_wait
+        while True:
+            granted, retry_after = self.try_acquire(tokens)
+            if granted:
+                return
+            remaining = deadline - time.monotonic()
+            if retry_after > remaining:
+                logger.warning(f"Rate limit '{self.name}' exceeded, next token in {retry_after:.1f}s")
+                raise RateLimitExceeded(retry_after)
+            time.sleep(retry_after)
+
+    def get_state(self):
+        """
+        Returns the current token count (after refill) without taking any tokens.
+        """
+        bucket = RateLimitBucket.objects.filter(name=self.name).first()
+        tokens = self.capacity
+        if bucket:
+            self._refill(bucket, time.time())
+            tokens = bucket.tokens
+        return {
+            'name': self.name,
+            'tokens_available': round(tokens, 2),
+            'capacity': self.capacity,
+            'rate_per_minute': round(self.rate_per_second * 60, 2),
+        }
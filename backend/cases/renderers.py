@@ -0,0 +1,27 @@
+# backend/cases/renderers.py
+import json
+
+from rest_framework.renderers import BaseRenderer
+
+
+def format_sse_event(event, data):
+    """
+    Formats one Server-Sent Event. Data is JSON-encoded so it always fits on a single data line.
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    Lets SSE endpoints answer text/event-stream clients with ordinary DRF responses
+    (validation errors, 404s, 429s), rendered as a single 'error' event.
+    Successful streams are returned as StreamingHttpResponse and bypass the renderer.
+    """
+    media_type = 'text/event-stream'
+    format = 'event-stream'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return format_sse_event('error', data).encode(self.charset)
@@ -0,0 +1,116 @@
+# backend/cases/section_similarity.py
+import re
+
+import numpy as np
+
+NGRAM_SIZE = 3
+# Hashed feature space for character n-grams; collisions are rare at report-section lengths
+VECTOR_DIMENSIONS = 1 << 12
+
+# Sentence punctuation ending a word or the text ("clear; no effusion", "Normal."). Other symbols are
+# kept: "<5 mm" and ">5 mm", "ANA +" and "ANA -", "5.5 cm" and "5 5 cm" mean different things
+_SENTENCE_PUNCTUATION_PATTERN = re.compile(r"[.,;:!?]+(?=\s|$)")
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+# Multipliers for the n-gram hash (odd 64-bit constants; uint64 arithmetic wraps around)
+_HASH_MULTIPLIERS = np.array([0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9], dtype=np.uint64)[:NGRAM_SIZE]
+
+
+def normalize_for_similarity(text):
+    """
+    Case-folds text, drops sentence punctuation at the end of words and reduces every run of
+    whitespace to one space.
+    """
+    text = _SENTENCE_PUNCTUATION_PATTERN.sub(" ", str(text or "").casefold())
+    return _WHITESPACE_PATTERN.sub(" ", text).strip()
+
+
+def ngram_matrix(texts):
+    """
+    Returns the L2-normalized character n-gram vectors of texts as a (len(texts), VECTOR_DIMENSIONS)
+    float32 matrix: sublinear term frequencies hashed into buckets. Empty texts give zero rows.
+    All texts are hashed and counted in single NumPy passes, without a Python loop over n-grams.
+    """
+    padded_texts = []
+    for text in texts:
+        normalized = normalize_for_similarity(text)
+        padded_texts.append(f" {normalized} " if normalized else "")
+    matrix = np.zeros((len(padded_texts), VECTOR_DIMENSIONS), dtype=np.float32)
+    lengths = np.fromiter((len(padded) for padded in padded_texts), dtype=np.int64, count=len(padded_texts))
+    window_counts = np.maximum(lengths - NGRAM_SIZE + 1, 0)
+    total_windows = int(window_counts.sum())
+    if not total_windows:
+        return matrix
+
+    # Hash every n-gram window of the concatenated texts, then keep the windows inside one text
+    codes = np.frombuffer("".join(padded_texts).encode('utf-32-le'), dtype=np.uint32).astype(np.uint64)
+    windows = np.lib.stride_tricks.sliding_window_view(codes, NGRAM_SIZE)
+    hashes = np.bitwise_xor.reduce(windows * _HASH_MULTIPLIERS, axis=1)
+    buckets = ((hashes >> np.uint64(32)) % np.uint64(VECTOR_DIMENSIONS)).astype(np.int64)
+
+    text_starts = np.cumsum(lengths) - lengths
+    window_starts = np.cumsum(window_counts) - window_counts
+    rows = np.repeat(np.arange(len(padded_texts)), window_counts)
+    positions = np.repeat(text_starts - window_starts, window_counts) + np.arange(total_windows)
+    counts = np.bincount(rows * VECTOR_DIMENSIONS + buckets[positions], minlength=matrix.size)
+
+    matrix[:] = np.log1p(counts.reshape(matrix.shape))
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.divide(matrix, norms, out=matrix, where=norms > 0)
+    return matrix
+
+
+def ngram_vector(text):
+    """
+    Returns the n-gram vector of a single text (see ngram_matrix).
+    """
+    return ngram_matrix([text])[0]
+
+
+def build_section_vectors(section_contents):
+    """
+    Precomputes the n-gram vectors of expert sections.
+
+    Args:
+        section_contents: iterable of objects with 'master_section_id' and 'content'
+
+    Returns:
+        dict: master_section_id -> vector (see ngram_vector)
+    """
+    return {esc.master_section_id: ngram_vector(esc.content) for esc in section_contents}
+
+
+def similarity_scores(user_texts, expert_vectors):
+    """
+    Scores user sections against their expert sections in one matrix operation.
+
+    Args:
+        user_texts: dict of master_section_id -> user section text
+        expert_vectors: dict of master_section_id -> expert vector (see build_section_vectors)
+
+    Returns:
+        dict: master_section_id -> cosine similarity in [0, 1], for sections present on both sides.
+        Two empty sections score 1.0, one empty section 0.0.
+    """
+    section_ids = [section_id for section_id in user_texts if section_id in expert_vectors]
+    if not section_ids:
+        return {}
+    user_matrix = ngram_matrix([user_texts[section_id] for section_id in section_ids])
+    expert_matrix = np.stack([expert_vectors[section_id] for section_id in section_ids])
+    scores = np.clip(np.einsum('ij,ij->i', user_matrix, expert_matrix), 0.0, 1.0)
+    both_empty = ~user_matrix.any(axis=1) & ~expert_matrix.any(axis=1)
+    scores[both_empty] = 1.0
+    return {section_id: float(score) for section_id, score in zip(section_ids, scores)}
+
+
+def score_texts(texts, expert_vector):
+    """
+    Scores many user texts (e.g. one section of every report in a cohort) against one expert vector.
+
+    Returns:
+        numpy array of cosine similarities in [0, 1], aligned with texts (scored as in similarity_scores)
+    """
+    user_matrix = ngram_matrix(texts)
+    scores = np.clip(user_matrix @ expert_vector, 0.0, 1.0)
+    if not expert_vector.any():
+        scores[~user_matrix.any(axis=1)] = 1.0
+    return scores
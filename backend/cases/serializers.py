@@ -8,7 +8,7 @@ from .models import (
     SubspecialtyChoices, ModalityChoices, DifficultyChoices, PatientSexChoices,
     MasterTemplate, MasterTemplateSection,
     CaseTemplate, CaseTemplateSectionContent,
-    AIFeedbackRating
+    AIFeedbackRating, FeedbackJob
 )
 
 # Attempt to import UserSerializer, but provide a fallback if it's not there
@@ -277,6 +277,7 @@ class ReportSerializer(serializers.ModelSerializer):
     )
     structured_content = serializers.JSONField(read_only=True)
     ai_feedback_content = serializers.JSONField(read_only=True) # <<< ADD THIS LINE
+    pre_analysis = serializers.SerializerMethodField()
 
 
     class Meta:
@@ -291,10 +292,15 @@ class ReportSerializer(serializers.ModelSerializer):
             'section_details',  
             'structured_content', 
             'ai_feedback_content', # <<< ADD THIS LINE
+            'pre_analysis',
             'submitted_at',
             'updated_at',
         ]
-        read_only_fields = ('id', 'user', 'case', 'case_title', 'case_identifier_display', 'structured_content', 'ai_feedback_content', 'submitted_at', 'updated_at') # <<< ADD 'ai_feedback_content' HERE
+        read_only_fields = ('id', 'user', 'case', 'case_title', 'case_identifier_display', 'structured_content', 'ai_feedback_content', 'pre_analysis', 'submitted_at', 'updated_at') # <<< ADD 'ai_feedback_content' HERE
+
+    def get_pre_analysis(self, obj):
+        # The stored comparison summary (see pre_analysis.py), without its bookkeeping fields
+        return (obj.pre_analysis or {}).get('summary')
 
     def create(self, validated_data):
         user = self.context['request'].user
@@ -393,12 +399,17 @@ class CaseSerializer(serializers.ModelSerializer):
         read_only_fields = ('id', 'created_by', 'created_at', 'updated_at', 'published_at', 'applied_templates', 'master_template_details', 'case_identifier') 
 
     def get_is_viewed_by_user(self, obj):
+        # Annotated by the case viewsets (see annotate_user_case_flags); queried for other callers
+        if getattr(obj, 'user_has_viewed', None) is not None:
+            return obj.user_has_viewed
         request = self.context.get('request')
         if not request or not hasattr(request, 'user') or not request.user.is_authenticated:
             return False
         return UserCaseView.objects.filter(user=request.user, case=obj).exists()
 
     def get_is_reported_by_user(self, obj):
+        if getattr(obj, 'user_has_reported', None) is not None:
+            return obj.user_has_reported
         request = self.context.get('request')
         if not request or not hasattr(request, 'user') or not request.user.is_authenticated:
             return False
@@ -438,18 +449,24 @@ class CaseListSerializer(serializers.ModelSerializer):
         ]
 
     def get_is_viewed_by_user(self, obj):
+        # Annotated by the case viewsets (see annotate_user_case_flags); queried for other callers
+        if getattr(obj, 'user_has_viewed', None) is not None:
+            return obj.user_has_viewed
         request = self.context.get('request')
         if not request or not hasattr(request, 'user') or not request.user.is_authenticated: return False
         return UserCaseView.objects.filter(user=request.user, case=obj).exists()
 
     def get_is_reported_by_user(self, obj):
+        if getattr(obj, 'user_has_reported', None) is not None:
+            return obj.user_has_reported
         request = self.context.get('request')
         if not request or not hasattr(request, 'user') or not request.user.is_authenticated: return False
         # Only consider non-archived reports
         return Report.objects.filter(user=request.user, case=obj, is_archived=False).exists()
 
     def get_has_master_template(self, obj):
-        return obj.master_template is not None
+        # The FK id avoids loading the master template
+        return obj.master_template_id is not None
 
 class AdminCaseListSerializer(CaseListSerializer):
     created_by_username = serializers.CharField(source='created_by.username', read_only=True, allow_null=True)
@@ -458,6 +475,18 @@ class AdminCaseListSerializer(CaseListSerializer):
         fields = CaseListSerializer.Meta.fields + ['created_by_username']
 
 
+class CaseSearchResultSerializer(CaseListSerializer):
+    # Annotated and attached by cases/case_search.py
+    search_rank = serializers.FloatField(read_only=True)
+    snippets = serializers.SerializerMethodField()
+
+    class Meta(CaseListSerializer.Meta):
+        fields = CaseListSerializer.Meta.fields + ['search_rank', 'snippets']
+
+    def get_snippets(self, obj):
+        return getattr(obj, 'search_snippets', {})
+
+
 class AIFeedbackRatingSerializer(serializers.ModelSerializer):
     user = UserSerializer(read_only=True, default=serializers.CurrentUserDefault())
     report_id = serializers.IntegerField(write_only=True, help_text="ID of the report for which AI feedback is being rated.")
@@ -487,4 +516,15 @@ class AIFeedbackRatingSerializer(serializers.ModelSerializer):
             user=self.context['request'].user, 
             **validated_data
         )
-        return rating
\ No newline at end of file
+        return rating
+
+
+class FeedbackJobSerializer(serializers.ModelSerializer):
+    job_id = serializers.IntegerField(source='id', read_only=True)
+    report_id = serializers.IntegerField(read_only=True)
+    error = serializers.CharField(source='error_message', read_only=True, allow_null=True)
+
+    class Meta:
+        model = FeedbackJob
+        fields = ['job_id', 'report_id', 'status', 'attempts', 'error', 'created_at', 'started_at', 'finished_at']
+        read_only_fields = fields
@@ -0,0 +1,123 @@
+# backend/cases/signals.py
+import logging
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from users.models import UserProfile
+from .models import Case, CaseTemplate, CaseTemplateSectionContent, Language, MasterTemplate, MasterTemplateSection, Report
+from .feedback_cache import invalidate_case_feedback_cache
+from .feedback_pipeline import precompute_pre_analysis
+
+# Configure logger
+logger = logging.getLogger(__name__)
+
+# Case fields that are part of the LLM prompt (see get_case_context_for_llm); editing any of them
+# makes cached feedback stale
+CASE_PROMPT_FIELDS = (
+    'case_identifier', 'clinical_history', 'key_findings', 'diagnosis', 'discussion', 'patient_age',
+    'patient_sex', 'difficulty',
+)
+# User fields shown in the cached case detail ('created_by' of the case and of its master template);
+# saves of other fields only (last_login on every login) leave it alone
+USER_DETAIL_FIELDS = ('username', 'email', 'first_name', 'last_name', 'is_active')
+
+
+def _case_id_for_template(case_template_id):
+    return CaseTemplate.objects.filter(pk=case_template_id).values_list('case_id', flat=True).first()
+
+
+def _touch_cases(cases):
+    """
+    Moves the updated_at of the cases in a queryset. Caches built from a case's nested data (the
+    expert bundle, the case detail) are keyed on it, so the edit is seen by every process through
+    the database.
+    """
+    cases.update(updated_at=timezone.now())
+
+
+@receiver(pre_save, sender=Case)
+def invalidate_feedback_cache_on_case_edit(sender, instance, update_fields=None, **kwargs):
+    if not instance.pk:
+        return
+    if update_fields is not None and not set(update_fields) & set(CASE_PROMPT_FIELDS):
+        return
+    previous = Case.objects.filter(pk=instance.pk).values(*CASE_PROMPT_FIELDS).first()
+    if previous and any(previous[field] != getattr(instance, field) for field in CASE_PROMPT_FIELDS):
+        invalidate_case_feedback_cache(instance.pk)
+
+
+@receiver(post_save, sender=Case)
+def touch_case_on_partial_save(sender, instance, update_fields=None, **kwargs):
+    # auto_now only writes updated_at when it is among update_fields
+    if update_fields is not None and 'updated_at' not in update_fields:
+        _touch_cases(Case.objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=CaseTemplate)
+@receiver(post_delete, sender=CaseTemplate)
+def invalidate_feedback_cache_on_template_change(sender, instance, **kwargs):
+    invalidate_case_feedback_cache(instance.case_id)
+    _touch_cases(Case.objects.filter(pk=instance.case_id))
+
+
+@receiver(post_save, sender=CaseTemplateSectionContent)
+@receiver(post_delete, sender=CaseTemplateSectionContent)
+def invalidate_feedback_cache_on_section_change(sender, instance, **kwargs):
+    case_id = _case_id_for_template(instance.case_template_id)
+    if case_id:
+        invalidate_case_feedback_cache(case_id)
+        _touch_cases(Case.objects.filter(pk=case_id))
+
+
+@receiver(post_save, sender=MasterTemplateSection)
+@receiver(post_delete, sender=MasterTemplateSection)
+def invalidate_expert_bundles_on_master_section_change(sender, instance, **kwargs):
+    # Section names and order are part of every expert bundle and case detail built on the master template
+    _touch_cases(Case.objects.filter(master_template_id=instance.master_template_id))
+
+
+@receiver(post_save, sender=MasterTemplate)
+@receiver(pre_delete, sender=MasterTemplate)
+def invalidate_case_details_on_master_template_change(sender, instance, **kwargs):
+    # Before the delete, while the cases still reference the template (it is set to NULL without signals)
+    _touch_cases(Case.objects.filter(master_template_id=instance.pk))
+
+
+@receiver(post_save, sender=Language)
+def invalidate_case_details_on_language_change(sender, instance, **kwargs):
+    # Expert templates in the case detail carry their language's code and name
+    _touch_cases(Case.objects.filter(applied_expert_templates__language_id=instance.pk))
+
+
+def _touch_cases_created_by(user_id):
+    _touch_cases(Case.objects.filter(Q(created_by_id=user_id) | Q(master_template__created_by_id=user_id)))
+
+
+@receiver(post_save, sender=User)
+def invalidate_case_details_on_user_change(sender, instance, created=False, update_fields=None, **kwargs):
+    if created or (update_fields is not None and not set(update_fields) & set(USER_DETAIL_FIELDS)):
+        return
+    _touch_cases_created_by(instance.pk)
+
+
+@receiver(pre_delete, sender=User)
+def invalidate_case_details_on_user_delete(sender, instance, **kwargs):
+    # created_by is set to NULL without signals
+    _touch_cases_created_by(instance.pk)
+
+
+@receiver(post_save, sender=UserProfile)
+def invalidate_case_details_on_profile_change(sender, instance, **kwargs):
+    _touch_cases_created_by(instance.user_id)
+
+
+@receiver(post_save, sender=Report)
+def store_pre_analysis_on_submission(sender, instance, created=False, raw=False, **kwargs):
+    if created and not raw:
+        # After commit, so a failed submission never runs it and the report row is visible
+        transaction.on_commit(lambda: precompute_pre_analysis(instance))
@@ -2,7 +2,7 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from . import views # Import views from the current directory
-from .views import AIReportFeedbackView, AIFeedbackRatingCreateView # UPDATED: Import AIFeedbackRatingCreateView
+from .views import AIReportFeedbackView, AIReportFeedbackStreamView, AIFeedbackRatingCreateView, AIFeedbackStatusView # UPDATED: Import AIFeedbackRatingCreateView
 
 # Create a router and register our viewsets with it.
 router = DefaultRouter()
@@ -25,6 +25,8 @@ urlpatterns = [
     path('reports/', views.ReportCreateView.as_view(), name='report-create'),
     path('my-reports/', views.MyReportsListView.as_view(), name='my-reports-list'),
     path('reports/<int:report_id>/ai-feedback/', AIReportFeedbackView.as_view(), name='report-ai-feedback'),
+    path('reports/<int:report_id>/ai-feedback/stream/', AIReportFeedbackStreamView.as_view(), name='report-ai-feedback-stream'),
+    path('admin/ai-feedback/status/', AIFeedbackStatusView.as_view(), name='admin-ai-feedback-status'),
 
     # NEW URL PATTERN for creating AI Feedback Ratings
     path('ai-feedback-ratings/', AIFeedbackRatingCreateView.as_view(), name='ai-feedback-rating-create'),
@@ -1,10 +1,14 @@
 # backend/cases/utils.py
 from .models import MasterTemplateSection # Required for type hinting if used, or direct access
+from .concept_index import analyze_text, get_concept_index_matcher
+from .section_similarity import build_section_vectors, normalize_for_similarity, similarity_scores
 
 def generate_report_comparison_summary(
     user_report_structured_content, # List of dicts: [{'master_template_section_id': id, 'content': 'text', 'section_name': 'name', ...}]
     expert_section_contents, # QuerySet or list of CaseTemplateSectionContent objects
-    case_diagnosis_text # String: The expert's diagnosis for the overall case
+    case_diagnosis_text, # String: The expert's diagnosis for the overall case
+    expert_section_vectors=None, # Optional dict: master_section_id -> precomputed n-gram vector
+    section_similarities=None # Optional dict: master_section_id -> precomputed similarity score
 ):
     """
     Compares a user's structured report against expert section contents and overall diagnosis.
@@ -14,8 +18,12 @@ def generate_report_comparison_summary(
         user_report_structured_content (list): The user's report, already enriched with section names and IDs.
         expert_section_contents (iterable): A list or QuerySet of CaseTemplateSectionContent objects
                                             for the expert version, including 'master_section_id', 
-                                            'content', and 'key_concepts_text'.
+                                            'content', 'key_concepts_text' and optionally 'key_concepts_index'.
         case_diagnosis_text (str): The expert's final diagnosis for the case.
+        expert_section_vectors (dict, optional): Expert section vectors from build_section_vectors
+                                                 (cached in the expert bundle); computed if omitted.
+        section_similarities (dict, optional): Similarity scores already computed for this report's
+                                               sections (e.g. in a cohort batch); skips scoring.
 
     Returns:
         dict: A dictionary containing:
@@ -24,7 +32,8 @@ def generate_report_comparison_summary(
                 {
                     'section_name': str,
                     'master_template_section_id': int,
-                    'text_comparison_status': str ('Identical' or 'Content Differs'),
+                    'text_comparison_status': str ('Identical', 'Nearly Identical' or 'Content Differs'),
+                    'similarity_score': float (0-1 character n-gram similarity to the expert text) or None,
                     'key_concepts_status': str ('Not Applicable', 'All Addressed', 'Some Missing'),
                     'missing_key_concepts': list (of strings),
                     'user_content_preview': str,
@@ -38,13 +47,26 @@ def generate_report_comparison_summary(
     }
 
     # Create a dictionary for expert sections for easier lookup
+    # Key concepts are normalized when the expert section is saved (see concept_index.py)
     expert_sections_map = {
         esc.master_section_id: {
             'content': esc.content,
-            'key_concepts': [kc.strip() for kc in esc.key_concepts_text.split(';') if kc.strip()] if esc.key_concepts_text else []
+            'key_concepts': get_concept_index_matcher(esc.key_concepts_text, getattr(esc, 'key_concepts_index', None))
         } for esc in expert_section_contents
     }
 
+    # Similarity of every section to its expert counterpart, scored together
+    if section_similarities is None:
+        if expert_section_vectors is None:
+            expert_section_vectors = build_section_vectors(expert_section_contents)
+        section_similarities = similarity_scores(
+            {
+                user_section.get('master_template_section_id'): user_section.get('content', "")
+                for user_section in user_report_structured_content
+            },
+            expert_section_vectors
+        )
+
     user_impression_content = ""
 
     # Process each section from the user's report (assuming it's based on a master template)
@@ -63,6 +85,7 @@ def generate_report_comparison_summary(
             'section_name': section_name,
             'master_template_section_id': section_id,
             'text_comparison_status': "Expert Section Missing" if not expert_section_data else "Content Differs",
+            'similarity_score': round(section_similarities[section_id], 3) if section_id in section_similarities else None,
             'key_concepts_status': "Not Applicable", # Default if no expert data or no key concepts
             'missing_key_concepts': [],
             'user_content_preview': (user_content[:100] + '...') if len(user_content) > 100 else user_content,
@@ -71,20 +94,21 @@ def generate_report_comparison_summary(
 
         if expert_section_data:
             expert_content = expert_section_data['content']
-            expert_key_concepts = expert_section_data['key_concepts']
+            key_concept_matcher = expert_section_data['key_concepts']
             section_comp['expert_content_preview'] = (expert_content[:100] + '...') if len(expert_content) > 100 else expert_content
 
             # Normalize whitespace for simpler text comparison (basic check)
             if user_content.strip() == expert_content.strip():
                 section_comp['text_comparison_status'] = "Identical"
+            elif normalize_for_similarity(user_content) == normalize_for_similarity(expert_content):
+                # Differs only in case, whitespace or sentence punctuation. The similarity score is informational:
+                # n-grams ignore word order, so swapped words ("left"/"right") can still score 1.0
+                section_comp['text_comparison_status'] = "Nearly Identical"
             
-            if expert_key_concepts:
-                section_comp['key_concepts_status'] = "All Addressed" # Assume all addressed initially
-                user_content_lower = user_content.lower()
-                for concept in expert_key_concepts:
-                    if concept.lower() not in user_content_lower:
-                        section_comp['key_concepts_status'] = "Some Missing"
-                        section_comp['missing_key_concepts'].append(concept)
+            if key_concept_matcher.concepts:
+                # The user text is normalized once per section; each concept is then a set lookup
+                section_comp['missing_key_concepts'] = key_concept_matcher.missing_concepts(user_content, analyze_text(user_content))
+                section_comp['key_concepts_status'] = "Some Missing" if section_comp['missing_key_concepts'] else "All Addressed"
             else:
                 section_comp['key_concepts_status'] = "No Key Concepts Defined by Expert for this Section"
         
@@ -1,16 +1,23 @@
 # backend/cases/views.py
 
-import re # For parsing LLM output
+import os
+import socket
 import logging
 
-from rest_framework import viewsets, permissions, status, generics
+from rest_framework import viewsets, permissions, status, generics, filters
 from rest_framework.decorators import action
+from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from rest_framework.renderers import JSONRenderer
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
 from django.db import transaction, models
+from django.db.models import Count, Exists, Max, OuterRef
+from django.db.models.fields.json import KeyTextTransform
 from django.core.exceptions import ValidationError
+from django_filters.rest_framework import DjangoFilterBackend
 
 # Configure logger
 logger = logging.getLogger(__name__)
@@ -19,28 +26,62 @@ logger = logging.getLogger(__name__)
 from .models import (
     Case, Report, Language, UserCaseView, CaseStatusChoices,
     MasterTemplate, MasterTemplateSection,
-    CaseTemplate, CaseTemplateSectionContent,
-    AIFeedbackRating
+    CaseTemplate,
+    AIFeedbackRating, FeedbackJob, FeedbackJobStatusChoices
 )
 # Updated serializer imports
 from .serializers import (
-    CaseSerializer, CaseListSerializer, AdminCaseListSerializer, ReportSerializer, LanguageSerializer,
+    CaseSerializer, CaseListSerializer, AdminCaseListSerializer, CaseSearchResultSerializer, ReportSerializer, LanguageSerializer,
     MasterTemplateSerializer,
     CaseTemplateSerializer,
     AdminCaseTemplateSetupSerializer,
     BulkCaseTemplateSectionContentUpdateSerializer,
-    AIFeedbackRatingSerializer
+    AIFeedbackRatingSerializer,
+    FeedbackJobSerializer
 )
 
-from .llm_feedback_service import get_feedback_from_llm
-from .utils import generate_report_comparison_summary
+from .feedback_jobs import (
+    defer_job, enqueue_feedback_job, finish_inline_job, release_streaming_job, start_inline_job, wait_for_job
+)
+from .feedback_pipeline import (
+    FeedbackGenerationError, build_feedback_inputs, get_case_context_for_llm,
+    get_cached_feedback_content, finalize_feedback_text, save_feedback_content
+)
+from .feedback_parser import IncrementalFeedbackParser
+from .llm_feedback_service import stream_feedback_from_llm
+from .llm_providers import LLMResponseError, get_llm_provider
+from .feedback_cache import get_feedback_cache_stats
+from .cohort_comparison import CohortComparisonError, compare_case_cohort
+from .case_detail_cache import get_case_detail
+from .conditional_get import ConditionalListMixin, conditional_response, weak_etag
+from .case_search import MAX_SEARCH_QUERY_LENGTH, add_search_snippets, build_search_query, search_cases
+from .pagination import PublishedCasePagination, SubmittedReportPagination
+from .rate_limiter import RateLimitExceeded
+from .circuit_breaker import CircuitOpenError
+from .renderers import EventStreamRenderer, format_sse_event
+
+def annotate_user_case_flags(queryset, user):
+    """
+    Annotates cases with the user's flags as Exists subqueries, so case serializers read
+    user_has_viewed and user_has_reported instead of running two queries per case.
+    """
+    if not user or not user.is_authenticated:
+        return queryset
+    return queryset.annotate(
+        user_has_viewed=Exists(UserCaseView.objects.filter(user=user, case=OuterRef('pk'))),
+        user_has_reported=Exists(Report.objects.filter(user=user, case=OuterRef('pk'), is_archived=False)),
+    )
 
 # --- ViewSets ---
 
-class LanguageViewSet(viewsets.ModelViewSet):
+class LanguageViewSet(ConditionalListMixin, viewsets.ModelViewSet):
     queryset = Language.objects.filter(is_active=True)
     serializer_class = LanguageSerializer
 
+    def get_list_validators(self, queryset):
+        aggregates = queryset.aggregate(count=Count('id'), latest=Max('updated_at'))
+        return (aggregates['count'], aggregates['latest']), aggregates['latest']
+
     def get_permissions(self):
         if self.action in ['list', 'retrieve']:
             self.permission_classes = [permissions.IsAuthenticated]
@@ -48,18 +89,44 @@ class LanguageViewSet(viewsets.ModelViewSet):
             self.permission_classes = [permissions.IsAdminUser]
         return super().get_permissions()
 
-class AdminMasterTemplateViewSet(viewsets.ModelViewSet):
+class AdminMasterTemplateViewSet(ConditionalListMixin, viewsets.ModelViewSet):
     queryset = MasterTemplate.objects.prefetch_related('sections').all().order_by('name')
     serializer_class = MasterTemplateSerializer
     permission_classes = [permissions.IsAdminUser]
 
+    def get_list_validators(self, queryset):
+        # Sections have no updated_at; section edits through MasterTemplateSerializer save the template
+        aggregates = queryset.aggregate(count=Count('id', distinct=True), sections=Count('sections'), latest=Max('updated_at'))
+        return (aggregates['count'], aggregates['sections'], aggregates['latest']), aggregates['latest']
+
     def get_serializer_context(self):
         return {'request': self.request, **super().get_serializer_context()}
 
 class AdminCaseViewSet(viewsets.ModelViewSet):
-    queryset = Case.objects.all().order_by('-created_at')
+    queryset = Case.objects.all().order_by('-created_at', '-id')
     permission_classes = [permissions.IsAdminUser]
 
+    # Configure filtering (the manage-cases page sends search, status, subspecialty and modality)
+    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filterset_fields = {
+        'status': ['exact'],
+        'subspecialty': ['exact'],
+        'modality': ['exact'],
+        'difficulty': ['exact'],
+    }
+    search_fields = ['title', 'case_identifier', 'diagnosis', 'created_by__username']
+    ordering_fields = ['id', 'title', 'case_identifier', 'status', 'subspecialty', 'modality', 'difficulty',
+                       'created_at', 'updated_at', 'published_at']
+    ordering = ['-created_at', '-id']
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'list':
+            queryset = queryset.select_related('created_by')
+        elif self.action == 'retrieve':
+            queryset = queryset.select_related('created_by__profile', 'master_template')
+        return annotate_user_case_flags(queryset, self.request.user)
+
     def get_serializer_class(self):
         if self.action == 'list':
             return AdminCaseListSerializer
@@ -108,442 +175,237 @@ class AdminCaseViewSet(viewsets.ModelViewSet):
         case_template.delete()
         return Response({"detail": "Expert template deleted successfully."}, status=status.HTTP_204_NO_CONTENT)
 
+    @action(detail=True, methods=['get'], url_path='cohort-comparison', permission_classes=[permissions.IsAdminUser])
+    def cohort_comparison(self, request, pk=None):
+        """
+        Pre-analysis of every current report on the case against the expert template: per-section
+        aggregates and one row per report. ?include_archived=true also compares archived reports.
+        """
+        case = self.get_object()
+        include_archived = request.query_params.get('include_archived', '').lower() in ('1', 'true', 'yes')
+        try:
+            return Response(compare_case_cohort(case, include_archived=include_archived))
+        except CohortComparisonError as e:
+            return Response({"error": e.message}, status=status.HTTP_400_BAD_REQUEST)
+
 
 class AIReportFeedbackView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
-    # Use GET to retrieve previously saved AI feedback
-    def get(self, request, report_id, format=None):
+    def _get_user_report(self, request, report_id):
         try:
-            user_report = Report.objects.select_related('case', 'case__master_template', 'user').get(pk=report_id, user=request.user)
+            return Report.objects.select_related('case', 'case__master_template', 'user').get(pk=report_id, user=request.user)
         except Report.DoesNotExist:
+            return None
+
+    # Use GET to retrieve saved AI feedback, or the status of a pending feedback job
+    def get(self, request, report_id, format=None):
+        user_report = self._get_user_report(request, report_id)
+        if not user_report:
             return Response(
                 {"error": "Report not found or you do not have permission to access it."},
                 status=status.HTTP_404_NOT_FOUND
             )
 
+        latest_job = user_report.feedback_jobs.order_by('-created_at').first()
+
+        # A queued or running job means (re)generation is in progress: tell the client to keep polling
+        if latest_job and latest_job.is_active:
+            return Response(FeedbackJobSerializer(latest_job).data, status=status.HTTP_202_ACCEPTED)
+
         # Check if AI feedback is already saved
         if user_report.ai_feedback_content and user_report.ai_feedback_content != {}: # Check if not empty dict
             return Response(user_report.ai_feedback_content, status=status.HTTP_200_OK)
-        else:
-            # If no feedback content exists, return a 404 to indicate it needs to be generated
-            return Response({"error": "AI feedback not yet generated for this report. Please generate it using a POST request."}, status=status.HTTP_404_NOT_FOUND)
-
-    # Use POST to generate and save new AI feedback
-    @transaction.atomic
-    def post(self, request, report_id, format=None):
-        # Add transaction savepoint for rollback if needed
-        sid = transaction.savepoint()
-        
-        try:
-            # Validate user has access to this report
-            try:
-                user_report = Report.objects.select_related('case', 'case__master_template', 'user').get(pk=report_id, user=request.user)
-            except Report.DoesNotExist:
-                logger.warning(f"User {request.user.id} attempted to access report {report_id} which doesn't exist or belong to them")
-                return Response(
-                    {"error": "Report not found or you do not have permission to access it."},
-                    status=status.HTTP_404_NOT_FOUND
-                )
 
-            # Log the beginning of AI feedback generation
-            logger.info(f"Starting AI feedback generation for report {report_id} by user {request.user.id}")
-            
-            # Validate case has master template
-            case_instance = user_report.case
-            if not case_instance.master_template:
-                logger.error(f"Case {case_instance.id} has no master template, cannot generate AI feedback")
-                return Response(
-                    {"error": "This case does not have an associated master template. AI feedback cannot be generated without a structure."},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
+        if latest_job and latest_job.status == FeedbackJobStatusChoices.FAILED:
+            return Response(
+                {**FeedbackJobSerializer(latest_job).data,
+                 "error": latest_job.error_message or "AI feedback generation failed. Please try again later."},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
 
-            # Get user report data
-            serializer_context = {'request': request}
-            user_report_data = ReportSerializer(user_report, context=serializer_context).data
-            user_report_sections_for_llm = user_report_data.get('structured_content', [])
+        # If no feedback content exists, return a 404 to indicate it needs to be generated
+        return Response({"error": "AI feedback not yet generated for this report. Please generate it using a POST request."}, status=status.HTTP_404_NOT_FOUND)
 
-            if not user_report_sections_for_llm:
-                logger.error(f"User's report {report_id} has no content, cannot generate AI feedback")
-                return Response(
-                    {"error": "User's report content is missing or empty. Cannot generate feedback."},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
+    # Use POST to queue generation of new AI feedback; a worker process calls the LLM.
+    # Feedback already cached for an identical report and expert template is returned immediately.
+    def post(self, request, report_id, format=None):
+        user_report = self._get_user_report(request, report_id)
+        if not user_report:
+            logger.warning(f"User {request.user.id} attempted to access report {report_id} which doesn't exist or belong to them")
+            return Response(
+                {"error": "Report not found or you do not have permission to access it."},
+                status=status.HTTP_404_NOT_FOUND
+            )
 
-            # Get expert template (prefer English, fallback to any if English not found)
-            expert_template_instance = CaseTemplate.objects.select_related('language') \
-                                       .prefetch_related(
-                                           models.Prefetch(
-                                               'section_contents',
-                                               queryset=CaseTemplateSectionContent.objects.select_related('master_section').order_by('master_section__order')
-                                           )
-                                       ).filter(case=case_instance, language__code='en').first()
-
-            if not expert_template_instance:
-                expert_template_instance = CaseTemplate.objects.select_related('language') \
-                                           .prefetch_related(
-                                               models.Prefetch(
-                                                   'section_contents',
-                                                   queryset=CaseTemplateSectionContent.objects.select_related('master_section').order_by('master_section__order')
-                                               )
-                                           ).filter(case=case_instance).first()
-                if not expert_template_instance:
-                    logger.error(f"No expert template found for case {case_instance.id}, cannot generate AI feedback")
-                    return Response(
-                        {"error": "No expert template found for this case. AI feedback cannot be generated."},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-                else:
-                    logger.warning(f"English expert template not found for case {case_instance.id}. Using expert template in language: {expert_template_instance.language.code}")
-
-            expert_report_data_for_llm = CaseTemplateSerializer(expert_template_instance, context=serializer_context).data
-            expert_report_sections_for_llm = expert_report_data_for_llm.get('section_contents', [])
-            
-            expert_section_content_objects = expert_template_instance.section_contents_ordered
+        # Validates the report/expert template and serves identical earlier feedback without an LLM call
+        try:
+            cached_feedback_content = get_cached_feedback_content(user_report)
+        except FeedbackGenerationError as e:
+            return Response({"error": e.message}, status=e.status_code)
+
+        if cached_feedback_content:
+            save_feedback_content(user_report, cached_feedback_content)
+            logger.info(f"Served AI feedback for report {report_id} from the feedback cache")
+            return Response(cached_feedback_content, status=status.HTTP_200_OK)
+
+        job, created = enqueue_feedback_job(user_report, requested_by=request.user)
+        if not created:
+            logger.info(f"Report {report_id} already has active AI feedback job {job.id}, returning it")
+
+        return Response(FeedbackJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+
+class AIReportFeedbackStreamView(APIView):
+    """
+    Generates AI feedback for a report and streams it as Server-Sent Events while the LLM produces it.
+
+    Events:
+        status:   {"state": "generating"} once the LLM call has started, or {"state": "waiting", "job_id": ...}
+                  while another request generates feedback for the same report
+        delta:    {"text": "..."} raw text chunks, in order
+        section:  one section severity assessment as soon as it is complete
+        complete: the final ai_feedback_content (also saved on the report)
+        queued:   the pending job (FeedbackJobSerializer) if the other request is still busy after
+                  AI_FEEDBACK_SINGLE_FLIGHT_WAIT_SECONDS; the client polls for it like a queued job
+        error:    {"error": "..."} if generation fails after the stream has started
+
+    Feedback cached for an identical report is sent as a single 'complete' event. Generation is
+    single-flight per report: the stream runs as a feedback job, so concurrent streams and queued
+    requests for the same report share one LLM call.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    renderer_classes = [JSONRenderer, EventStreamRenderer]
 
-            if not expert_report_sections_for_llm:
-                logger.error(f"Expert template {expert_template_instance.id} has no content, cannot generate AI feedback")
-                return Response(
-                    {"error": "Expert report content is missing or empty. Cannot generate feedback."},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
+    def post(self, request, report_id, format=None):
+        try:
+            user_report = Report.objects.select_related('case', 'case__master_template', 'user').get(pk=report_id, user=request.user)
+        except Report.DoesNotExist:
+            return Response(
+                {"error": "Report not found or you do not have permission to access it."},
+                status=status.HTTP_404_NOT_FOUND
+            )
 
-            # Generate programmatic pre-analysis
-            try:
-                programmatic_pre_analysis = generate_report_comparison_summary(
-                    user_report_structured_content=user_report_sections_for_llm, 
-                    expert_section_contents=expert_section_content_objects, 
-                    case_diagnosis_text=case_instance.diagnosis or ""
-                )
-            except Exception as e:
-                logger.error(f"Error generating report comparison summary: {str(e)}")
-                transaction.savepoint_rollback(sid)
-                return Response(
-                    {"error": "An error occurred during report analysis. Please try again later."},
-                    status=status.HTTP_500_INTERNAL_SERVER_ERROR
-                )
-            
-            # Extract the identical sections for optimization
-            identical_section_ids = set()
-            # Also create a mapping of section IDs to names for use in parsing
-            identical_section_names = set()
-            section_id_to_name_map = {}
-            
-            # Build maps of section IDs and names
-            for section in user_report_sections_for_llm:
-                section_id = section.get('master_template_section_id')
-                section_name = section.get('section_name')
-                if section_id and section_name:
-                    section_id_to_name_map[section_id] = section_name
-                    
-            # Identify identical sections
-            for section_comp in programmatic_pre_analysis.get('section_comparisons', []):
-                if section_comp.get('text_comparison_status') == "Identical":
-                    section_id = section_comp.get('master_template_section_id')
-                    if section_id:
-                        identical_section_ids.add(section_id)
-                        # Store the section name for later use in parsing
-                        if section_id in section_id_to_name_map:
-                            identical_section_names.add(section_id_to_name_map[section_id])
-            
-            # Store identical section names for later use (no longer trying to attach to request)
-            # We'll pass this directly to the parsing method instead
-            
-            logger.info(f"Found {len(identical_section_ids)} sections that are identical to expert report")
-            
-            # Get AI feedback from LLM
-            try:
-                ai_feedback_text = get_feedback_from_llm(
-                    user_report_sections=user_report_sections_for_llm,
-                    expert_report_sections=expert_report_sections_for_llm, 
-                    programmatic_pre_analysis_summary=programmatic_pre_analysis,
-                    case_identifier_for_llm=case_instance.case_identifier or f"Case ID {case_instance.id}",
-                    case_patient_age=str(case_instance.patient_age) if case_instance.patient_age else "",
-                    case_patient_sex=case_instance.patient_sex or "",
-                    case_clinical_history=case_instance.clinical_history or "",
-                    case_expert_key_findings=case_instance.key_findings or "",
-                    case_expert_diagnosis=case_instance.diagnosis or "",
-                    case_expert_discussion=case_instance.discussion or "",
-                    case_difficulty=case_instance.get_difficulty_display() or "",
-                    identical_section_ids=identical_section_ids  # Pass the identical sections
-                )
-            except Exception as e:
-                logger.error(f"Error getting feedback from LLM: {str(e)}")
-                transaction.savepoint_rollback(sid)
-                return Response(
-                    {"error": "An error occurred while generating AI feedback. Please try again later."},
-                    status=status.HTTP_500_INTERNAL_SERVER_ERROR
-                )
+        # Validate everything before committing to a streaming response, so errors keep their status codes
+        try:
+            feedback_inputs = build_feedback_inputs(user_report)
+        except FeedbackGenerationError as e:
+            return Response({"error": e.message}, status=e.status_code)
 
-            # If the LLM response indicates an error, return the error message to the user
-            if ai_feedback_text.startswith("Sorry, an error occurred") or ai_feedback_text.startswith("AI feedback service"):
-                logger.error(f"LLM service returned an error: {ai_feedback_text}")
-                transaction.savepoint_rollback(sid)
-                return Response(
-                    {"error": ai_feedback_text},
-                    status=status.HTTP_500_INTERNAL_SERVER_ERROR
-                )
+        cached_feedback_content = get_cached_feedback_content(user_report, feedback_inputs)
+        if cached_feedback_content:
+            save_feedback_content(user_report, cached_feedback_content)
+            return self._event_stream_response(iter([format_sse_event('complete', cached_feedback_content)]))
 
-            # Parse the LLM feedback text
-            try:
-                structured_llm_feedback = self._parse_llm_feedback_text(ai_feedback_text, identical_section_names)
-            except Exception as e:
-                logger.error(f"Error parsing LLM feedback text: {str(e)}")
-                transaction.savepoint_rollback(sid)
-                return Response(
-                    {"error": "An error occurred while processing the AI feedback. Please try again later."},
-                    status=status.HTTP_500_INTERNAL_SERVER_ERROR
-                )
+        job, created = start_inline_job(
+            user_report, worker_id=f"stream:{socket.gethostname()}:{os.getpid()}", requested_by=request.user
+        )
+        if not created:
+            logger.info(f"Report {report_id} already has active AI feedback job {job.id}, waiting for it")
+            return self._event_stream_response(self._wait_events(user_report, job))
 
-            # Save the generated AI feedback to the Report instance
-            try:
-                user_report.ai_feedback_content = {
-                    "raw_llm_feedback": ai_feedback_text,
-                    "structured_feedback": structured_llm_feedback,
-                    "generated_at": timezone.now().isoformat()
-                }
-                user_report.save()
-                logger.info(f"Successfully saved AI feedback for report {report_id}")
-                
-                # Commit the transaction
-                transaction.savepoint_commit(sid)
-                
-                return Response(
-                    user_report.ai_feedback_content,
-                    status=status.HTTP_200_OK
-                )
-            except Exception as e:
-                logger.error(f"Error saving AI feedback to report: {str(e)}")
-                transaction.savepoint_rollback(sid)
-                return Response(
-                    {"error": "An error occurred while saving the AI feedback. Please try again later."},
-                    status=status.HTTP_500_INTERNAL_SERVER_ERROR
-                )
-                
-        except Exception as e:
-            # Catch-all for any unexpected errors
-            logger.error(f"Unexpected error in AI feedback generation: {str(e)}")
-            transaction.savepoint_rollback(sid)
-            return Response(
-                {"error": "An unexpected error occurred. Please try again later."},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        try:
+            chunks = stream_feedback_from_llm(
+                user_report_sections=feedback_inputs['user_report_sections'],
+                expert_report_sections=feedback_inputs['expert_report_sections'],
+                programmatic_pre_analysis_summary=feedback_inputs['programmatic_pre_analysis'],
+                identical_section_ids=feedback_inputs['identical_section_ids'],
+                expert_prompt_parts=feedback_inputs['expert_prompt_parts'],
+                **get_case_context_for_llm(user_report.case)
+            )
+        except RateLimitExceeded as e:
+            # The job stays queued for a worker; the client's fallback POST picks up the same job
+            defer_job(job, e.retry_after)
+            response = Response(
+                {"error": "The AI service is busy. Please try again shortly.", "retry_after": round(e.retry_after, 1)},
+                status=status.HTTP_429_TOO_MANY_REQUESTS
+            )
+            response['Retry-After'] = str(max(1, int(e.retry_after + 0.999)))
+            return response
+        except CircuitOpenError as e:
+            defer_job(job, e.retry_after, reason="the open Gemini circuit breaker")
+            response = Response(
+                {"error": "The AI service is temporarily unavailable. Please try again in a minute.", "retry_after": round(e.retry_after, 1)},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
             )
+            response['Retry-After'] = str(max(1, int(e.retry_after + 0.999)))
+            return response
 
-    def _parse_llm_feedback_text(self, feedback_text, identical_section_names=None):
-        """
-        Parses the LLM's text output into a more structured format.
-        This handles both the discrepancy list and the new section-by-section severity assessment.
-        
-        Args:
-            feedback_text: The raw text output from the LLM
-            identical_section_names: Set of section names that were programmatically identified as identical
-        """
-        if not feedback_text or not isinstance(feedback_text, str):
-            logger.error(f"Invalid feedback text received: {type(feedback_text)}")
-            raise ValueError("Invalid feedback text: must be a non-empty string")
-            
-        # Initialize identical_section_names to empty set if not provided
-        if identical_section_names is None:
-            identical_section_names = set()
-            
-        parsed_feedback = {
-            "overall_impression_alignment": "",
-            "section_feedback": [],
-            "key_learning_points": []
-        }
+        return self._event_stream_response(self._generate_events(user_report, feedback_inputs, chunks, job))
 
-        # Add debug output
-        logger.debug(f"Parsing LLM feedback text: {feedback_text[:100]}...") # Print first 100 chars
-        
-        # Compile the regex patterns for better performance
-        # These are now module-level constants to avoid recompilation
-        CRITICAL_SECTION_PATTERN = re.compile(r"1\.\s*CRITICAL\s+DISCREPANCIES:(.*?)(?=2\.\s*NON-CRITICAL\s+DISCREPANCIES:|SECTION SEVERITY ASSESSMENT:|$)", re.DOTALL | re.IGNORECASE)
-        NON_CRITICAL_SECTION_PATTERN = re.compile(r"2\.\s*NON-CRITICAL\s+DISCREPANCIES:(.*?)(?=SECTION SEVERITY ASSESSMENT:|$)", re.DOTALL | re.IGNORECASE)
-        SEVERITY_ASSESSMENT_PATTERN = re.compile(r"SECTION SEVERITY ASSESSMENT:(.*?)(?=$)", re.DOTALL | re.IGNORECASE)
-        SECTION_ASSESSMENT_PATTERN = re.compile(r"Section:\s*(.+?)\nSeverity:\s*(.+?)\nReason:\s*(.+?)(?=\n\nSection:|$)", re.DOTALL)
-        BULLET_POINT_PATTERN = re.compile(r"-\s*You\s+(.*?)(?=-\s*You|$)", re.DOTALL)
-        SECTION_MENTION_PATTERN = re.compile(r"(?:in|for)\s+the\s+(\w+)(?:\s+section)?", re.IGNORECASE)
+    def _event_stream_response(self, events):
+        response = StreamingHttpResponse(events, content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # Stop nginx from buffering the stream
+        response['X-Accel-Buffering'] = 'no'
+        return response
 
+    def _generate_events(self, user_report, feedback_inputs, chunks, job):
+        section_parser = IncrementalFeedbackParser(feedback_inputs['identical_section_names'])
+        text_parts = []
         try:
-            # First, try to extract the critical discrepancies section
-            critical_match = CRITICAL_SECTION_PATTERN.search(feedback_text)
-            if critical_match:
-                critical_section = critical_match.group(1).strip()
-                
-                # Check if there's actual content or just "None identified"
-                if critical_section and "None identified" not in critical_section:
-                    # Extract individual bullet points
-                    bullet_matches = BULLET_POINT_PATTERN.finditer(critical_section)
-                    for bullet_match in bullet_matches:
-                        bullet_content = bullet_match.group(1).strip()
-                        if bullet_content:
-                            # Extract section name if possible (assuming format like "In the Findings section, you...")
-                            section_name = "General"
-                            section_match = SECTION_MENTION_PATTERN.search(bullet_content)
-                            if section_match:
-                                section_name = section_match.group(1).capitalize()
-                            
-                            # Check if this is a programmatically identified identical section
-                            is_identical_section = False
-                            if section_name in identical_section_names:
-                                is_identical_section = True
-                                logger.info(f"Overriding 'Critical' severity for identical section: {section_name}")
-                                
-                            # Store discrepancy for this section
-                            parsed_feedback["section_feedback"].append({
-                                "section_name": section_name,
-                                "discrepancy_summary_from_llm": "You " + bullet_content,
-                                "severity_level_from_llm": "Consistent" if is_identical_section else "Critical",
-                                "severity_justification_from_llm": "This section is identical to the expert report." if is_identical_section else bullet_content
-                            })
-            
-            # Next, extract the non-critical discrepancies section
-            non_critical_match = NON_CRITICAL_SECTION_PATTERN.search(feedback_text)
-            if non_critical_match:
-                non_critical_section = non_critical_match.group(1).strip()
-                
-                # Check if there's actual content or just "None identified"
-                if non_critical_section and "None identified" not in non_critical_section:
-                    # Extract individual bullet points
-                    bullet_matches = BULLET_POINT_PATTERN.finditer(non_critical_section)
-                    for bullet_match in bullet_matches:
-                        bullet_content = bullet_match.group(1).strip()
-                        if bullet_content:
-                            # Extract section name if possible
-                            section_name = "General"
-                            section_match = SECTION_MENTION_PATTERN.search(bullet_content)
-                            if section_match:
-                                section_name = section_match.group(1).capitalize()
-                            
-                            # Check if this is a programmatically identified identical section
-                            is_identical_section = False
-                            if section_name in identical_section_names:
-                                is_identical_section = True
-                                logger.info(f"Overriding 'Moderate' severity for identical section: {section_name}")
-                                
-                            # Store moderate discrepancy for this section
-                            parsed_feedback["section_feedback"].append({
-                                "section_name": section_name,
-                                "discrepancy_summary_from_llm": "You " + bullet_content,
-                                "severity_level_from_llm": "Consistent" if is_identical_section else "Moderate",
-                                "severity_justification_from_llm": "This section is identical to the expert report." if is_identical_section else bullet_content
-                            })
-        except Exception as e:
-            logger.error(f"Error parsing discrepancy sections: {str(e)}")
-            # Continue processing even if this part fails
-        
-        try:
-            # Extract the section-by-section severity assessment
-            severity_assessment_match = SEVERITY_ASSESSMENT_PATTERN.search(feedback_text)
-            if severity_assessment_match:
-                severity_assessment_section = severity_assessment_match.group(1).strip()
-                
-                # Create a map to look up existing sections for merging
-                section_feedback_map = {item["section_name"].lower(): item for item in parsed_feedback["section_feedback"]}
-                
-                # Extract individual section assessments
-                section_assessments = SECTION_ASSESSMENT_PATTERN.finditer(severity_assessment_section)
-                section_count = 0
-                for assessment in section_assessments:
-                    section_count += 1
-                    section_name = assessment.group(1).strip()
-                    severity = assessment.group(2).strip()
-                    reason = assessment.group(3).strip()
-                    
-                    # Check if this is one of our programmatically identified identical sections
-                    is_identical_section = False
-                    if section_name in identical_section_names:
-                        is_identical_section = True
-                        normalized_severity = "Consistent"
-                        reason = "This section is identical to the expert report." if not reason else reason
-                        logger.info(f"Programmatically enforcing 'Consistent' severity for identical section: {section_name}")
-                    else:
-                        # Normalize severity - ensure it's one of our three levels
-                        if severity.lower() == "critical":
-                            normalized_severity = "Critical"
-                        elif severity.lower() == "moderate":
-                            normalized_severity = "Moderate"
-                        else:
-                            normalized_severity = "Consistent"
-                    
-                    # Check if we already have a feedback entry for this section
-                    section_key = section_name.lower()
-                    if section_key in section_feedback_map:
-                        # Prioritize existing discrepancy feedback but update severity if needed
-                        existing_entry = section_feedback_map[section_key]
-                        
-                        # If this is an identical section, always force it to "Consistent"
-                        if is_identical_section:
-                            existing_entry["severity_level_from_llm"] = "Consistent"
-                            existing_entry["severity_justification_from_llm"] = reason
-                        # Otherwise only upgrade severity (e.g., from Moderate to Critical), never downgrade
-                        elif existing_entry["severity_level_from_llm"] != "Critical" and normalized_severity == "Critical":
-                            existing_entry["severity_level_from_llm"] = "Critical"
-                            # Update justification if we're upgrading severity
-                            existing_entry["severity_justification_from_llm"] = reason
-                    else:
-                        # Add a new entry if we don't have one yet
-                        parsed_feedback["section_feedback"].append({
-                            "section_name": section_name,
-                            "discrepancy_summary_from_llm": reason,  # Use reason as summary for new entries
-                            "severity_level_from_llm": normalized_severity,
-                            "severity_justification_from_llm": reason
-                        })
-                
-                logger.info(f"Extracted {section_count} section severity assessments")
-            else:
-                logger.warning("No section-by-section severity assessment found in LLM response")
-        except Exception as e:
-            logger.error(f"Error parsing severity assessments: {str(e)}")
-            # Continue processing even if this part fails
-        
-        try:
-            # Set a basic overall impression based on the number of issues found
-            if parsed_feedback["section_feedback"]:
-                critical_count = sum(1 for item in parsed_feedback["section_feedback"] if item["severity_level_from_llm"] == "Critical")
-                moderate_count = sum(1 for item in parsed_feedback["section_feedback"] if item["severity_level_from_llm"] == "Moderate")
-                consistent_count = sum(1 for item in parsed_feedback["section_feedback"] if item["severity_level_from_llm"] == "Consistent")
-                
-                if critical_count > 0:
-                    parsed_feedback["overall_impression_alignment"] = f"Found {critical_count} critical and {moderate_count} moderate discrepancies that need attention."
-                elif moderate_count > 0:
-                    parsed_feedback["overall_impression_alignment"] = f"Found {moderate_count} moderate discrepancies. Overall alignment is good with minor differences."
-                else:
-                    parsed_feedback["overall_impression_alignment"] = "Your report is well-aligned with the expert interpretation."
-            else:
-                # If we couldn't extract any structured feedback, put everything in overall_impression
-                if feedback_text.strip(): 
-                    parsed_feedback["overall_impression_alignment"] = "Could not parse detailed structure. Full AI Feedback: \n" + feedback_text
+            yield format_sse_event('status', {"state": "generating"})
+            for chunk in chunks:
+                text_parts.append(chunk)
+                yield format_sse_event('delta', {"text": chunk})
+                for section in section_parser.feed(chunk):
+                    yield format_sse_event('section', section)
+            for section in section_parser.finish():
+                yield format_sse_event('section', section)
+
+            ai_feedback_content = finalize_feedback_text(user_report.case, feedback_inputs, "".join(text_parts).strip())
+            save_feedback_content(user_report, ai_feedback_content)
+            finish_inline_job(job)
+        except (FeedbackGenerationError, LLMResponseError) as e:
+            finish_inline_job(job, e.message)
+            yield format_sse_event('error', {"error": e.message})
+            return
         except Exception as e:
-            logger.error(f"Error generating overall impression: {str(e)}")
-            parsed_feedback["overall_impression_alignment"] = "AI feedback was generated but summary extraction encountered an issue."
-        
-        # Debug output to verify what we're returning
-        logger.debug("Parsed feedback structure:")
-        logger.debug(f"- Overall impression: {parsed_feedback['overall_impression_alignment'][:50]}...")
-        logger.debug(f"- Number of section feedback items: {len(parsed_feedback['section_feedback'])}")
-        for idx, sf in enumerate(parsed_feedback['section_feedback'][:5]):  # Log just the first 5 to avoid excessive logging
-            logger.debug(f"  Section {idx+1}: {sf['section_name']} - Severity: {sf['severity_level_from_llm']}")
-        
-        # Check for pneumothorax in critical findings specifically and make sure it's critical
-        for sf in parsed_feedback['section_feedback']:
-            summary = sf.get('discrepancy_summary_from_llm', '').lower()
-            if 'pneumothorax' in summary and sf['severity_level_from_llm'] != 'Critical':
-                logger.warning(f"Found pneumothorax in section {sf['section_name']} but severity is {sf['severity_level_from_llm']}. Upgrading to Critical.")
-                sf['severity_level_from_llm'] = 'Critical'
-                if 'pneumothorax' not in sf['severity_justification_from_llm'].lower():
-                    sf['severity_justification_from_llm'] += " Critical due to potential pneumothorax which requires immediate attention."
-        
-        # Final check: Ensure all identical sections are consistently marked as "Consistent"
-        if identical_section_names:
-            for sf in parsed_feedback['section_feedback']:
-                section_name = sf.get('section_name')
-                if section_name in identical_section_names and sf['severity_level_from_llm'] != 'Consistent':
-                    logger.warning(f"Final check: Section {section_name} was identical but severity was {sf['severity_level_from_llm']}. Correcting to Consistent.")
-                    sf['severity_level_from_llm'] = 'Consistent'
-                    sf['severity_justification_from_llm'] = "This section is identical to the expert report."
-        
-        return parsed_feedback
+            logger.exception(f"Error streaming AI feedback for report {user_report.id}: {e}")
+            error_message = "An error occurred while generating AI feedback. Please try again later."
+            finish_inline_job(job, error_message)
+            yield format_sse_event('error', {"error": error_message})
+            return
+        finally:
+            # Runs when the client disconnects mid-stream (GeneratorExit): a worker finishes the job
+            release_streaming_job(job)
+
+        yield format_sse_event('complete', ai_feedback_content)
+
+    def _wait_events(self, user_report, job):
+        yield format_sse_event('status', {"state": "waiting", "job_id": job.id})
+        job = wait_for_job(job)
+
+        if job.is_active:
+            yield format_sse_event('queued', FeedbackJobSerializer(job).data)
+        elif job.status == FeedbackJobStatusChoices.COMPLETED:
+            user_report.refresh_from_db(fields=['ai_feedback_content'])
+            yield format_sse_event('complete', user_report.ai_feedback_content)
+        else:
+            yield format_sse_event('error', {"error": job.error_message or "AI feedback generation failed. Please try again later."})
+
+
+class AIFeedbackStatusView(APIView):
+    """
+    Admin view of the AI feedback service: LLM provider, circuit breaker state and counters,
+    rate limit tokens, feedback cache statistics and feedback jobs by status.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, format=None):
+        provider = get_llm_provider()
+        job_counts = {
+            row['status']: row['count']
+            for row in FeedbackJob.objects.order_by().values('status').annotate(count=models.Count('id'))
+        }
+        return Response({
+            "provider": provider.name,
+            "provider_configured": provider.is_configured(),
+            "circuit_breaker": provider.circuit_breaker.get_state() if provider.circuit_breaker else None,
+            "rate_limiter": provider.rate_limiter.get_state() if provider.rate_limiter else None,
+            "feedback_cache": get_feedback_cache_stats(),
+            "jobs": {choice: job_counts.get(choice, 0) for choice in FeedbackJobStatusChoices.values},
+        })
 
 
 class CaseTemplateViewSet(viewsets.ViewSet):
@@ -590,17 +452,51 @@ class CaseTemplateViewSet(viewsets.ViewSet):
         return Response(serializer.data)
 
 class UserCaseViewSet(viewsets.ReadOnlyModelViewSet): 
-    queryset = Case.objects.filter(status=CaseStatusChoices.PUBLISHED).order_by('-published_at')
+    queryset = Case.objects.filter(status=CaseStatusChoices.PUBLISHED).order_by('-published_at', '-id')
     permission_classes = [permissions.IsAuthenticated]
+    # Keyset pages over (published_at, id); ?page=N keeps page-number pagination
+    pagination_class = PublishedCasePagination
+
+    def get_queryset(self):
+        return annotate_user_case_flags(super().get_queryset(), self.request.user)
 
     def get_serializer_class(self):
         if self.action == 'list':
             return CaseListSerializer
         return CaseSerializer 
 
+    def retrieve(self, request, *args, **kwargs):
+        # The nested expert and master templates come from the versioned case detail cache; only
+        # the case row with the user's flags is read per request. The signals move the case's
+        # updated_at on any nested edit, so it is the latest modification of the whole payload.
+        case = self.get_object()
+        etag = weak_etag(request.user.pk, case.pk, case.updated_at.isoformat(), case.user_has_viewed, case.user_has_reported)
+        return conditional_response(request, etag, case.updated_at, lambda: Response(get_case_detail(case)))
+
     def get_serializer_context(self):
         return {'request': self.request, **super().get_serializer_context()}
 
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """
+        Full-text search of published cases: ?q= (web search syntax), ranked, with highlighted
+        snippets. Diagnosis, key findings and discussion are only searched and shown for cases the
+        user has reported. Paginated by page number (?page=).
+        """
+        text = request.query_params.get('q', '').strip()
+        if not text:
+            return Response({"detail": "The 'q' query parameter is required."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(text) > MAX_SEARCH_QUERY_LENGTH:
+            return Response({"detail": f"Search text is limited to {MAX_SEARCH_QUERY_LENGTH} characters."}, status=status.HTTP_400_BAD_REQUEST)
+
+        query = build_search_query(text)
+        # Ranked results do not fit the keyset ordering of the case list
+        paginator = PageNumberPagination()
+        page = paginator.paginate_queryset(search_cases(self.get_queryset(), query), request, view=self)
+        add_search_snippets(page, query)
+        serializer = CaseSearchResultSerializer(page, many=True, context=self.get_serializer_context())
+        return paginator.get_paginated_response(serializer.data)
+
     @action(detail=True, methods=['post'])
     def viewed(self, request, pk=None):
         case = self.get_object()
@@ -681,13 +577,25 @@ class ReportCreateView(generics.CreateAPIView):
     def get_serializer_context(self):
         return {'request': self.request, **super().get_serializer_context()}
 
-class MyReportsListView(generics.ListAPIView): 
+class MyReportsListView(ConditionalListMixin, generics.ListAPIView): 
     serializer_class = ReportSerializer
     permission_classes = [permissions.IsAuthenticated]
+    # Keyset pages over (submitted_at, id); ?page=N keeps page-number pagination
+    pagination_class = SubmittedReportPagination
+
+    def get_list_validators(self, queryset):
+        # Stored pre-analyses are written without touching updated_at; case titles and section names
+        # come from the case and its master template
+        aggregates = queryset.aggregate(
+            count=Count('id'), latest=Max('updated_at'),
+            pre_analysis_latest=Max(KeyTextTransform('computed_at', 'pre_analysis')),
+            case_latest=Max('case__updated_at'), master_template_latest=Max('case__master_template__updated_at'),
+        )
+        return tuple(aggregates.values()), aggregates['latest']
 
     def get_queryset(self):
         # Only show non-archived reports by default
-        return Report.objects.filter(user=self.request.user, is_archived=False).order_by('-submitted_at')
+        return Report.objects.filter(user=self.request.user, is_archived=False).order_by('-submitted_at', '-id')
     
     def get_serializer_context(self):
         return {'request': self.request, **super().get_serializer_context()}
@@ -3,6 +3,7 @@ import os
 from pathlib import Path
 from datetime import timedelta
 from dotenv import load_dotenv
+from corsheaders.defaults import default_headers
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -44,6 +45,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     # Third-party apps
     'rest_framework',
     'rest_framework_simplejwt',
@@ -143,6 +145,23 @@ REST_FRAMEWORK = {
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
 }
 
+# Cache (feedback counters and other shared state). Set REDIS_URL in production so every
+# gunicorn worker and feedback worker shares one cache; requires the `redis` package.
+REDIS_URL = os.environ.get('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
 # Simple JWT settings
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=int(os.environ.get('ACCESS_TOKEN_LIFETIME', '60'))),
@@ -158,4 +177,61 @@ CORS_ALLOWED_ORIGINS = os.environ.get(
     'http://127.0.0.1:5500,http://localhost:5500'
 ).split(',')
 
-CORS_ALLOW_CREDENTIALS = True
\ No newline at end of file
+CORS_ALLOW_CREDENTIALS = True
+
+# Conditional GET from the frontend: it sends If-None-Match and reads the ETag of responses
+CORS_ALLOW_HEADERS = (*default_headers, 'if-none-match')
+CORS_EXPOSE_HEADERS = ['ETag', 'Last-Modified']
+
+# AI feedback job queue (processed by `python manage.py run_feedback_worker`)
+AI_FEEDBACK_JOB_MAX_ATTEMPTS = int(os.environ.get('AI_FEEDBACK_JOB_MAX_ATTEMPTS', '3'))
+AI_FEEDBACK_JOB_STALE_SECONDS = int(os.environ.get('AI_FEEDBACK_JOB_STALE_SECONDS', '300'))
+AI_FEEDBACK_JOB_RETRY_BACKOFF_SECONDS = int(os.environ.get('AI_FEEDBACK_JOB_RETRY_BACKOFF_SECONDS', '10'))
+# How long a feedback stream waits for another request already generating feedback for the same report
+AI_FEEDBACK_SINGLE_FLIGHT_WAIT_SECONDS = int(os.environ.get('AI_FEEDBACK_SINGLE_FLIGHT_WAIT_SECONDS', '90'))
+
+# LLM backend for AI feedback: 'gemini', or 'fake' (offline scripted responses for load testing
+# without network access or Gemini quota). AI_FEEDBACK_FAKE_LLM=True is kept as a shortcut for 'fake'.
+AI_FEEDBACK_FAKE_LLM = os.environ.get('AI_FEEDBACK_FAKE_LLM', 'False') == 'True'
+AI_FEEDBACK_LLM_PROVIDER = os.environ.get('AI_FEEDBACK_LLM_PROVIDER', 'fake' if AI_FEEDBACK_FAKE_LLM else 'gemini')
+AI_FEEDBACK_LLM_MODEL = os.environ.get('AI_FEEDBACK_LLM_MODEL', 'gemini-1.5-flash-latest')
+AI_FEEDBACK_FAKE_LLM_LATENCY = float(os.environ.get('AI_FEEDBACK_FAKE_LLM_LATENCY', '1.0'))
+AI_FEEDBACK_FAKE_LLM_LATENCY_JITTER = float(os.environ.get('AI_FEEDBACK_FAKE_LLM_LATENCY_JITTER', '0.0'))
+AI_FEEDBACK_FAKE_LLM_SCRIPT = os.environ.get('AI_FEEDBACK_FAKE_LLM_SCRIPT')  # JSON list of response templates
+# Response format for queued/bulk feedback: 'text' (parsed by feedback_parser) or 'json' (schema-constrained
+# JSON output, falling back to the text parser if it fails validation). Streaming always uses 'text'.
+AI_FEEDBACK_LLM_OUTPUT_FORMAT = os.environ.get('AI_FEEDBACK_LLM_OUTPUT_FORMAT', 'text')
+
+# Prompt size limits: prompts over the input budget are trimmed, output is capped per call based on section count
+AI_FEEDBACK_PROMPT_TOKEN_BUDGET = int(os.environ.get('AI_FEEDBACK_PROMPT_TOKEN_BUDGET', '6000'))
+AI_FEEDBACK_MAX_OUTPUT_TOKENS = int(os.environ.get('AI_FEEDBACK_MAX_OUTPUT_TOKENS', '2048'))
+
+# Content-addressed cache of LLM feedback (keyed on normalized report + expert template + case text + prompt version)
+AI_FEEDBACK_CACHE_ENABLED = os.environ.get('AI_FEEDBACK_CACHE_ENABLED', 'True') == 'True'
+AI_FEEDBACK_CACHE_MAX_ENTRIES = int(os.environ.get('AI_FEEDBACK_CACHE_MAX_ENTRIES', '5000'))
+AI_FEEDBACK_CACHE_TTL_SECONDS = int(os.environ.get('AI_FEEDBACK_CACHE_TTL_SECONDS', str(30 * 24 * 3600)))
+# Compiled expert template data (formatted expert report, sanitized case context, section vectors), kept in CACHES
+# and invalidated on edits; the TTL only bounds staleness after bulk updates that bypass model signals
+AI_FEEDBACK_EXPERT_BUNDLE_TTL_SECONDS = int(os.environ.get('AI_FEEDBACK_EXPERT_BUNDLE_TTL_SECONDS', str(24 * 3600)))
+# Serialized case detail (expert templates, master template) for GET /api/cases/cases/<id>/, kept in CACHES and
+# invalidated on edits; the TTL bounds staleness of nested data edited elsewhere (creator profiles, language names)
+CASE_DETAIL_CACHE_TTL_SECONDS = int(os.environ.get('CASE_DETAIL_CACHE_TTL_SECONDS', '3600'))
+# How long a request waits for another request already building the same case detail before building it itself
+CASE_DETAIL_CACHE_BUILD_WAIT_SECONDS = float(os.environ.get('CASE_DETAIL_CACHE_BUILD_WAIT_SECONDS', '2.0'))
+
+# Shared Gemini rate limit (token bucket stored in the database, enforced across all processes and hosts)
+GEMINI_API_RATE_LIMIT = int(os.environ.get('GEMINI_API_RATE_LIMIT', '10'))  # calls per minute
+GEMINI_API_BURST = int(os.environ.get('GEMINI_API_BURST', str(GEMINI_API_RATE_LIMIT)))  # bucket capacity
+
+# Gemini call resilience: each attempt times out after AI_FEEDBACK_LLM_CALL_TIMEOUT_SECONDS, transient errors are
+# retried with jittered exponential backoff within AI_FEEDBACK_LLM_DEADLINE_SECONDS, and a circuit breaker opens after
+# AI_FEEDBACK_LLM_BREAKER_FAILURE_THRESHOLD failures in AI_FEEDBACK_LLM_BREAKER_WINDOW_SECONDS, failing calls fast
+# for AI_FEEDBACK_LLM_BREAKER_RECOVERY_SECONDS before a probe call (breaker state is shared through CACHES)
+AI_FEEDBACK_LLM_CALL_TIMEOUT_SECONDS = float(os.environ.get('AI_FEEDBACK_LLM_CALL_TIMEOUT_SECONDS', '30'))
+AI_FEEDBACK_LLM_DEADLINE_SECONDS = float(os.environ.get('AI_FEEDBACK_LLM_DEADLINE_SECONDS', '60'))
+AI_FEEDBACK_LLM_MAX_RETRIES = int(os.environ.get('AI_FEEDBACK_LLM_MAX_RETRIES', '2'))
+AI_FEEDBACK_LLM_RETRY_BASE_DELAY_SECONDS = float(os.environ.get('AI_FEEDBACK_LLM_RETRY_BASE_DELAY_SECONDS', '1.0'))
+AI_FEEDBACK_LLM_RETRY_MAX_DELAY_SECONDS = float(os.environ.get('AI_FEEDBACK_LLM_RETRY_MAX_DELAY_SECONDS', '8.0'))
+AI_FEEDBACK_LLM_BREAKER_FAILURE_THRESHOLD = int(os.environ.get('AI_FEEDBACK_LLM_BREAKER_FAILURE_THRESHOLD', '5'))
+AI_FEEDBACK_LLM_BREAKER_WINDOW_SECONDS = int(os.environ.get('AI_FEEDBACK_LLM_BREAKER_WINDOW_SECONDS', '60'))
+AI_FEEDBACK_LLM_BREAKER_RECOVERY_SECONDS = int(os.environ.get('AI_FEEDBACK_LLM_BREAKER_RECOVERY_SECONDS', '30'))
@@ -39,6 +39,51 @@ function clearAuthTokens() {
     console.log('[clearAuthTokens] Clearing tokens from localStorage.');
     localStorage.removeItem('accessToken');
     localStorage.removeItem('refreshToken');
+    clearConditionalCache();
+}
+
+// GET responses that carried an ETag, kept in sessionStorage so they can be revalidated
+const CONDITIONAL_CACHE_PREFIX = 'conditionalGet:';
+
+/**
+ * Returns the stored ETag and data of an earlier GET of url, or null.
+ * @param {string} url - The full request URL.
+ * @returns {object|null} Object with etag and data, or null if nothing is stored.
+ */
+function getConditionalEntry(url) {
+    try {
+        const stored = sessionStorage.getItem(CONDITIONAL_CACHE_PREFIX + url);
+        return stored ? JSON.parse(stored) : null;
+    } catch (error) {
+        return null;
+    }
+}
+
+/**
+ * Stores the ETag and data of a GET response; skipped if sessionStorage is full or unavailable.
+ * @param {string} url - The full request URL.
+ * @param {string} etag - The ETag response header.
+ * @param {object} data - The parsed response body.
+ */
+function setConditionalEntry(url, etag, data) {
+    try {
+        sessionStorage.setItem(CONDITIONAL_CACHE_PREFIX + url, JSON.stringify({ etag, data }));
+    } catch (error) {
+        console.warn('[setConditionalEntry] Could not store response for revalidation:', error);
+    }
+}
+
+/**
+ * Clears every stored GET response (e.g. on logout, as responses are per user).
+ */
+function clearConditionalCache() {
+    try {
+        Object.keys(sessionStorage)
+            .filter(key => key.startsWith(CONDITIONAL_CACHE_PREFIX))
+            .forEach(key => sessionStorage.removeItem(key));
+    } catch (error) {
+        console.warn('[clearConditionalCache] Could not clear stored responses:', error);
+    }
 }
 
 /**
@@ -69,6 +114,13 @@ async function apiRequest(endpoint, options = {}, includeAuth = true) {
         }
     }
 
+    // GETs send the ETag of the stored response; a 304 means it is still current
+    const isGet = !options.method || options.method.toUpperCase() === 'GET';
+    const conditionalEntry = isGet ? getConditionalEntry(url) : null;
+    if (conditionalEntry && !headers['If-None-Match']) {
+        headers['If-None-Match'] = conditionalEntry.etag;
+    }
+
     const fetchOptions = {
         ...options,
         headers: headers,
@@ -76,6 +128,9 @@ async function apiRequest(endpoint, options = {}, includeAuth = true) {
 
     try {
         const response = await fetch(url, fetchOptions);
+        if (response.status === 304 && conditionalEntry) {
+            return conditionalEntry.data;
+        }
         let data;
         
         // Try to parse JSON response, but handle cases where it might not be valid JSON
@@ -97,7 +152,11 @@ async function apiRequest(endpoint, options = {}, includeAuth = true) {
             error.data = data;
             throw error;
         }
-    
+
+        const etag = isGet ? response.headers.get('ETag') : null;
+        if (etag) {
+            setConditionalEntry(url, etag, data);
+        }
         return data;
     } catch (error) {
         // Enhance error handling
@@ -110,4 +169,87 @@ async function apiRequest(endpoint, options = {}, includeAuth = true) {
         }
         throw error;
     }
-}
\ No newline at end of file
+}
+/**
+ * Makes an authenticated request to a Server-Sent Events endpoint and reads the stream.
+ * Uses fetch + ReadableStream rather than EventSource so the request can be a POST with the Authorization header.
+ * @param {string} endpoint - The API endpoint path (e.g., '/cases/reports/1/ai-feedback/stream/').
+ * @param {function} onEvent - Called with (eventName, data) for each event; data is the parsed JSON payload.
+ * @param {object} options - Fetch options (method, body, headers, etc.).
+ * @returns {Promise<void>} Resolves when the server closes the stream.
+ * @throws {Error} Throws an error with status/data for non-OK HTTP responses, like apiRequest.
+ */
+async function apiStream(endpoint, onEvent, options = {}) {
+    const url = endpoint.startsWith('/') ? `${APP_CONFIG.api.getBaseUrl()}${endpoint}` : `${APP_CONFIG.api.getBaseUrl()}/${endpoint}`;
+    const headers = {
+        'Content-Type': 'application/json',
+        'Accept': 'text/event-stream',
+        ...options.headers,
+    };
+
+    const tokens = getAuthTokens();
+    if (tokens && tokens.accessToken) {
+        headers['Authorization'] = `Bearer ${tokens.accessToken}`;
+    }
+
+    const response = await fetch(url, { ...options, headers: headers });
+
+    if (!response.ok) {
+        // Errors are rendered as a single SSE 'error' event (or JSON from older servers)
+        const text = await response.text();
+        let data = {};
+        const dataLine = text.split('\n').find(line => line.startsWith('data:'));
+        try {
+            data = JSON.parse(dataLine ? dataLine.slice(5) : text);
+        } catch (jsonError) {
+            data = { detail: 'Invalid response format from server' };
+        }
+        const error = new Error(data?.error || data?.detail || `HTTP error ${response.status}`);
+        error.status = response.status;
+        error.data = data;
+        error.retryAfter = response.headers.get('Retry-After');
+        throw error;
+    }
+
+    if (!response.body || !response.body.getReader) {
+        const error = new Error('Streaming responses are not supported by this browser');
+        error.streamingUnsupported = true;
+        throw error;
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    const dispatchEvent = (rawEvent) => {
+        let eventName = 'message';
+        const dataLines = [];
+        rawEvent.split('\n').forEach(line => {
+            if (line.startsWith('event:')) {
+                eventName = line.slice(6).trim();
+            } else if (line.startsWith('data:')) {
+                dataLines.push(line.slice(5).trim());
+            }
+        });
+        if (!dataLines.length) return;
+        try {
+            onEvent(eventName, JSON.parse(dataLines.join('\n')));
+        } catch (parseError) {
+            console.warn(`Could not parse '${eventName}' event from ${endpoint}:`, parseError);
+        }
+    };
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        let separatorIndex;
+        while ((separatorIndex = buffer.indexOf('\n\n')) !== -1) {
+            dispatchEvent(buffer.slice(0, separatorIndex));
+            buffer = buffer.slice(separatorIndex + 2);
+        }
+    }
+    if (buffer.trim()) {
+        dispatchEvent(buffer);
+    }
+}
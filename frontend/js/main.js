@@ -380,9 +380,11 @@ function renderCaseTable(tableBody, cases) {
 }
 
 // Render pagination controls
+// Cursor pages (the default for the case list) carry no count, only next/previous links
 function renderPagination(container, totalItems, nextUrl, previousUrl) {
     container.innerHTML = '';
-    if (!totalItems || totalItems <= 10) return;
+    const hasCount = typeof totalItems === 'number';
+    if (hasCount ? totalItems <= 10 : (!nextUrl && !previousUrl)) return;
 
     const prevDisabled = !previousUrl ? 'disabled' : '';
     const nextDisabled = !nextUrl ? 'disabled' : '';
@@ -399,7 +401,7 @@ function renderPagination(container, totalItems, nextUrl, previousUrl) {
 
     // Calculate current page
     const pageInfo = container.querySelector('.page-info');
-    if (pageInfo) {
+    if (pageInfo && hasCount) {
         const pageSize = 10;
         let currentPage = 1, totalPages = Math.ceil(totalItems / pageSize);
         
@@ -851,6 +853,14 @@ async function displayUserSubmittedReport(userReportData, targetContainerElement
             }
         }
         
+        // Programmatic pre-analysis stored at submission; shown on sections until AI feedback exists
+        const preAnalysisSectionMap = new Map();
+        if (userReportData.pre_analysis && Array.isArray(userReportData.pre_analysis.section_comparisons)) {
+            userReportData.pre_analysis.section_comparisons.forEach(sc => {
+                preAnalysisSectionMap.set(sc.master_template_section_id, sc);
+            });
+        }
+
         userReportData.structured_content.forEach(section => {
             const sectionName = section.section_name || `Section ID ${section.master_template_section_id || 'N/A'}`;
             const sectionContent = section.content || '<em>No content submitted for this section.</em>';
@@ -860,6 +870,11 @@ async function displayUserSubmittedReport(userReportData, targetContainerElement
             let aiComment = 'AI feedback not yet generated';
             let aiSeverity = 'Pending';
 
+            const preAnalysisForSection = preAnalysisSectionMap.get(section.master_template_section_id);
+            if (preAnalysisForSection) {
+                aiComment = formatPreAnalysisComment(preAnalysisForSection);
+            }
+
             // Check for AI feedback for this specific section
             const aiFeedbackForSection = aiSectionFeedbackMap.get(sectionName);
             if (aiFeedbackForSection) {
@@ -967,6 +982,21 @@ async function displayUserSubmittedReport(userReportData, targetContainerElement
     }
 }
 
+// Summarizes a section's programmatic pre-analysis (similarity and missing key concepts) for the section tooltip
+function formatPreAnalysisComment(sectionComparison) {
+    const parts = ['AI feedback not yet generated.'];
+    if (typeof sectionComparison.similarity_score === 'number') {
+        parts.push(`Similarity to expert report: ${Math.round(sectionComparison.similarity_score * 100)}%.`);
+    }
+    if (Array.isArray(sectionComparison.missing_key_concepts) && sectionComparison.missing_key_concepts.length > 0) {
+        parts.push(`Key concepts possibly missing: ${sectionComparison.missing_key_concepts.join(', ')}.`);
+    } else if (sectionComparison.key_concepts_status === 'All Addressed') {
+        parts.push('All key concepts addressed.');
+    }
+    // Used inside a double-quoted HTML attribute
+    return parts.join(' ').replace(/"/g, '&quot;');
+}
+
 // Function to request AI feedback for a report
 async function requestAIFeedback(reportId) {
     // Correctly identify the target elements based on renderCaseDetail HTML structure
@@ -987,7 +1017,13 @@ async function requestAIFeedback(reportId) {
         feedbackBtn.disabled = true;
         feedbackBtn.textContent = "Checking...";
 
-        const savedResponse = await apiRequest(`/cases/reports/${reportId}/ai-feedback/`, { method: 'GET' });
+        let savedResponse = await apiRequest(`/cases/reports/${reportId}/ai-feedback/`, { method: 'GET' });
+
+        // A feedback job is still queued or running for this report: wait for it to finish
+        if (savedResponse && isAIFeedbackJobPending(savedResponse)) {
+            aiFeedbackDisplayArea.innerHTML = '<p class="ai-feedback-loading-message" style="text-align:center; padding:20px;">AI feedback is being generated, this may take a moment...</p>';
+            savedResponse = await waitForAIFeedbackJob(reportId);
+        }
         
         console.log("Saved AI feedback retrieved:", savedResponse);
         if (savedResponse) {
@@ -1064,7 +1100,27 @@ async function generateNewAIReportFeedback(reportId) {
 
     try {
         console.log(`Generating new AI feedback for report ID: ${reportId}`);
-        const response = await apiRequest(`/cases/reports/${reportId}/ai-feedback/`, { method: 'POST' });
+        let response = null;
+        try {
+            response = await streamAIFeedback(reportId, aiFeedbackDisplayArea);
+        } catch (streamError) {
+            // Fall back to the queued path only if the stream could not start (rate limited, AI service
+            // temporarily unavailable, unsupported browser); the queued job waits until the service recovers
+            if (!(streamError.status === 429 || streamError.status === 503 || streamError.streamingUnsupported)) {
+                throw streamError;
+            }
+            console.warn("AI feedback stream unavailable, queueing generation instead:", streamError);
+        }
+
+        if (!response) {
+            // The POST either returns cached feedback right away or queues a job (202 Accepted) that we poll
+            const postResponse = await apiRequest(`/cases/reports/${reportId}/ai-feedback/`, { method: 'POST' });
+            response = postResponse;
+            if (isAIFeedbackJobPending(postResponse)) {
+                console.log("AI feedback job queued:", postResponse);
+                response = await waitForAIFeedbackJob(reportId);
+            }
+        }
         
         if (response) {
             console.log("New AI feedback generated and saved:", response);
@@ -1110,6 +1166,67 @@ async function generateNewAIReportFeedback(reportId) {
 }
 
 
+// Streams AI feedback generation, showing the text as it arrives. Resolves with the saved feedback content.
+async function streamAIFeedback(reportId, targetElement) {
+    let streamedText = '';
+    let finalContent = null;
+    let streamError = null;
+    let pendingJob = null;
+    const progressElement = document.createElement('pre');
+    progressElement.className = 'ai-feedback-streaming-text';
+    progressElement.style.whiteSpace = 'pre-wrap';
+
+    await apiStream(`/cases/reports/${reportId}/ai-feedback/stream/`, (eventName, data) => {
+        if (eventName === 'status') {
+            targetElement.innerHTML = '';
+            targetElement.appendChild(progressElement);
+            if (data.state === 'waiting') {
+                // Another request (e.g. a second click) is already generating feedback for this report
+                progressElement.textContent = 'AI feedback for this report is already being generated, waiting for it...';
+            }
+        } else if (eventName === 'queued') {
+            pendingJob = data;
+        } else if (eventName === 'delta') {
+            streamedText += data.text;
+            progressElement.textContent = streamedText;
+        } else if (eventName === 'complete') {
+            finalContent = data;
+        } else if (eventName === 'error') {
+            streamError = new Error(data.error || 'AI feedback generation failed.');
+        }
+    }, { method: 'POST' });
+
+    if (streamError) {
+        throw streamError;
+    }
+    if (!finalContent && pendingJob) {
+        // The other request is still running: poll for its result like a queued job
+        return waitForAIFeedbackJob(reportId);
+    }
+    if (!finalContent) {
+        throw new Error('The AI feedback stream ended before the feedback was complete. Please try again.');
+    }
+    return finalContent;
+}
+
+// Returns true if an ai-feedback response describes a queued or running job rather than finished feedback
+function isAIFeedbackJobPending(response) {
+    return Boolean(response && response.job_id && (response.status === 'queued' || response.status === 'running'));
+}
+
+// Polls the ai-feedback endpoint until the pending feedback job has finished, then returns the saved feedback
+async function waitForAIFeedbackJob(reportId, pollIntervalMs = 2000, timeoutMs = 180000) {
+    const startedAt = Date.now();
+    while (Date.now() - startedAt < timeoutMs) {
+        await new Promise(resolve => setTimeout(resolve, pollIntervalMs));
+        const response = await apiRequest(`/cases/reports/${reportId}/ai-feedback/`, { method: 'GET' });
+        if (!isAIFeedbackJobPending(response)) {
+            return response;
+        }
+    }
+    throw new Error('AI feedback is taking longer than expected. Please check back in a few minutes.');
+}
+
 // Helper to display AI response content into the AI Feedback tab
 function displayAIResponseBody(response, targetElement) {
     let feedbackHtml = '';